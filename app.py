@@ -1,3 +1,4 @@
+import atexit
 import hmac
 import logging
 import os
@@ -8,6 +9,8 @@ from functools import wraps
 from urllib.parse import parse_qs, urlencode, urlparse, urlunparse
 from xml.sax.saxutils import escape as xml_escape
 
+import click
+import psycopg2
 import redis
 import sentry_sdk
 from dotenv import load_dotenv
@@ -15,7 +18,9 @@ from flask import (
     Flask,
     Response,
     flash,
+    has_app_context,
     jsonify,
+    make_response,
     redirect,
     render_template,
     request,
@@ -34,12 +39,40 @@ from flask_wtf.csrf import CSRFProtect
 from posthog import Posthog
 from werkzeug.security import check_password_hash
 
-from articles import Article
-from database import close_db, get_database_url, init_db
+from articles import (
+    Article,
+    backfill_derived_fields,
+    decode_cursor,
+    encode_cursor,
+)
+from cdn import EdgeSessionInterface, edge_cached, purger_from_env
+from compression import default_min_size
+from conditional import (
+    BUILD_ID,
+    NO_VALIDATORS,
+    add_validators,
+    conditional,
+    make_etag,
+    not_modified,
+)
+from database import (
+    close_db,
+    get_database_url,
+    get_db,
+    get_pool_stats,
+    init_db,
+    pooled_connection,
+)
 from images import ImageStore
+from migrations import apply_migrations, get_schema_version, latest_version
+from page_cache import SITE_TAG, LocalLRU, TaggedCache
 from projects import Project
-from search import get_search_service
+from related import DEFAULT_TOP_K, refresh_related
+from search import SearchCache, SuggestIndex, get_search_service
 from settings import HOMEPAGE_DEFAULTS, get_homepage_settings, save_homepage_settings
+from static_export import DEFAULT_OUTPUT_DIR, EXPORT_ENVIRON_KEY, export_site
+from view_buffer import RateLimiter, RedisViewBuffer, ViewBuffer
+from view_partitions import maintain_partitions
 
 load_dotenv()
 
@@ -67,6 +100,7 @@ else:
     logger.info("SENTRY_DSN not set. Sentry error tracking disabled.")
 
 app = Flask(__name__)
+app.session_interface = EdgeSessionInterface()
 csrf = CSRFProtect(app)
 login_manager = LoginManager(app)
 login_manager.login_view = "login"
@@ -150,11 +184,66 @@ def setup_cache():
 cache = setup_cache()
 
 
+# Shared Redis client for page-cache locks and the view queue, when Redis is
+# the cache backend.
+redis_client = (
+    redis.from_url(app.config["CACHE_REDIS_URL"])
+    if app.config.get("CACHE_TYPE") == "RedisCache"
+    else None
+)
+
+# In-process L1 in front of Redis only: SimpleCache already lives in process
+# and NullCache (development) must keep caching off.
+page_cache = TaggedCache(
+    cache,
+    l1=LocalLRU(
+        max_entries=int(os.getenv("PAGE_CACHE_L1_ENTRIES", "256")),
+        ttl=float(os.getenv("PAGE_CACHE_L1_TTL", "30")),
+    )
+    if app.config.get("CACHE_TYPE") == "RedisCache"
+    else None,
+    tag_ttl=float(os.getenv("PAGE_CACHE_TAG_TTL", "2")),
+    # Redis locks make single-flight recomputation hold across instances.
+    lock_client=redis_client,
+    compress_min=default_min_size(),
+)
+
+cdn_purger = purger_from_env()
+
+# Surrogate tags: entries register the ones they depend on, and admin actions
+# purge by tag (see page_cache.py).
+BLOG_LIST_TAG = "list:blog"
+PROJECTS_TAG = "projects"
+SETTINGS_TAG = "settings"
+
+
+def article_tag(slug):
+    return f"article:{slug}"
+
+
+# Search results are listings: anything that purges list:blog (publish, edit,
+# delete) is a new content version for them too.
+get_search_service().cache = SearchCache(page_cache, tags=(BLOG_LIST_TAG,))
+
+
 # Cache decorator with error handling
-def safe_cached(timeout=360, **kwargs):
+def safe_cached(timeout=360, tags=(), query_string=False, grace=0, compress_min=None):
+    """Cache a view by tags. After `timeout` seconds the page is served stale
+    for up to `grace` more seconds while one worker re-renders it. Bodies of
+    at least `compress_min` bytes (default COMPRESS_MIN_BYTES) are stored
+    precompressed. Signed-in requests bypass the cache: templates render
+    admin links for them, which must never be replayed to visitors."""
+
     def decorator(f):
         # Build the cached view once at decoration time, not per request.
-        cached_func = cache.cached(timeout=timeout, **kwargs)(f)
+        cached_func = page_cache.cached(
+            timeout=timeout,
+            tags=tags,
+            query_string=query_string,
+            grace=grace,
+            compress_min=compress_min,
+            unless=lambda: current_user.is_authenticated,
+        )(f)
 
         @wraps(f)
         def wrapper(*args, **kwargs_inner):
@@ -172,37 +261,61 @@ def safe_cached(timeout=360, **kwargs):
     return decorator
 
 
-# Cache key management functions
-def get_cache_key(view_name, **kwargs):
-    """Generate cache key for a given view function that matches Flask-Caching's format"""
-    # Flask-Caching uses 'view//' + endpoint format for @cache.cached
-    if kwargs:
-        # For parameterized routes like article(slug='test')
-        params = "&".join([f"{k}={v}" for k, v in sorted(kwargs.items())])
-        return f"view//{view_name}?{params}"
-    return f"view//{view_name}"
-
-
-def invalidate_view_cache(view_name, **kwargs):
-    """Safely invalidate cache for a specific view"""
-    try:
-        cache_key = get_cache_key(view_name, **kwargs)
-        cache.delete(cache_key)
-        logger.info(f"Cache invalidated for {view_name} with key: {cache_key}")
-    except Exception as e:
-        logger.warning(f"Failed to invalidate cache for {view_name}: {e}")
-
+def purge_tags(*tags) -> bool:
+    """Purge `tags` from the page cache and, by surrogate key, from the CDN."""
+    purged = page_cache.purge(*tags)
+    cdn_purger.purge(tags)
+    return purged
+
+
+def purge_article_caches(slug):
+    """Drop the cached article and every listing that may show it, and
+    re-index it in this instance's fallback search index and lexicon."""
+    purge_tags(article_tag(slug), BLOG_LIST_TAG)
+    service = get_search_service()
+    if service.fallback is not None:
+        service.fallback.refresh_article(slug)
+    if service.lexicon is not None:
+        service.lexicon.add_article(slug)
+
+
+def _flush_views(views):
+    rows = [v.as_row() for v in views]
+    # A flush triggered by a request reuses its connection: borrowing a second
+    # one could wait on a small pool that the request already drains.
+    if has_app_context():
+        return Article.record_views(rows, conn=get_db())
+    # The flush thread and the exit hook run outside any app context.
+    with pooled_connection() as conn:
+        if conn is None:
+            return False
+        return Article.record_views(rows, conn=conn)
+
+
+# Serverless instances can be frozen or killed without atexit running, so
+# views are only batched where the queue outlives the process (Redis). An
+# in-process batch is opt-in via VIEW_BUFFER_MAX_PENDING for long-running hosts.
+if redis_client is not None:
+    view_buffer = RedisViewBuffer(
+        redis_client,
+        _flush_views,
+        max_pending=int(os.getenv("VIEW_BUFFER_MAX_PENDING", "20")),
+        flush_interval=float(os.getenv("VIEW_BUFFER_FLUSH_SECONDS", "5")),
+    )
+else:
+    view_buffer = ViewBuffer(
+        _flush_views,
+        max_pending=int(os.getenv("VIEW_BUFFER_MAX_PENDING", "1")),
+        flush_interval=float(os.getenv("VIEW_BUFFER_FLUSH_SECONDS", "5")),
+    )
+atexit.register(view_buffer.close)
 
-def invalidate_multiple_caches(*view_specs):
-    """Invalidate multiple view caches"""
-    for view_spec in view_specs:
-        if isinstance(view_spec, str):
-            invalidate_view_cache(view_spec)
-        elif isinstance(view_spec, tuple):
-            view_name, kwargs = view_spec
-            invalidate_view_cache(view_name, **kwargs)
-        else:
-            logger.warning(f"Invalid view spec: {view_spec}")
+# View beacons from edge-cached article pages, per client IP per minute.
+view_beacon_limiter = RateLimiter(
+    int(os.getenv("VIEW_BEACON_PER_MINUTE", "30")),
+    client=redis_client,
+    prefix="views:beacon",
+)
 
 
 app.secret_key = os.getenv("FLASK_SECRET_KEY")
@@ -238,26 +351,40 @@ app.config.update(
     SESSION_COOKIE_SECURE=not _IS_DEV,
 )
 
-_db_init_lock = threading.Lock()
-_db_initialized = False
+_schema_check_lock = threading.Lock()
+_schema_checked = False
 
 
 @app.before_request
-def _ensure_db_initialized():
-    # Defer schema init off the import path (Vercel cold starts) and run it at
-    # most once per process, on the first request that actually needs the DB.
-    global _db_initialized
-    if _db_initialized:
+def _check_schema_version():
+    # Migrations run at deploy time (`flask migrate`), not on a user's request.
+    # Each process does one cheap version lookup so a missed deploy step is
+    # visible in the logs; dev servers apply pending steps for convenience.
+    global _schema_checked
+    if _schema_checked:
         return
-    with _db_init_lock:
-        if _db_initialized:
+    with _schema_check_lock:
+        if _schema_checked:
             return
-        try:
-            if not init_db():
-                logger.error("Error initializing database during first request")
-        except Exception as e:
-            logger.error(f"Exception during db initialization: {e}")
-        _db_initialized = True
+        conn = get_db()
+        if conn is None:
+            # Transient: check again on the next request.
+            return
+        current = get_schema_version(conn)
+        if current is None:
+            return
+        _schema_checked = True
+        if current >= latest_version():
+            return
+        if _IS_DEV or os.getenv("DB_AUTO_MIGRATE") == "1":
+            init_db()
+        else:
+            logger.error(
+                "Database schema is at version %s but the code expects %s. "
+                "Run `flask --app app migrate`.",
+                current,
+                latest_version(),
+            )
 
 
 @app.teardown_appcontext
@@ -279,27 +406,168 @@ def check_admin(username, password):
     return user_ok and pass_ok
 
 
-def get_blog_articles(page: int, per_page: int, query: str):
-    clean_query = (query or "").strip()
-    if not clean_query:
-        articles, total_articles = Article.get_published_articles_paginated(
-            page=page, per_page=per_page
+PUBLISHED_COUNT_CACHE_KEY = "published_article_count"
+
+
+def get_published_count():
+    """Published-article total for listing UIs, cached instead of a COUNT(*)
+    per page; tagged list:blog, so publish/edit/delete purge it."""
+    total = page_cache.get(PUBLISHED_COUNT_CACHE_KEY, (BLOG_LIST_TAG,))
+    if total is None:
+        total = Article.get_published_count()
+        page_cache.set(PUBLISHED_COUNT_CACHE_KEY, total, (BLOG_LIST_TAG,), timeout=600)
+    return total
+
+
+PUBLISHED_SLUGS_CACHE_KEY = "published_article_slugs"
+# Unknown slugs are remembered briefly when the published set is unavailable
+# (or for admins, who may open drafts).
+MISSING_ARTICLE_TTL = 60
+
+
+def get_published_slugs():
+    """frozenset of published slugs, cached under list:blog so publish, edit
+    and delete rebuild it; None if it could not be loaded."""
+    slugs = page_cache.get(PUBLISHED_SLUGS_CACHE_KEY, (BLOG_LIST_TAG,))
+    if slugs is None:
+        loaded = Article.get_published_slugs()
+        if loaded is None:
+            return None
+        slugs = frozenset(loaded)
+        page_cache.set(PUBLISHED_SLUGS_CACHE_KEY, slugs, (BLOG_LIST_TAG,), timeout=600)
+    return slugs
+
+
+LISTING_VERSION_CACHE_KEY = "published_listing_version"
+
+
+def get_listing_version():
+    """(latest updated_at, count) of published articles, cached under
+    list:blog; None if it could not be read."""
+    version = page_cache.get(LISTING_VERSION_CACHE_KEY, (BLOG_LIST_TAG,))
+    if version is None:
+        version = Article.get_listing_version()
+        if version is None:
+            return None
+        page_cache.set(
+            LISTING_VERSION_CACHE_KEY, version, (BLOG_LIST_TAG,), timeout=600
         )
-        return articles, total_articles, False
+    return version
 
-    search_service = get_search_service()
-    search_result = search_service.search_published_slugs(
-        query=clean_query, page=page, per_page=per_page
-    )
 
-    if search_result.degraded:
+def listing_validators(**_view_args):
+    """ETag / Last-Modified for pages built from the published listing (blog,
+    feeds, sitemaps, /api/articles): one cached lookup, no article reads.
+    Search pages not answered by Postgres opt out, see search_response()."""
+    version = get_listing_version()
+    if version is None:
+        return None
+    last_modified, count = version
+    etag = make_etag(request.path, request.query_string, count, last_modified)
+    return etag, last_modified
+
+
+def search_response(response, query, search_source):
+    """`response` for a listing; search results from the fallback index, or
+    the plain listing shown when search failed, get no validators. The
+    listing version does not change when Postgres recovers, so a client
+    revalidating them would otherwise keep the degraded page."""
+    response = make_response(response)
+    if query and search_source != "postgres":
+        response.headers[NO_VALIDATORS] = "1"
+    return response
+
+
+SUGGEST_LIMIT = 8
+SUGGEST_TERM_LIMIT = 5
+SUGGEST_INDEX_TTL = 3600
+
+# (list:blog tag versions, built at, SuggestIndex): kept in this process only.
+# Pickling the whole index through Redis on every keystroke costs more than
+# rebuilding it; the shared cache only tells instances when it is stale.
+_suggest_index = None
+_suggest_index_lock = threading.Lock()
+
+
+def get_suggest_index():
+    """Typeahead index of published titles and words, rebuilt after publish,
+    edit or delete (a new list:blog tag version) or after SUGGEST_INDEX_TTL;
+    None if titles could not be loaded. While tag versions are unreadable,
+    only the TTL applies."""
+    global _suggest_index
+    versions = page_cache.tag_versions((BLOG_LIST_TAG,))
+    current = _suggest_index
+    if (
+        current is not None
+        and (versions is None or current[0] == versions)
+        and time.monotonic() - current[1] < SUGGEST_INDEX_TTL
+    ):
+        return current[2]
+    with _suggest_index_lock:
+        if _suggest_index is not current:
+            return _suggest_index[2]
+        titles = Article.get_published_titles()
+        if titles is None:
+            return current[2] if current is not None else None
+        index = SuggestIndex(titles, Article.get_lexicon() or ())
+        _suggest_index = (versions, time.monotonic(), index)
+        return index
+
+
+def get_blog_articles(page: int, per_page: int, query: str, cursor: str | None = None):
+    """Return (articles, total, degraded, next_cursor, search_source) for the
+    blog listing; search_source is the SearchResult.source of a successful
+    search, else None.
+
+    Listings use keyset pagination: pass the previous response's next_cursor.
+    The legacy `page` number still works; page > 1 without a cursor falls back
+    to LIMIT/OFFSET. Search results are rank-ordered, so their cursor simply
+    carries the next page number.
+    """
+    clean_query = (query or "").strip()
+    position = decode_cursor(cursor)
+    if position and "p" in position:
+        try:
+            page = max(1, int(position["p"]))
+        except (TypeError, ValueError):
+            page = 1
+        position = None
+
+    if clean_query:
+        search_service = get_search_service()
+        search_result = search_service.search_published(
+            query=clean_query, page=page, per_page=per_page
+        )
+        if not search_result.degraded:
+            articles = search_result.articles
+            next_cursor = (
+                encode_cursor({"p": page + 1})
+                if page * per_page < search_result.total
+                else None
+            )
+            return (
+                articles,
+                search_result.total,
+                False,
+                next_cursor,
+                search_result.source,
+            )
+        degraded = True
+    else:
+        degraded = False
+
+    if position is None and page > 1:
         articles, total_articles = Article.get_published_articles_paginated(
             page=page, per_page=per_page
         )
-        return articles, total_articles, True
+        has_more = page * per_page < total_articles
+        next_cursor = articles[-1].keyset_cursor() if has_more and articles else None
+        return articles, total_articles, degraded, next_cursor, None
 
-    articles = Article.get_published_articles_by_slugs(search_result.slugs)
-    return articles, search_result.total, False
+    articles, next_cursor = Article.get_published_articles_after(
+        cursor=cursor if position else None, per_page=per_page
+    )
+    return articles, get_published_count(), degraded, next_cursor, None
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -340,7 +608,8 @@ def logout():
 
 
 @app.route("/")
-@safe_cached(timeout=300)
+@edge_cached(300, 600, keys=(PROJECTS_TAG, SETTINGS_TAG))
+@safe_cached(timeout=300, tags=(PROJECTS_TAG, SETTINGS_TAG), grace=600)
 def index():
     settings = get_homepage_settings()
 
@@ -374,14 +643,34 @@ def favicon():
     return redirect(url_for("static", filename="favicon.ico"))
 
 
+def get_search_snippets(query, articles, search_source):
+    """Highlighted matching passages for one page of search results.
+
+    Only for results Postgres answered: after a fallback to the in-memory
+    index, ts_headline would hit the database that just failed.
+    """
+    if not query or search_source != "postgres" or not articles:
+        return {}
+    return get_search_service().highlight(query, [a.slug for a in articles])
+
+
+def get_did_you_mean(query, total, degraded):
+    """A corrected query when a search found nothing."""
+    if not query or degraded or total:
+        return None
+    return get_search_service().did_you_mean(query)
+
+
 @app.route("/rss")
 @app.route("/feed")
 @app.route("/rss.xml")
 @app.route("/feed.xml")
-@safe_cached(timeout=600)
+@edge_cached(600, 3600, keys=(BLOG_LIST_TAG,))
+@conditional(listing_validators)
+@safe_cached(timeout=600, tags=(BLOG_LIST_TAG,), grace=3600, compress_min=512)
 def rss_feed():
     """Generate RSS feed for blog articles"""
-    articles = Article.get_published_articles()[:20]  # Latest 20 articles
+    articles = Article.get_published_articles(limit=20)
 
     # Build RSS XML
     rss_items = []
@@ -427,36 +716,50 @@ def rss_feed():
 
 
 @app.route("/projects")
-@safe_cached(timeout=180)
+@edge_cached(180, 600, keys=(PROJECTS_TAG,))
+@safe_cached(timeout=180, tags=(PROJECTS_TAG,), grace=600)
 def projects():
     visible_projects = Project.get_visible_projects()
     return render_template("projects.html", projects=visible_projects)
 
 
 @app.route("/blog")
-@safe_cached(timeout=180, query_string=True)
+@edge_cached(180, 300, keys=(BLOG_LIST_TAG,))
+@conditional(listing_validators)
+@safe_cached(timeout=180, tags=(BLOG_LIST_TAG,), query_string=True, grace=300)
 def blog():
     start = time.time()
     per_page = BLOG_ARTICLES_PER_PAGE
     query = (request.args.get("q") or "").strip()
-    articles, total_articles, search_degraded = get_blog_articles(
-        page=1, per_page=per_page, query=query
-    )
+    (
+        articles,
+        total_articles,
+        search_degraded,
+        next_cursor,
+        search_source,
+    ) = get_blog_articles(page=1, per_page=per_page, query=query)
+    snippets = get_search_snippets(query, articles, search_source)
+    did_you_mean = get_did_you_mean(query, total_articles, search_degraded)
     duration = time.time() - start
     logger.info(f"/blog route executed in {duration:.3f} seconds")
-    has_more = per_page < total_articles
-    return render_template(
+    page = render_template(
         "blog.html",
         articles=articles,
         per_page=per_page,
         total_articles=total_articles,
-        has_more=has_more,
+        has_more=next_cursor is not None,
+        next_cursor=next_cursor,
         query=query,
         search_degraded=search_degraded,
+        snippets=snippets,
+        did_you_mean=did_you_mean,
     )
+    return search_response(page, query, search_source)
 
 
 @app.route("/api/articles")
+@edge_cached(60, 300, keys=(BLOG_LIST_TAG,))
+@conditional(listing_validators)
 def api_articles():
     try:
         page = int(request.args.get("page", 1))
@@ -470,12 +773,17 @@ def api_articles():
 
     per_page = max(1, min(per_page, 24))
     query = (request.args.get("q") or "").strip()
-
-    articles, total_articles, search_degraded = get_blog_articles(
-        page=page, per_page=per_page, query=query
-    )
-
-    has_more = page * per_page < total_articles
+    cursor = request.args.get("cursor") or None
+
+    (
+        articles,
+        total_articles,
+        search_degraded,
+        next_cursor,
+        search_source,
+    ) = get_blog_articles(page=page, per_page=per_page, query=query, cursor=cursor)
+    snippets = get_search_snippets(query, articles, search_source)
+    did_you_mean = get_did_you_mean(query, total_articles, search_degraded)
 
     article_payload = []
     for article in articles:
@@ -491,16 +799,50 @@ def api_articles():
                 "summary": article.get_summary(200),
                 "published_on": formatted_date,
                 "reading_time": article.get_reading_time(),
+                # HTML: escaped text with matches wrapped in <mark>.
+                "snippet": snippets.get(article.slug),
             }
         )
 
-    return jsonify(
+    payload = jsonify(
         {
             "articles": article_payload,
-            "has_more": has_more,
+            "has_more": next_cursor is not None,
+            "next_cursor": next_cursor,
             "total": total_articles,
             "query": query,
             "search_degraded": search_degraded,
+            "did_you_mean": did_you_mean,
+        }
+    )
+    return search_response(payload, query, search_source)
+
+
+@app.route("/api/search/suggest")
+@edge_cached(300, 600, keys=(BLOG_LIST_TAG,))
+@safe_cached(timeout=300, tags=(BLOG_LIST_TAG,), query_string=True)
+def search_suggest():
+    """As-you-type title suggestions and query completions from the in-memory
+    prefix index; never runs the full-text query."""
+    prefix = (request.args.get("q") or "")[:100]
+    index = get_suggest_index()
+    suggestions = index.suggest(prefix, limit=SUGGEST_LIMIT) if index else []
+    completions = index.complete(prefix, limit=SUGGEST_TERM_LIMIT) if index else []
+    return jsonify(
+        {
+            "query": prefix,
+            "suggestions": [
+                {
+                    "title": s.title,
+                    "slug": s.slug,
+                    "url": url_for("article", slug=s.slug),
+                }
+                for s in suggestions
+            ],
+            "completions": [
+                {"query": query, "url": url_for("blog", q=query)}
+                for query in completions
+            ],
         }
     )
 
@@ -510,25 +852,65 @@ def cv_redirect():
     return redirect(url_for("static", filename="media/Olloyor_s_resume.pdf"))
 
 
-@app.route("/blog/<slug>")
-def article(slug: str):
-    # Always track the view (not cached) - this should always run
-    ip_address = request.environ.get(
+def _client_ip():
+    return request.environ.get(
         "HTTP_X_FORWARDED_FOR", request.environ.get("REMOTE_ADDR", "unknown")
     )
+
+
+def _record_view(slug):
+    """Queue a view of `slug`; views are written in batches."""
+    ip_address = _client_ip()
     user_agent = request.environ.get("HTTP_USER_AGENT", "")
     referrer_host = _referrer_host(request.referrer)
-    Article.track_view(slug, ip_address, user_agent, referrer_host)
+    view_buffer.record(slug, ip_address, user_agent, referrer_host)
+
+
+def _current_view_count(slug):
+    # Stored count plus views still waiting in the buffer
+    return Article.get_view_count(slug) + view_buffer.pending_count(slug)
+
+
+def get_related_articles(slug):
+    """Precomputed "read next" listings, cached with the article; also
+    tagged list:blog, since a related article may be edited or unpublished."""
+    key = f"related_{slug}"
+    tags = (article_tag(slug), BLOG_LIST_TAG)
+    related = page_cache.get(key, tags)
+    if related is None:
+        related = Article.get_related(slug)
+        page_cache.set(key, related, tags, timeout=3600)
+    return related
+
+
+@app.route("/blog/<slug>")
+@edge_cached(300, 3600, keys=lambda slug: (article_tag(slug),))
+def article(slug: str):
+    # Reject unknown slugs (bots probing URLs) before any database work.
+    published = get_published_slugs()
+    if (
+        published is not None
+        and slug not in published
+        and not current_user.is_authenticated
+    ):
+        return render_template("404.html"), 404
 
     # Get article with caching (article content rarely changes)
+    tags = (article_tag(slug),)
     cache_key = f"article_content_{slug}"
-    article = cache.get(cache_key)
+    article = page_cache.get(cache_key, tags)
 
     if article is None:
+        if page_cache.get(f"missing_article_{slug}", tags):
+            return render_template("404.html"), 404
         article = Article.get_by_slug(slug)
         if article:
             # Cache article for 10 minutes (content doesn't change often)
-            cache.set(cache_key, article, timeout=600)
+            page_cache.set(cache_key, article, tags, timeout=600)
+        else:
+            page_cache.set(
+                f"missing_article_{slug}", True, tags, timeout=MISSING_ARTICLE_TTL
+            )
 
     if not article:
         return render_template("404.html"), 404
@@ -537,30 +919,92 @@ def article(slug: str):
     if not article.is_published and not current_user.is_authenticated:
         return render_template("404.html"), 404
 
-    # Get current view count (real-time, not cached) - this should always be fresh
-    view_count = Article.get_view_count(slug)
+    exporting = bool(request.environ.get(EXPORT_ENVIRON_KEY))
+    # Every request that reaches Flask is a view (crawlers and no-JS readers
+    # included); only published articles count. Exported pages and pages
+    # served from the edge cache never get here: their script POSTs
+    # /api/views/<slug>, which the per-visitor-per-day dedupe makes harmless
+    # after this.
+    if article.is_published and not exporting:
+        _record_view(slug)
+    if exporting or not current_user.is_authenticated:
+        # The anonymous page is shared, so its script fills in the count.
+        view_count = None
+    else:
+        view_count = _current_view_count(slug)
+
+    related = get_related_articles(slug)
+
+    # The page only changes with the article, its count, its "read next"
+    # links, the deploy, or whether the admin controls are shown; answer
+    # revalidations before rendering.
+    etag = make_etag(
+        slug,
+        article.date_updated,
+        article.is_published,
+        view_count,
+        tuple(r.slug for r in related),
+        current_user.is_authenticated,
+    )
+    last_modified = article.date_updated or article.date_published
+    early = not_modified(etag, last_modified)
+    if early is not None:
+        return early
 
     # Extract first image for social media sharing
     first_image = article.get_first_image(request.url_root.rstrip("/"))
 
-    return render_template(
-        "article.html", article=article, view_count=view_count, first_image=first_image
+    response = make_response(
+        render_template(
+            "article.html",
+            article=article,
+            view_count=view_count,
+            first_image=first_image,
+            related=related,
+        )
     )
+    return add_validators(response, etag, last_modified)
+
+
+@app.route("/api/views/<slug>", methods=["POST"])
+@csrf.exempt
+def article_views(slug: str):
+    """Record a view of a published article and return its count.
+
+    The beacon of pre-rendered and edge-cached article pages, which carry no
+    session or CSRF token. Cross-site posts are refused and each client IP is
+    rate-limited; a repeat view from the same visitor on the same day is not
+    counted again.
+    """
+    if request.headers.get("Sec-Fetch-Site") not in (None, "same-origin"):
+        return jsonify({"error": "forbidden"}), 403
+    if not view_beacon_limiter.allow(_client_ip()):
+        return jsonify({"error": "too many requests"}), 429
+    published = get_published_slugs()
+    if published is not None and slug not in published:
+        return jsonify({"error": "not found"}), 404
+    _record_view(slug)
+    response = jsonify({"slug": slug, "views": _current_view_count(slug)})
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 
 @app.route("/talks")
+@edge_cached(3600, 86400)
 def talks():
     return render_template("talks.html")
 
 
 @app.route("/about")
-@safe_cached(timeout=600)
+@edge_cached(600, 3600)
+@safe_cached(timeout=600, grace=3600)
 def about():
     return render_template("about.html")
 
 
 @app.route("/for-llms")
-@safe_cached(timeout=600)
+@edge_cached(600, 3600)
+@safe_cached(timeout=600, grace=3600)
 def for_llms():
     return render_template("for_llms.html")
 
@@ -624,15 +1068,7 @@ def publish():
             return redirect(url_for("publish"))
 
         # remove the article from cache
-        try:
-            invalidate_multiple_caches("blog", ("article", {"slug": new_article.slug}))
-            # Also clear the article content cache for new articles
-            cache.delete(f"article_content_{new_article.slug}")
-            logger.info(
-                f"Blog and article caches invalidated after publishing new article: {new_article.slug}"
-            )
-        except Exception as e:
-            logger.warning(f"Cache invalidation failed: {e}")
+        purge_article_caches(new_article.slug)
 
         if is_published:
             flash("Article published successfully!", "success")
@@ -672,16 +1108,8 @@ def edit_article(slug):
             else:
                 flash("Draft article updated successfully.", "info")
 
-            try:
-                # Invalidate both blog list and specific article caches
-                invalidate_multiple_caches("blog", ("article", {"slug": article.slug}))
-                # Also clear the article content cache
-                cache.delete(f"article_content_{article.slug}")
-                logger.info(
-                    f"Blog and article caches invalidated after updating article: {article.slug}"
-                )
-            except Exception as e:
-                logger.warning(f"Cache invalidation failed: {e}")
+            # Invalidate both blog list and specific article caches
+            purge_article_caches(article.slug)
             return redirect(url_for("article", slug=article.slug))
         else:
             flash("Error updating article", "error")
@@ -698,15 +1126,7 @@ def delete_article(slug):
     if success:
         flash("Article deleted successfully.", "success")
 
-        try:
-            invalidate_multiple_caches("blog", ("article", {"slug": slug}))
-            # Also clear the article content cache
-            cache.delete(f"article_content_{slug}")
-            logger.info(
-                f"Blog and article caches invalidated after deleting article: {slug}"
-            )
-        except Exception as e:
-            logger.warning(f"Cache invalidation failed: {e}")
+        purge_article_caches(slug)
     else:
         logger.error("Error deleting article from the database.")
         flash("Error deleting article from the database.", "error")
@@ -823,13 +1243,19 @@ def upload_image():
 
 @app.route("/media/img/<image_id>")
 def serve_image(image_id):
+    # Ids are content hashes, so the id itself is a strong validator and a
+    # revalidation never reads the blob.
+    early = not_modified(image_id)
+    if early is not None:
+        early.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return early
     result = ImageStore.get(image_id)
     if result is None:
         return "Not found", 404
     data, content_type = result
     response = app.response_class(data, mimetype=content_type)
     response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
-    return response
+    return add_validators(response, image_id)
 
 
 @app.route("/admin/projects")
@@ -898,12 +1324,8 @@ def add_project():
         if Project.save_project(new_project):
             flash("Project added successfully!", "success")
 
-            try:
-                # Invalidate cache for projects pages
-                invalidate_multiple_caches("projects", "index")
-                logger.info("Project caches invalidated after adding new project")
-            except Exception as e:
-                logger.warning(f"Cache invalidation failed: {e}")
+            # Invalidate cache for projects pages
+            purge_tags(PROJECTS_TAG)
             return redirect(url_for("admin_projects"))
         else:
             flash("Error adding project.", "error")
@@ -942,12 +1364,8 @@ def edit_project(project_id):
 
         if Project.update_project(project_to_edit):
             flash("Project updated successfully!", "success")
-            try:
-                # Invalidate cache for projects pages
-                invalidate_multiple_caches("projects", "index")
-                logger.info("Project caches invalidated after updating project")
-            except Exception as e:
-                logger.warning(f"Cache invalidation failed: {e}")
+            # Invalidate cache for projects pages
+            purge_tags(PROJECTS_TAG)
             return redirect(url_for("admin_projects"))
         else:
             flash("Error updating project.", "error")
@@ -964,25 +1382,14 @@ def edit_project(project_id):
 @login_required
 def delete_project(project_id):
     if Project.delete_project_by_id(project_id):
-        try:
-            # Invalidate cache for projects pages
-            invalidate_multiple_caches("projects", "index")
-            logger.info("Project caches invalidated after deleting project")
-        except Exception as e:
-            logger.warning(f"Cache invalidation failed: {e}")
+        # Invalidate cache for projects pages
+        purge_tags(PROJECTS_TAG)
         flash("Project deleted successfully!", "success")
     else:
         flash("Error deleting project.", "error")
     return redirect(url_for("admin_projects"))
 
 
-def _invalidate_project_caches():
-    try:
-        invalidate_multiple_caches("projects", "index")
-    except Exception as e:
-        logger.warning(f"Cache invalidation failed: {e}")
-
-
 @app.route("/admin/projects/<int:project_id>/toggle-visibility", methods=["POST"])
 @login_required
 def toggle_project_visibility(project_id):
@@ -990,7 +1397,7 @@ def toggle_project_visibility(project_id):
     if not project:
         flash("Project not found.", "error")
     elif Project.set_flag(project_id, "is_visible", not project.is_visible):
-        _invalidate_project_caches()
+        purge_tags(PROJECTS_TAG)
         state = "hidden from" if project.is_visible else "visible on"
         flash(f"'{project.title}' is now {state} the site.", "success")
     else:
@@ -1005,7 +1412,7 @@ def toggle_project_featured(project_id):
     if not project:
         flash("Project not found.", "error")
     elif Project.set_flag(project_id, "is_featured", not project.is_featured):
-        _invalidate_project_caches()
+        purge_tags(PROJECTS_TAG)
         state = "unfeatured" if project.is_featured else "featured on the homepage"
         flash(f"'{project.title}' {state}.", "success")
     else:
@@ -1019,7 +1426,7 @@ def move_project(project_id, direction):
     if direction not in ("up", "down"):
         flash("Invalid direction.", "error")
     elif Project.move(project_id, direction):
-        _invalidate_project_caches()
+        purge_tags(PROJECTS_TAG)
     else:
         flash("Error reordering projects.", "error")
     return redirect(url_for("admin_projects"))
@@ -1042,7 +1449,7 @@ def admin_homepage():
             "show_projects": request.form.get("show_projects") == "on",
         }
         if save_homepage_settings(values):
-            _invalidate_project_caches()  # also clears the cached index view
+            purge_tags(SETTINGS_TAG)
             flash("Homepage settings saved.", "success")
         else:
             flash("Error saving homepage settings.", "error")
@@ -1090,10 +1497,38 @@ def health_check():
         status["cache_status"] = f"error: {str(e)}"
         logger.warning(f"Cache health check failed: {e}")
 
+    status["page_cache"] = page_cache.stats()
+    status["search_cache"] = get_search_service().cache.stats()
+    status["db_pool"] = get_pool_stats()
+    status["view_buffer"] = view_buffer.stats()
+
     return status
 
 
+@app.route("/cron/maintain-partitions")
+def cron_maintain_partitions():
+    """Daily partition maintenance, called by Vercel Cron (see vercel.json)
+    with `Authorization: Bearer $CRON_SECRET`."""
+    secret = os.getenv("CRON_SECRET")
+    supplied = request.headers.get("Authorization", "")
+    if not secret or not hmac.compare_digest(supplied, f"Bearer {secret}"):
+        return jsonify({"error": "forbidden"}), 403
+    # Also drains views queued since the last request that flushed.
+    view_buffer.flush()
+    conn = get_db()
+    if conn is None:
+        return jsonify({"error": "database unavailable"}), 503
+    try:
+        created, dropped = maintain_partitions(conn)
+    except psycopg2.Error as e:
+        logger.error(f"Scheduled partition maintenance failed: {e}")
+        return jsonify({"error": "maintenance failed"}), 500
+    return jsonify({"created": created, "dropped": dropped})
+
+
 @app.route("/sitemap.xml")
+@edge_cached(3600, 86400, keys=(BLOG_LIST_TAG,))
+@conditional(listing_validators)
 def sitemap():
     """Generate sitemap for SEO"""
     try:
@@ -1112,6 +1547,8 @@ def sitemap():
 
 
 @app.route("/image-sitemap.xml")
+@edge_cached(3600, 86400, keys=(BLOG_LIST_TAG,))
+@conditional(listing_validators)
 def image_sitemap():
     """Generate image sitemap for better image SEO"""
     try:
@@ -1130,6 +1567,7 @@ def image_sitemap():
 
 
 @app.route("/robots.txt")
+@edge_cached(86400, 86400)
 def robots():
     """Generate robots.txt for SEO"""
     robots_content = f"""User-agent: *
@@ -1155,7 +1593,8 @@ Disallow: /publish
 def clear_cache():
     """Clear all caches for testing"""
     try:
-        cache.clear()
+        if not purge_tags(SITE_TAG):
+            raise RuntimeError("cache backend unavailable")
         flash("Cache has been cleared!", "success")
         logger.info("All caches cleared manually")
     except Exception as e:
@@ -1189,7 +1628,7 @@ def auto_save():
 
             if Article.update_article(article):
                 # Clear cache
-                cache.delete(f"article_content_{article.slug}")
+                purge_article_caches(article.slug)
                 return {
                     "status": "success",
                     "message": "Auto-saved",
@@ -1234,6 +1673,138 @@ def auto_save():
         return {"status": "error", "message": "Server error"}, 500
 
 
+@app.cli.command("migrate")
+@click.option("--status", is_flag=True, help="Show the schema version and exit.")
+def migrate_command(status):
+    """Apply pending schema migrations. Run once per deploy."""
+    conn = get_db()
+    if conn is None:
+        raise click.ClickException("Could not connect to the database.")
+    current = get_schema_version(conn)
+    if current is None:
+        raise click.ClickException("Could not read the schema version.")
+    click.echo(f"Schema version: {current} (latest: {latest_version()})")
+    if status:
+        return
+    applied = apply_migrations(conn)
+    if applied:
+        click.echo(f"Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        click.echo("Nothing to apply.")
+
+
+@app.cli.command("backfill-articles")
+@click.option(
+    "--all", "recompute_all", is_flag=True, help="Recompute every row, not just NULLs."
+)
+def backfill_articles_command(recompute_all):
+    """Fill stored word count, summary, first image and plain text."""
+    conn = get_db()
+    if conn is None:
+        raise click.ClickException("Could not connect to the database.")
+    updated = backfill_derived_fields(conn.cursor(), only_missing=not recompute_all)
+    if updated:
+        # Summaries and reading times show on every listing and article page.
+        purge_tags(SITE_TAG)
+    click.echo(f"Updated {updated} article(s).")
+
+
+@app.cli.command("reconcile-view-counts")
+@click.option(
+    "--days",
+    default=7,
+    show_default=True,
+    help="Days of the daily rollup to rebuild (0 = none).",
+)
+@click.option("--all-days", is_flag=True, help="Rebuild the whole daily rollup.")
+def reconcile_view_counts_command(days, all_days):
+    """Rebuild view counters and the daily rollup from raw article_views rows."""
+    if get_db() is None:
+        raise click.ClickException("Could not connect to the database.")
+    result = Article.reconcile_view_counts(rollup_days=None if all_days else days)
+    if result is None:
+        raise click.ClickException("Reconcile failed; see the log for details.")
+    corrected, removed, rollup_rows = result
+    click.echo(f"Corrected {corrected} counter(s), removed {removed} orphan(s).")
+    click.echo(f"Rebuilt {rollup_rows} daily rollup row(s).")
+
+
+@app.cli.command("maintain-partitions")
+@click.option(
+    "--months-ahead",
+    default=3,
+    show_default=True,
+    help="Create monthly article_views partitions this far ahead.",
+)
+@click.option(
+    "--retain-months",
+    type=int,
+    default=None,
+    help="Raw months to keep (default: VIEW_RETENTION_MONTHS; 0 = keep all).",
+)
+@click.option("--dry-run", is_flag=True, help="Only report what would change.")
+def maintain_partitions_command(months_ahead, retain_months, dry_run):
+    """Create upcoming view partitions and compact ones past retention."""
+    conn = get_db()
+    if conn is None:
+        raise click.ClickException("Could not connect to the database.")
+    try:
+        created, dropped = maintain_partitions(
+            conn, months_ahead, keep_months=retain_months, dry_run=dry_run
+        )
+    except psycopg2.Error as e:
+        raise click.ClickException(f"Partition maintenance failed: {e}") from e
+    prefix = "Would " if dry_run else ""
+    click.echo(f"{prefix}create: {', '.join(created) or 'none'}")
+    click.echo(f"{prefix}compact and drop: {', '.join(dropped) or 'none'}")
+
+
+@app.cli.command("refresh-related")
+@click.option(
+    "--top-k",
+    default=DEFAULT_TOP_K,
+    show_default=True,
+    help="Related articles stored per article.",
+)
+@click.option("--full", is_flag=True, help="Recompute every list, not just changes.")
+def refresh_related_command(top_k, full):
+    """Recompute "read next" lists for changed articles."""
+    conn = get_db()
+    if conn is None:
+        raise click.ClickException("Could not connect to the database.")
+    try:
+        refreshed = refresh_related(conn, k=top_k, full=full)
+    except psycopg2.Error as e:
+        raise click.ClickException(f"Refreshing related articles failed: {e}") from e
+    if refreshed:
+        purge_tags(*(article_tag(slug) for slug in refreshed))
+    click.echo(f"Refreshed related articles for {len(refreshed)} article(s).")
+
+
+@app.cli.command("export-static")
+@click.option(
+    "--out",
+    default=DEFAULT_OUTPUT_DIR,
+    show_default=True,
+    help="Directory to write the static site into.",
+)
+@click.option("--force", is_flag=True, help="Re-render every article page.")
+def export_static_command(out, force):
+    """Pre-render public pages; only changed articles are re-rendered."""
+    if get_db() is None:
+        raise click.ClickException("Could not connect to the database.")
+    versions = Article.get_published_versions()
+    if versions is None:
+        raise click.ClickException("Could not list published articles.")
+    result = export_site(app, versions, out_dir=out, build_id=BUILD_ID, force=force)
+    click.echo(
+        f"Wrote {len(result['written'])}, unchanged {len(result['unchanged'])}, "
+        f"removed {len(result['removed'])} page(s)."
+    )
+    if result["failed"]:
+        raise click.ClickException(f"Failed to render: {', '.join(result['failed'])}")
+
+
 if __name__ == "__main__":
     debug_mode = (
         os.getenv("FLASK_ENV") == "development" or os.getenv("FLASK_DEBUG") == "1"
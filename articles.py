@@ -1,8 +1,14 @@
+import base64
+import binascii
+import html
+import json
 import logging
 import re
-from datetime import datetime
+from datetime import UTC, date, datetime, timedelta
+from functools import lru_cache
 
 import psycopg2
+from psycopg2.extras import execute_values
 from slugify import slugify
 
 from database import get_db
@@ -10,8 +16,12 @@ from database import get_db
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=4096)
 def _classify_device(user_agent):
-    """Rough device class from a User-Agent string (no external dependency)."""
+    """Rough device class from a User-Agent string (no external dependency).
+
+    Memoized: a handful of browser builds account for most traffic.
+    """
     ua = (user_agent or "").lower()
     if not ua:
         return "Desktop"
@@ -24,66 +34,401 @@ def _classify_device(user_agent):
     return "Desktop"
 
 
+# article_views_daily stores the device class as a SMALLINT index into this
+# tuple. Append only: existing codes are persisted.
+DEVICE_CLASSES = ("Desktop", "Mobile", "Tablet", "Bot")
+
+
+def _device_code(user_agent):
+    return DEVICE_CLASSES.index(_classify_device(user_agent))
+
+
+def encode_cursor(values: dict) -> str:
+    """Opaque, URL-safe pagination token for `values` (JSON-serializable)."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Inverse of encode_cursor; None for a missing or malformed token."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    return values if isinstance(values, dict) else None
+
+
+# Listing summaries are cut from this much leading plain text; enough for the
+# longest get_summary() length any caller asks for (RSS uses 300).
+SUMMARY_MAX_LENGTH = 300
+WORDS_PER_MINUTE = 225
+
+
+def _summarize(clean_text, length):
+    if len(clean_text) <= length:
+        return clean_text
+    return clean_text[:length].rsplit(" ", 1)[0] + "..."
+
+
+def _reading_time(word_count):
+    # Average reading speed is 200-250 words per minute; use the middle ground.
+    return max(1, round(word_count / WORDS_PER_MINUTE))
+
+
+def _absolute_image_url(img_src, base_url):
+    if not img_src:
+        return None
+    if img_src.startswith("/"):
+        return f"{base_url}{img_src}"
+    elif img_src.startswith("http"):
+        return img_src
+    # Relative path without leading slash
+    return f"{base_url}/{img_src}"
+
+
+def _keyset_cursor(date_published, article_id):
+    if article_id is None or date_published is None:
+        return None
+    return encode_cursor({"d": date_published.isoformat(), "i": article_id})
+
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_IMG_RE = re.compile(r'<img[^>]+src=["\']([^"\']+)["\'][^>]*>', re.IGNORECASE)
+
+
+def derive_fields(content):
+    """Values derived from an article body, computed once when it is saved.
+
+    summary/word_count keep the historical tag stripping (tags removed, not
+    spaced) so stored values match what get_summary() always returned;
+    body_text is the whitespace-normalized plain text used by search code.
+    """
+    content = content or ""
+    clean_text = _TAG_RE.sub("", content)
+    word_count = len(clean_text.split())
+    image = _IMG_RE.search(content)
+    return {
+        "word_count": word_count,
+        "reading_time": _reading_time(word_count),
+        "summary": clean_text[: SUMMARY_MAX_LENGTH + 1],
+        "first_image_url": image.group(1) if image else None,
+        "body_text": " ".join(html.unescape(_TAG_RE.sub(" ", content)).split()),
+    }
+
+
+def backfill_derived_fields(cur, only_missing=True, batch_size=100):
+    """Recompute stored derived fields from content; returns rows updated."""
+    where = "WHERE word_count IS NULL" if only_missing else ""
+    last_id = 0
+    updated = 0
+    while True:
+        cur.execute(
+            f"""
+            SELECT id, content FROM articles
+            {where} {"AND" if where else "WHERE"} id > %s
+            ORDER BY id LIMIT %s
+            """,  # noqa: S608 — fixed fragments, values bound
+            (last_id, batch_size),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return updated
+        for article_id, content in rows:
+            fields = derive_fields(content)
+            cur.execute(
+                """
+                UPDATE articles
+                SET word_count = %s, reading_time = %s, summary = %s,
+                    first_image_url = %s, body_text = %s
+                WHERE id = %s
+                """,
+                (
+                    fields["word_count"],
+                    fields["reading_time"],
+                    fields["summary"],
+                    fields["first_image_url"],
+                    fields["body_text"],
+                    article_id,
+                ),
+            )
+            updated += 1
+        last_id = rows[-1][0]
+
+
+# Raw views, the daily rollup and the per-article counters are written in one
+# statement. Only rows that survive ON CONFLICT DO NOTHING (first view per
+# visitor per day) come back from RETURNING, so the aggregates never count a
+# view the raw table rejected.
+_RECORD_VIEWS_SQL = """
+    WITH new_views AS (
+        INSERT INTO article_views
+            (article_slug, ip_address, user_agent, referrer_host,
+             view_date, viewed_at, device_class)
+        VALUES %s
+        ON CONFLICT (article_slug, ip_address, view_date) DO NOTHING
+        RETURNING article_slug, view_date, device_class, referrer_host
+    ),
+    daily AS (
+        INSERT INTO article_views_daily AS d
+            (day, article_slug, device_class, referrer_host, views)
+        SELECT view_date, article_slug, device_class,
+               COALESCE(referrer_host, ''), COUNT(*)
+        FROM new_views
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT (day, article_slug, device_class, referrer_host)
+            DO UPDATE SET views = d.views + EXCLUDED.views
+    )
+    INSERT INTO article_view_counts AS c
+        (article_slug, total_views, month_start, monthly_views, updated_at)
+    SELECT article_slug, COUNT(*), DATE_TRUNC('month', CURRENT_DATE)::date,
+           COUNT(*), CURRENT_TIMESTAMP
+    FROM new_views
+    GROUP BY article_slug
+    ON CONFLICT (article_slug) DO UPDATE SET
+        total_views = c.total_views + EXCLUDED.total_views,
+        monthly_views = CASE
+            WHEN c.month_start = EXCLUDED.month_start
+                THEN c.monthly_views + EXCLUDED.monthly_views
+            ELSE EXCLUDED.monthly_views
+        END,
+        month_start = EXCLUDED.month_start,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# Recompute every counter from the daily rollup, touching only rows that
+# drifted. The rollup, not article_views, is the source of truth: raw
+# partitions past the retention window are dropped (see view_partitions.py).
+RECONCILE_VIEW_COUNTS_SQL = """
+    INSERT INTO article_view_counts AS c
+        (article_slug, total_views, month_start, monthly_views, updated_at)
+    SELECT article_slug, SUM(views), DATE_TRUNC('month', CURRENT_DATE)::date,
+           COALESCE(
+               SUM(views) FILTER (WHERE day >= DATE_TRUNC('month', CURRENT_DATE)),
+               0
+           ),
+           CURRENT_TIMESTAMP
+    FROM article_views_daily
+    GROUP BY article_slug
+    ON CONFLICT (article_slug) DO UPDATE SET
+        total_views = EXCLUDED.total_views,
+        month_start = EXCLUDED.month_start,
+        monthly_views = EXCLUDED.monthly_views,
+        updated_at = EXCLUDED.updated_at
+    WHERE (c.total_views, c.month_start, c.monthly_views)
+        IS DISTINCT FROM
+        (EXCLUDED.total_views, EXCLUDED.month_start, EXCLUDED.monthly_views)
+"""
+
+
+def rebuild_views_daily(cur, since=None, until=None):
+    """Recompute article_views_daily from article_views for days in
+    [since, until). Days older than the oldest raw view are left alone, since
+    their raw rows may already have been compacted away. Returns the number
+    of rollup rows written."""
+    view_where, daily_where, params = [], [], []
+    if since is None:
+        daily_where.append("day >= (SELECT MIN(view_date) FROM article_views)")
+    else:
+        view_where.append("view_date >= %s")
+        daily_where.append("day >= %s")
+        params.append(since)
+    if until is not None:
+        view_where.append("view_date < %s")
+        daily_where.append("day < %s")
+        params.append(until)
+    view_sql = ("WHERE " + " AND ".join(view_where)) if view_where else ""
+    daily_sql = "WHERE " + " AND ".join(daily_where)
+    cur.execute(
+        f"DELETE FROM article_views_daily {daily_sql}",  # noqa: S608 — fixed fragments, values bound
+        params,
+    )
+    cur.execute(
+        f"""
+        INSERT INTO article_views_daily
+            (day, article_slug, device_class, referrer_host, views)
+        SELECT view_date, article_slug, device_class,
+               COALESCE(referrer_host, ''), COUNT(*)
+        FROM article_views
+        {view_sql}
+        GROUP BY 1, 2, 3, 4
+        """,  # noqa: S608 — fixed fragments, values bound
+        params,
+    )
+    return cur.rowcount
+
+
+# Explicit projection for list/feed pages: stored derived columns only, so
+# article bodies never cross the wire.
+_LISTING_COLUMNS = """
+    id, title, slug, date_published, is_published,
+    summary, word_count, reading_time, first_image_url
+"""
+
+# Full article row, in Article._from_row order. body_text is left out: only
+# search code reads it, straight from SQL.
+_ARTICLE_COLUMNS = """
+    id, title, content, date_published, is_published, slug,
+    word_count, reading_time, summary, first_image_url, updated_at
+"""
+
+
+class ArticleListing:
+    """Metadata-only view of a published article for lists, feeds and sitemaps.
+
+    Exposes the same read helpers templates use on Article (get_summary,
+    get_reading_time, get_first_image, ...) without ever loading `content`.
+    """
+
+    __slots__ = (
+        "id",
+        "title",
+        "slug",
+        "date_published",
+        "is_published",
+        "summary",
+        "word_count",
+        "reading_time",
+        "first_image",
+    )
+
+    def __init__(
+        self,
+        title,
+        slug,
+        date_published,
+        summary="",
+        word_count=0,
+        reading_time=None,
+        first_image=None,
+        is_published=True,
+        id=None,
+    ):
+        self.id = id
+        self.title = title
+        self.slug = slug
+        self.date_published = date_published
+        self.is_published = is_published
+        # Leading plain text, at most SUMMARY_MAX_LENGTH + 1 chars.
+        self.summary = summary or ""
+        self.word_count = word_count or 0
+        self.reading_time = reading_time or _reading_time(self.word_count)
+        self.first_image = first_image
+
+    @classmethod
+    def _from_row(cls, row):
+        return cls(
+            id=row[0],
+            title=row[1],
+            slug=row[2],
+            date_published=row[3],
+            is_published=row[4],
+            summary=row[5],
+            word_count=row[6],
+            reading_time=row[7],
+            first_image=row[8],
+        )
+
+    def get_summary(self, length=160):
+        return _summarize(self.summary, min(length, SUMMARY_MAX_LENGTH))
+
+    def get_reading_time(self):
+        return self.reading_time
+
+    def get_word_count(self):
+        return self.word_count
+
+    def get_first_image(self, base_url="https://ollayor.uz"):
+        return _absolute_image_url(self.first_image, base_url)
+
+    def keyset_cursor(self):
+        return _keyset_cursor(self.date_published, self.id)
+
+
 class Article:
-    def __init__(self, title, content, date_published, is_published=False, slug=None):
+    def __init__(
+        self, title, content, date_published, is_published=False, slug=None, id=None
+    ):
+        self.id = id
         self.title = title
-        self.content = content
+        self.content = content  # also resets the derived-field cache
         if isinstance(date_published, str):
             self.date_published = datetime.fromisoformat(date_published)
         else:
             self.date_published = date_published
         self.is_published = is_published
         self.slug = slug or slugify(title)
+        self.date_updated = None  # set from the DB; None for unsaved articles
 
-    def get_reading_time(self):
-        """Calculate estimated reading time based on word count"""
-        # Remove HTML tags and count words
-        clean_text = re.sub(r"<[^>]+>", "", self.content)
-        word_count = len(clean_text.split())
+    @property
+    def content(self):
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self._derived = None
+
+    @classmethod
+    def _from_row(cls, row):
+        """Build from an _ARTICLE_COLUMNS row, reusing stored derived fields."""
+        article = cls(row[1], row[2], row[3], row[4], row[5], id=row[0])
+        article.date_updated = row[10]
+        if row[6] is not None:
+            article._derived = {
+                "word_count": row[6],
+                "reading_time": row[7],
+                "summary": row[8] or "",
+                "first_image_url": row[9],
+            }
+        return article
+
+    def _fields(self):
+        # Stored values when loaded from the DB; otherwise derived once per
+        # content change (e.g. an article being edited).
+        if self._derived is None:
+            self._derived = derive_fields(self.content)
+        return self._derived
 
-        # Average reading speed is 200-250 words per minute
-        # We'll use 225 as a middle ground
-        reading_time = max(1, round(word_count / 225))
-        return reading_time
+    def get_reading_time(self):
+        """Estimated reading time in minutes (stored at save time)"""
+        return self._fields()["reading_time"]
 
     def get_word_count(self):
         """Get word count for the article"""
-        clean_text = re.sub(r"<[^>]+>", "", self.content)
-        return len(clean_text.split())
+        return self._fields()["word_count"]
 
     def get_summary(self, length=160):
         """Get a summary of the article for meta descriptions"""
-        clean_text = re.sub(r"<[^>]+>", "", self.content)
-        if len(clean_text) <= length:
-            return clean_text
-        return clean_text[:length].rsplit(" ", 1)[0] + "..."
+        if length > SUMMARY_MAX_LENGTH:
+            return _summarize(_TAG_RE.sub("", self.content or ""), length)
+        return _summarize(self._fields()["summary"], length)
 
     def get_first_image(self, base_url="https://ollayor.uz"):
-        """Extract the first image from article content for social media sharing"""
-        if not self.content:
-            return None
-
-        # Look for img tags in the content
-        img_pattern = r'<img[^>]+src=["\']([^"\']+)["\'][^>]*>'
-        matches = re.findall(img_pattern, self.content, re.IGNORECASE)
-
-        if matches:
-            img_src = matches[0]
-            # Convert relative URLs to absolute URLs
-            if img_src.startswith("/"):
-                return f"{base_url}{img_src}"
-            elif img_src.startswith("http"):
-                return img_src
-            else:
-                # Relative path without leading slash
-                return f"{base_url}/{img_src}"
-
-        return None
+        """First image in the article, as an absolute URL for social sharing"""
+        return _absolute_image_url(self._fields()["first_image_url"], base_url)
 
     @staticmethod
     def track_view(slug, ip_address, user_agent=None, referrer_host=None):
         """Track a view for an article with duplicate prevention"""
-        conn = get_db()
+        now = datetime.now(UTC).replace(tzinfo=None)
+        return Article.record_views(
+            [(slug, ip_address, user_agent, referrer_host, now.date(), now)]
+        )
+
+    @staticmethod
+    def record_views(rows, conn=None):
+        """Insert views in one multi-row statement.
+
+        rows: (slug, ip_address, user_agent, referrer_host, view_date, viewed_at)
+        tuples. `conn` lets background flushes pass a pool connection, since
+        they run outside the request's app context.
+        """
+        if not rows:
+            return True
+        conn = conn or get_db()
         if conn is None:
             logger.error("Failed to connect to the database.")
             return False
@@ -93,24 +438,21 @@ class Article:
             # Dedupe per visitor per day so daily/monthly aggregates stay meaningful
             # while page refreshes on the same day are not double-counted. Keep the
             # referrer from the first visit of the day (DO NOTHING on conflict).
-            cur.execute(
-                """
-                INSERT INTO article_views
-                    (article_slug, ip_address, user_agent, referrer_host, view_date)
-                VALUES (%s, %s, %s, %s, CURRENT_DATE)
-                ON CONFLICT (article_slug, ip_address, view_date) DO NOTHING
-            """,
-                (slug, ip_address, user_agent, referrer_host),
+            execute_values(
+                cur,
+                _RECORD_VIEWS_SQL,
+                [tuple(row) + (_device_code(row[2]),) for row in rows],
+                page_size=500,
             )
             conn.commit()
             return True
         except psycopg2.Error as e:
-            logger.error(f"Error tracking article view: {e}")
+            logger.error(f"Error tracking article views: {e}")
             return False
 
     @staticmethod
     def get_view_count(slug):
-        """Get the total view count for an article"""
+        """Total views for an article, read from the materialized counter."""
         conn = get_db()
         if conn is None:
             logger.error("Failed to connect to the database.")
@@ -119,7 +461,8 @@ class Article:
         try:
             cur = conn.cursor()
             cur.execute(
-                "SELECT COUNT(*) FROM article_views WHERE article_slug = %s", (slug,)
+                "SELECT total_views FROM article_view_counts WHERE article_slug = %s",
+                (slug,),
             )
             result = cur.fetchone()
             return result[0] if result else 0
@@ -129,9 +472,61 @@ class Article:
         finally:
             pass
 
+    @staticmethod
+    def reconcile_view_counts(rollup_days=7):
+        """Rebuild the last `rollup_days` days of article_views_daily (0 =
+        none, None = every day still in article_views) from the raw rows, then
+        recompute article_view_counts from the rollup.
+
+        Returns (corrected, removed, rollup_rows), or None on error. Writers
+        are blocked for the duration so no increment lands between the
+        recount and the upsert.
+        """
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return None
+
+        was_autocommit = conn.autocommit
+        conn.autocommit = False
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "LOCK TABLE article_view_counts, article_views_daily "
+                "IN SHARE ROW EXCLUSIVE MODE"
+            )
+            rollup_rows = 0
+            if rollup_days is None:
+                rollup_rows = rebuild_views_daily(cur)
+            elif rollup_days > 0:
+                since = date.today() - timedelta(days=rollup_days - 1)
+                rollup_rows = rebuild_views_daily(cur, since=since)
+            cur.execute(RECONCILE_VIEW_COUNTS_SQL)
+            corrected = cur.rowcount
+            cur.execute("""
+                DELETE FROM article_view_counts c
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM article_views_daily d
+                    WHERE d.article_slug = c.article_slug
+                )
+            """)
+            removed = cur.rowcount
+            conn.commit()
+            return corrected, removed, rollup_rows
+        except psycopg2.Error as e:
+            conn.rollback()
+            logger.error(f"Error reconciling view counts: {e}")
+            return None
+        finally:
+            conn.autocommit = was_autocommit
+
     @staticmethod
     def get_view_totals():
-        """Return aggregate view counts for the current day, month, and all-time across all articles."""
+        """Return aggregate view counts for the current day, month, and all-time across all articles.
+
+        Reads article_views_daily, so the cost follows the number of days of
+        history rather than the number of views.
+        """
         conn = get_db()
         if conn is None:
             logger.error("Failed to connect to the database.")
@@ -142,10 +537,10 @@ class Article:
             cur.execute(
                 """
                 SELECT
-                    COUNT(*) FILTER (WHERE viewed_at >= DATE_TRUNC('day', CURRENT_TIMESTAMP)) AS daily_views,
-                    COUNT(*) FILTER (WHERE viewed_at >= DATE_TRUNC('month', CURRENT_TIMESTAMP)) AS monthly_views,
-                    COUNT(*) AS total_views
-                FROM article_views
+                    SUM(views) FILTER (WHERE day = CURRENT_DATE) AS daily_views,
+                    SUM(views) FILTER (WHERE day >= DATE_TRUNC('month', CURRENT_DATE)) AS monthly_views,
+                    SUM(views) AS total_views
+                FROM article_views_daily
                 """
             )
             result = cur.fetchone()
@@ -172,15 +567,23 @@ class Article:
 
         try:
             cur = conn.cursor()
+            fields = derive_fields(article.content)
             cur.execute(
-                """INSERT INTO articles (title, content, date_published, is_published, slug)
-                VALUES (%s, %s, %s, %s, %s)""",
+                """INSERT INTO articles
+                    (title, content, date_published, is_published, slug,
+                     word_count, reading_time, summary, first_image_url, body_text)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)""",
                 (
                     article.title,
                     article.content,
                     article.date_published.isoformat(),
                     article.is_published,
                     article.slug,
+                    fields["word_count"],
+                    fields["reading_time"],
+                    fields["summary"],
+                    fields["first_image_url"],
+                    fields["body_text"],
                 ),
             )
             conn.commit()
@@ -201,14 +604,23 @@ class Article:
             return False
         try:
             cur = conn.cursor()
+            fields = derive_fields(article.content)
             cur.execute(
-                """UPDATE articles SET title = %s, content = %s, date_published = %s, is_published = %s
+                """UPDATE articles SET title = %s, content = %s, date_published = %s,
+                    is_published = %s, word_count = %s, reading_time = %s,
+                    summary = %s, first_image_url = %s, body_text = %s,
+                    updated_at = CURRENT_TIMESTAMP
                     WHERE slug = %s""",
                 (
                     article.title,
                     article.content,
                     article.date_published.isoformat(),
                     article.is_published,
+                    fields["word_count"],
+                    fields["reading_time"],
+                    fields["summary"],
+                    fields["first_image_url"],
+                    fields["body_text"],
                     article.slug,
                 ),
             )
@@ -231,7 +643,9 @@ class Article:
         try:
             cur = conn.cursor()
             # Sort by date_published in descending order directly in the query
-            cur.execute("SELECT * FROM articles ORDER BY date_published DESC")
+            cur.execute(
+                f"SELECT {_ARTICLE_COLUMNS} FROM articles ORDER BY date_published DESC"  # noqa: S608
+            )
             articles_data = cur.fetchall()
         except psycopg2.Error as e:
             logger.error(f"Error fetching all articles: {e}")
@@ -240,11 +654,8 @@ class Article:
             # Connection is now managed by app context, no close here
             pass
 
-        article_objects = [
-            Article(row[1], row[2], row[3], row[4], row[5]) for row in articles_data
-        ]
         # The sorting is now done by the database, so the Python sort is removed.
-        return article_objects
+        return [Article._from_row(row) for row in articles_data]
 
     @staticmethod
     def get_views_by_day(days=30):
@@ -265,11 +676,11 @@ class Article:
                     INTERVAL '1 day'
                 ) AS d(day)
                 LEFT JOIN (
-                    SELECT view_date, COUNT(*) AS views
-                    FROM article_views
-                    WHERE view_date >= CURRENT_DATE - (%s - 1) * INTERVAL '1 day'
-                    GROUP BY view_date
-                ) v ON v.view_date = d.day::date
+                    SELECT day, SUM(views) AS views
+                    FROM article_views_daily
+                    WHERE day >= CURRENT_DATE - (%s - 1) * INTERVAL '1 day'
+                    GROUP BY day
+                ) v ON v.day = d.day::date
                 ORDER BY d.day
                 """,
                 (days, days),
@@ -291,14 +702,15 @@ class Article:
             cur = conn.cursor()
             cur.execute(
                 """
-                SELECT a.title, a.slug, COUNT(v.id) AS total_views,
-                       COUNT(v.id) FILTER (
-                           WHERE v.viewed_at >= DATE_TRUNC('month', CURRENT_TIMESTAMP)
-                       ) AS monthly_views
-                FROM articles a
-                JOIN article_views v ON v.article_slug = a.slug
-                GROUP BY a.title, a.slug
-                ORDER BY total_views DESC
+                SELECT a.title, a.slug, c.total_views,
+                       CASE
+                           WHEN c.month_start = DATE_TRUNC('month', CURRENT_DATE)
+                               THEN c.monthly_views
+                           ELSE 0
+                       END AS monthly_views
+                FROM article_view_counts c
+                JOIN articles a ON a.slug = c.article_slug
+                ORDER BY c.total_views DESC
                 LIMIT %s
                 """,
                 (limit,),
@@ -318,7 +730,7 @@ class Article:
 
     @staticmethod
     def get_device_breakdown(days=30):
-        """Count views by device class over the last `days`, using user_agent."""
+        """Count views by device class over the last `days`."""
         conn = get_db()
         if conn is None:
             logger.error("Failed to connect to the database.")
@@ -328,15 +740,16 @@ class Article:
             cur = conn.cursor()
             cur.execute(
                 """
-                SELECT user_agent
-                FROM article_views
-                WHERE viewed_at >= CURRENT_DATE - (%s - 1) * INTERVAL '1 day'
+                SELECT device_class, SUM(views)
+                FROM article_views_daily
+                WHERE day >= CURRENT_DATE - (%s - 1) * INTERVAL '1 day'
+                GROUP BY device_class
                 """,
                 (days,),
             )
             counts = {"Mobile": 0, "Tablet": 0, "Desktop": 0, "Bot": 0}
-            for (ua,) in cur.fetchall():
-                counts[_classify_device(ua)] += 1
+            for code, views in cur.fetchall():
+                counts[DEVICE_CLASSES[code]] += views
             return [
                 {"label": k, "count": v} for k, v in counts.items() if v or k != "Bot"
             ]
@@ -357,9 +770,9 @@ class Article:
             cur.execute(
                 """
                 SELECT COALESCE(NULLIF(referrer_host, ''), 'Direct') AS host,
-                       COUNT(*) AS views
-                FROM article_views
-                WHERE viewed_at >= CURRENT_DATE - (%s - 1) * INTERVAL '1 day'
+                       SUM(views) AS views
+                FROM article_views_daily
+                WHERE day >= CURRENT_DATE - (%s - 1) * INTERVAL '1 day'
                 GROUP BY host
                 ORDER BY views DESC
                 LIMIT %s
@@ -399,11 +812,10 @@ class Article:
             cur.execute(
                 f"""
                 SELECT a.title, a.slug, a.is_published, a.date_published,
-                       COUNT(v.id) AS views
+                       COALESCE(c.total_views, 0) AS views, a.updated_at
                 FROM articles a
-                LEFT JOIN article_views v ON v.article_slug = a.slug
+                LEFT JOIN article_view_counts c ON c.article_slug = a.slug
                 {where_sql}
-                GROUP BY a.id, a.title, a.slug, a.is_published, a.date_published
                 ORDER BY a.date_published DESC
                 """,  # noqa: S608 — where_sql built from a fixed whitelist, values bound
                 params,
@@ -415,6 +827,7 @@ class Article:
                     "is_published": row[2],
                     "date_published": row[3],
                     "views": row[4],
+                    "date_updated": row[5],
                 }
                 for row in cur.fetchall()
             ]
@@ -467,8 +880,8 @@ class Article:
             return []
 
     @staticmethod
-    def get_published_articles():
-        """Get only published articles"""
+    def get_published_articles(limit=None):
+        """Published articles, newest first, as ArticleListing (no content)."""
         conn = get_db()
         if conn is None:
             logger.error("Failed to connect to the database.")
@@ -476,25 +889,29 @@ class Article:
 
         try:
             cur = conn.cursor()
-            # Only fetch published articles, sorted by date_published in descending order
             cur.execute(
-                "SELECT * FROM articles WHERE is_published = TRUE ORDER BY date_published DESC"
+                f"""
+                SELECT {_LISTING_COLUMNS}
+                FROM articles
+                WHERE is_published = TRUE
+                ORDER BY date_published DESC, id DESC
+                LIMIT %s
+                """,  # noqa: S608 — fixed column/table fragments, values bound
+                (limit,),
             )
-            articles_data = cur.fetchall()
+            rows = cur.fetchall()
         except psycopg2.Error as e:
             logger.error(f"Error fetching published articles: {e}")
-            articles_data = []
-        finally:
-            pass
+            return []
 
-        article_objects = [
-            Article(row[1], row[2], row[3], row[4], row[5]) for row in articles_data
-        ]
-        return article_objects
+        return [ArticleListing._from_row(row) for row in rows]
 
     @staticmethod
     def get_published_articles_paginated(page=1, per_page=6):
-        """Fetch published articles with pagination support."""
+        """LIMIT/OFFSET page of published listings plus the total count.
+
+        Kept for the legacy ?page= parameter; prefer get_published_articles_after.
+        """
         if page < 1:
             page = 1
         if per_page < 1:
@@ -514,30 +931,298 @@ class Article:
             total = total_result[0] if total_result else 0
 
             cur.execute(
-                """
-                SELECT *
+                f"""
+                SELECT {_LISTING_COLUMNS}
                 FROM articles
                 WHERE is_published = TRUE
-                ORDER BY date_published DESC
+                ORDER BY date_published DESC, id DESC
                 LIMIT %s OFFSET %s
-                """,
+                """,  # noqa: S608 — fixed column/table fragments, values bound
                 (per_page, offset),
             )
-            articles_data = cur.fetchall()
+            rows = cur.fetchall()
         except psycopg2.Error as e:
             logger.error(f"Error fetching paginated published articles: {e}")
             return [], 0
-        finally:
-            pass
 
-        article_objects = [
-            Article(row[1], row[2], row[3], row[4], row[5]) for row in articles_data
-        ]
-        return article_objects, total
+        return [ArticleListing._from_row(row) for row in rows], total
+
+    def keyset_cursor(self):
+        """Cursor that resumes a date-ordered listing right after this article."""
+        return _keyset_cursor(self.date_published, self.id)
+
+    @staticmethod
+    def get_published_articles_after(cursor=None, per_page=6):
+        """Keyset page of published listings (ArticleListing), newest first.
+
+        `cursor` is a token from keyset_cursor() (None for the first page).
+        Seeks on (date_published, id) so deep pages cost the same as the first,
+        and fetches one extra row instead of running COUNT(*) to decide whether
+        there is a next page. Returns (articles, next_cursor or None).
+        """
+        per_page = max(1, per_page)
+        position = decode_cursor(cursor)
+        after = None
+        if position and "d" in position and "i" in position:
+            try:
+                after = (datetime.fromisoformat(position["d"]), int(position["i"]))
+            except (TypeError, ValueError):
+                after = None
+
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return [], None
+
+        seek_sql = "AND (date_published, id) < (%s, %s)" if after else ""
+        params = [*after, per_page + 1] if after else [per_page + 1]
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT {_LISTING_COLUMNS}
+                FROM articles
+                WHERE is_published = TRUE {seek_sql}
+                ORDER BY date_published DESC, id DESC
+                LIMIT %s
+                """,  # noqa: S608 — fixed SQL fragments, values bound
+                params,
+            )
+            rows = cur.fetchall()
+        except psycopg2.Error as e:
+            logger.error(f"Error fetching published articles after cursor: {e}")
+            return [], None
+
+        articles = [ArticleListing._from_row(row) for row in rows[:per_page]]
+        next_cursor = articles[-1].keyset_cursor() if len(rows) > per_page else None
+        return articles, next_cursor
+
+    @staticmethod
+    def get_published_count():
+        """Number of published articles (callers cache this)."""
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return 0
+
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT COUNT(*) FROM articles WHERE is_published = TRUE")
+            row = cur.fetchone()
+            return row[0] if row else 0
+        except psycopg2.Error as e:
+            logger.error(f"Error counting published articles: {e}")
+            return 0
+
+    @staticmethod
+    def get_published_slugs():
+        """Slugs of all published articles, or None if they could not be read
+        (so callers never mistake an outage for "no articles")."""
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return None
+
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT slug FROM articles WHERE is_published = TRUE")
+            return [row[0] for row in cur.fetchall()]
+        except psycopg2.Error as e:
+            logger.error(f"Error fetching published slugs: {e}")
+            return None
+
+    @staticmethod
+    def get_search_snapshot():
+        """[(ArticleListing, body_text)] for every published article, or None
+        on error; feeds the in-process fallback search index."""
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return None
+
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT {_LISTING_COLUMNS}, body_text
+                FROM articles
+                WHERE is_published = TRUE
+                """  # noqa: S608 — fixed column/table fragments
+            )
+            return [
+                (ArticleListing._from_row(row[:-1]), row[-1] or "")
+                for row in cur.fetchall()
+            ]
+        except psycopg2.Error as e:
+            logger.error(f"Error loading search snapshot: {e}")
+            return None
+
+    @staticmethod
+    def get_search_document(slug):
+        """(ArticleListing, body_text) for one published article, else None."""
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return None
+
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT {_LISTING_COLUMNS}, body_text
+                FROM articles
+                WHERE is_published = TRUE AND slug = %s
+                """,  # noqa: S608 — fixed column/table fragments, values bound
+                (slug,),
+            )
+            row = cur.fetchone()
+        except psycopg2.Error as e:
+            logger.error(f"Error loading search document {slug}: {e}")
+            return None
+        if row is None:
+            return None
+        return ArticleListing._from_row(row[:-1]), row[-1] or ""
+
+    @staticmethod
+    def get_related(slug):
+        """Precomputed "read next" listings for `slug`, best first."""
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return []
+
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                f"""
+                SELECT {_LISTING_COLUMNS}
+                FROM related_articles r
+                JOIN articles ON articles.slug = r.related_slug
+                WHERE r.article_slug = %s AND articles.is_published = TRUE
+                ORDER BY r.rank
+                """,  # noqa: S608 — fixed column/table fragments, values bound
+                (slug,),
+            )
+            return [ArticleListing._from_row(row) for row in cur.fetchall()]
+        except psycopg2.Error as e:
+            logger.error(f"Error fetching related articles for {slug}: {e}")
+            return []
+
+    @staticmethod
+    def get_published_titles():
+        """(slug, title) of every published article, or None on error."""
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return None
+
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT slug, title FROM articles WHERE is_published = TRUE")
+            return cur.fetchall()
+        except psycopg2.Error as e:
+            logger.error(f"Error fetching published titles: {e}")
+            return None
+
+    @staticmethod
+    def get_lexicon():
+        """[(word, ndoc), ...] over published titles and text, or None on error.
+
+        Words come from ts_stat over a 'simple' (unstemmed) tsvector, so
+        spelling suggestions are words readers actually see.
+        """
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return None
+
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT word, ndoc
+                FROM ts_stat($$
+                    SELECT to_tsvector(
+                        'simple', title || ' ' || COALESCE(body_text, '')
+                    )
+                    FROM articles
+                    WHERE is_published = TRUE
+                $$)
+                WHERE word ~ '^[a-z]+$'
+                """
+            )
+            return cur.fetchall()
+        except psycopg2.Error as e:
+            logger.error(f"Error building search lexicon: {e}")
+            return None
+
+    @staticmethod
+    def get_article_words(slug):
+        """Distinct words of one published article, for lexicon updates."""
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return []
+
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                """
+                SELECT DISTINCT word
+                FROM articles,
+                     unnest(tsvector_to_array(to_tsvector(
+                         'simple', title || ' ' || COALESCE(body_text, '')
+                     ))) AS word
+                WHERE slug = %s AND is_published = TRUE AND word ~ '^[a-z]+$'
+                """,
+                (slug,),
+            )
+            return [row[0] for row in cur.fetchall()]
+        except psycopg2.Error as e:
+            logger.error(f"Error fetching words of {slug}: {e}")
+            return []
+
+    @staticmethod
+    def get_published_versions():
+        """{slug: updated_at} for published articles, or None on error."""
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return None
+
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT slug, updated_at FROM articles WHERE is_published = TRUE"
+            )
+            return dict(cur.fetchall())
+        except psycopg2.Error as e:
+            logger.error(f"Error fetching article versions: {e}")
+            return None
+
+    @staticmethod
+    def get_listing_version():
+        """(latest update time, count) over published articles, or None on
+        error. Changes whenever anything in a listing, feed or sitemap can."""
+        conn = get_db()
+        if conn is None:
+            logger.error("Failed to connect to the database.")
+            return None
+
+        try:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT MAX(updated_at), COUNT(*) FROM articles WHERE is_published = TRUE"
+            )
+            row = cur.fetchone()
+            return (row[0], row[1]) if row else None
+        except psycopg2.Error as e:
+            logger.error(f"Error reading listing version: {e}")
+            return None
 
     @staticmethod
     def get_published_articles_by_slugs(slugs):
-        """Fetch published articles for a list of slugs preserving the input order."""
+        """Published listings for `slugs`, preserving the input order."""
         if not slugs:
             return []
 
@@ -549,25 +1234,20 @@ class Article:
         try:
             cur = conn.cursor()
             cur.execute(
-                """
-                SELECT title, content, date_published, is_published, slug
+                f"""
+                SELECT {_LISTING_COLUMNS}
                 FROM articles
                 WHERE is_published = TRUE AND slug = ANY(%s)
-                """,
+                """,  # noqa: S608 — fixed column/table fragments, values bound
                 (slugs,),
             )
             rows = cur.fetchall()
         except psycopg2.Error as e:
             logger.error(f"Error fetching published articles by slugs: {e}")
             return []
-        finally:
-            pass
 
-        by_slug = {
-            row[4]: Article(row[0], row[1], row[2], row[3], row[4]) for row in rows
-        }
-        ordered = [by_slug[slug] for slug in slugs if slug in by_slug]
-        return ordered
+        by_slug = {row[2]: ArticleListing._from_row(row) for row in rows}
+        return [by_slug[slug] for slug in slugs if slug in by_slug]
 
     @staticmethod
     def delete_article_by_slug(slug):
@@ -596,7 +1276,10 @@ class Article:
 
         try:
             cur = conn.cursor()
-            cur.execute("SELECT * FROM articles WHERE slug = %s", (slug,))
+            cur.execute(
+                f"SELECT {_ARTICLE_COLUMNS} FROM articles WHERE slug = %s",  # noqa: S608
+                (slug,),
+            )
             article_data = cur.fetchone()
         except psycopg2.Error as e:
             logger.error(f"Error fetching article by slug: {e}")
@@ -605,13 +1288,4 @@ class Article:
             # Connection is now managed by app context, no close here
             pass
 
-        if article_data:
-            return cls(
-                article_data[1],
-                article_data[2],
-                article_data[3],
-                article_data[4],
-                article_data[5],
-            )
-        else:
-            return None
+        return cls._from_row(article_data) if article_data else None
@@ -0,0 +1,133 @@
+"""Edge (CDN) caching: Cache-Control policies, surrogate keys and purges.
+
+Anonymous responses of public routes are marked cacheable by the CDN for
+`s_maxage` seconds and may be served stale for `stale_while_revalidate` more
+while the edge refetches. They carry a Surrogate-Key header listing the same
+tags the page cache uses (plus SITE_TAG), so a purge of `article:<slug>` or
+`list:blog` can drop exactly the affected URLs at the edge too. Responses to
+signed-in users, or that set a cookie, are `private, no-store`, so the edge
+never stores a page rendered with per-user markup (the admin links in the
+header); the page cache skips signed-in requests for the same reason. Public
+responses therefore need no `Vary: Cookie` (which would split the edge cache
+by every cookie a visitor carries); EdgeSessionInterface keeps Flask from
+adding it just because the login check read the session.
+
+Purges go to a webhook (CDN_PURGE_URL, e.g. a provider's purge-by-tag API or
+a function that calls it); without one, purges are disabled: LocalPurger only
+keeps the most recent ones for inspection.
+"""
+
+import json
+import logging
+import os
+import threading
+import urllib.request
+from collections import deque
+from functools import wraps
+
+from flask import make_response, session
+from flask.sessions import SecureCookieSessionInterface
+from flask_login import current_user
+
+from page_cache import SITE_TAG
+
+logger = logging.getLogger(__name__)
+
+PRIVATE = "private, no-store"
+
+
+def edge_cached(s_maxage, stale_while_revalidate=0, keys=()):
+    """Emit a CDN caching policy for a view's anonymous 200/304 responses.
+
+    `keys` is a tuple of surrogate keys or a callable taking the view's
+    keyword arguments and returning them.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            response = make_response(f(*args, **kwargs))
+            if current_user.is_authenticated or session.modified:
+                response.headers["Cache-Control"] = PRIVATE
+                return response
+            if response.status_code not in (200, 304):
+                return response
+            policy = f"public, max-age=0, s-maxage={s_maxage}"
+            if stale_while_revalidate:
+                policy += f", stale-while-revalidate={stale_while_revalidate}"
+            response.headers["Cache-Control"] = policy
+            surrogate = keys(**kwargs) if callable(keys) else keys
+            response.headers["Surrogate-Key"] = " ".join(
+                dict.fromkeys((SITE_TAG, *surrogate))
+            )
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+class EdgeSessionInterface(SecureCookieSessionInterface):
+    """Flask's cookie session, minus `Vary: Cookie` on edge-cacheable
+    responses (those edge_cached marked public)."""
+
+    def save_session(self, app, session, response):
+        super().save_session(app, session, response)
+        if "Surrogate-Key" in response.headers:
+            # Lowercase: HeaderSet only matches entries against the name as given.
+            response.vary.discard("cookie")
+
+
+class LocalPurger:
+    """Keeps the last `max_entries` purges instead of calling a CDN
+    (development, tests)."""
+
+    def __init__(self, max_entries=100):
+        self.purged = deque(maxlen=max_entries)
+        self._lock = threading.Lock()
+
+    def purge(self, keys) -> bool:
+        keys = tuple(keys)
+        with self._lock:
+            self.purged.append(keys)
+        logger.debug("CDN purge skipped (no CDN_PURGE_URL): %s", " ".join(keys))
+        return True
+
+
+class WebhookPurger:
+    """POSTs {"surrogate_keys": [...]} to a purge endpoint."""
+
+    def __init__(self, url, token=None, timeout=3.0):
+        if not url.startswith(("https://", "http://")):
+            raise ValueError(f"CDN purge URL must be http(s): {url}")
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def purge(self, keys) -> bool:
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        request = urllib.request.Request(  # noqa: S310 — scheme checked in __init__
+            self.url,
+            data=json.dumps({"surrogate_keys": list(keys)}).encode(),
+            headers=headers,
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:  # noqa: S310
+                return 200 <= response.status < 300
+        except OSError as e:
+            logger.error(f"CDN purge failed for {', '.join(keys)}: {e}")
+            return False
+
+
+def purger_from_env():
+    url = os.getenv("CDN_PURGE_URL")
+    if url:
+        return WebhookPurger(url, token=os.getenv("CDN_PURGE_TOKEN"))
+    logger.warning(
+        "CDN_PURGE_URL is not set: CDN purges are disabled, edge-cached pages "
+        "update only when their s-maxage expires."
+    )
+    return LocalPurger()
@@ -0,0 +1,79 @@
+"""Precompressed variants of cached response bodies.
+
+Bodies are compressed once, when a page-cache entry is filled, and every hit
+picks the variant the client accepts instead of recompressing. gzip is always
+available; brotli is used when the optional `brotli` package is installed.
+"""
+
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+# Preference order when the client accepts several equally.
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+_COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/json",
+    "application/xml",
+    "application/rss+xml",
+    "application/javascript",
+    "image/svg+xml",
+)
+
+
+def default_min_size() -> int:
+    """Bodies smaller than this many bytes are not worth compressing."""
+    return int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+
+
+def is_compressible(content_type) -> bool:
+    return bool(content_type) and content_type.startswith(_COMPRESSIBLE_TYPES)
+
+
+def compress_variants(body: bytes, content_type, min_size) -> dict[str, bytes]:
+    """{encoding: compressed body} for every encoding that actually shrinks
+    `body`; empty when it is too small or not a compressible type."""
+    if min_size is None or len(body) < min_size or not is_compressible(content_type):
+        return {}
+    variants = {"gzip": gzip.compress(body, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants["br"] = brotli.compress(body, quality=10)
+    return {enc: data for enc, data in variants.items() if len(data) < len(body)}
+
+
+def _accepted(header) -> dict[str, float]:
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(accept_encoding, available) -> str | None:
+    """Best encoding in `available` for an Accept-Encoding header, or None
+    for the identity body."""
+    accepted = _accepted(accept_encoding)
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        if encoding not in available:
+            continue
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
@@ -0,0 +1,130 @@
+"""Conditional GET support: ETag / Last-Modified validators and 304s.
+
+Validators are computed from cheap content versions (an article's
+updated_at, the published listing's latest update and size, an image's
+content-hash id) so a matching If-None-Match / If-Modified-Since is answered
+before the page is rendered or article bodies are read. BUILD_ID is mixed
+into every ETag so a deploy that changes templates invalidates them. Without
+a commit SHA from the environment it is a hash of the app's modules and
+templates, so every instance of one deploy agrees on it.
+"""
+
+import hashlib
+import os
+from datetime import UTC
+from functools import wraps
+from pathlib import Path
+
+from flask import make_response, request
+
+from compression import ENCODINGS
+
+_APP_ROOT = Path(__file__).resolve().parent
+
+
+def source_fingerprint(root=_APP_ROOT) -> str:
+    """Hash of the top-level Python modules and templates under `root`."""
+    digest = hashlib.sha1(usedforsecurity=False)
+    paths = sorted(root.glob("*.py")) + sorted(root.glob("templates/**/*.html"))
+    for path in paths:
+        digest.update(path.relative_to(root).as_posix().encode())
+        digest.update(b"\0")
+        digest.update(path.read_bytes())
+    return digest.hexdigest()[:12]
+
+
+BUILD_ID = (
+    os.getenv("VERCEL_GIT_COMMIT_SHA") or os.getenv("BUILD_ID") or source_fingerprint()
+)
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag value for the given version parts (plus BUILD_ID)."""
+    digest = hashlib.sha1(repr((BUILD_ID, *parts)).encode(), usedforsecurity=False)
+    return digest.hexdigest()[:32]
+
+
+def _as_utc(value):
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        # TIMESTAMP columns hold naive UTC.
+        value = value.replace(tzinfo=UTC)
+    return value.replace(microsecond=0)
+
+
+def not_modified(etag=None, last_modified=None):
+    """Return a 304 response if the request's validators match, else None.
+
+    If-None-Match wins over If-Modified-Since, as RFC 9110 requires. A tag
+    for any encoded variant of `etag` (see add_validators) matches too, and
+    is echoed back on the 304.
+    """
+    if request.method not in ("GET", "HEAD"):
+        return None
+    last_modified = _as_utc(last_modified)
+    if request.if_none_match:
+        matched = False
+        if etag is not None:
+            for candidate in (etag, *(f"{etag}-{enc}" for enc in ENCODINGS)):
+                if request.if_none_match.contains_weak(candidate):
+                    etag, matched = candidate, True
+                    break
+    elif request.if_modified_since and last_modified is not None:
+        matched = last_modified <= request.if_modified_since
+    else:
+        matched = False
+    if not matched:
+        return None
+    response = make_response("", 304)
+    add_validators(response, etag, last_modified)
+    return response
+
+
+# Set by a view on a response that must not carry validators, e.g. search
+# results from a fallback; conditional() strips it before sending. A header
+# rather than request state, so replays from the page cache keep it.
+NO_VALIDATORS = "X-No-Validators"
+
+
+def add_validators(response, etag=None, last_modified=None):
+    """Set ETag / Last-Modified on a 200 or 304. Encoded bodies get their
+    own strong tag (`<etag>-gzip`), since their bytes differ."""
+    if response.status_code not in (200, 304):
+        return response
+    if etag is not None:
+        encoding = response.headers.get("Content-Encoding")
+        if encoding and response.status_code == 200:
+            etag = f"{etag}-{encoding}"
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = _as_utc(last_modified)
+    return response
+
+
+def conditional(validators):
+    """Decorate a view with validators computed before it runs.
+
+    `validators(**view_kwargs)` returns (etag, last_modified), either of which
+    may be None, or None to skip conditional handling for this request. A
+    response marked with the NO_VALIDATORS header is sent without them.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            found = validators(**kwargs)
+            if found is None:
+                return f(*args, **kwargs)
+            etag, last_modified = found
+            early = not_modified(etag, last_modified)
+            if early is not None:
+                return early
+            response = make_response(f(*args, **kwargs))
+            if response.headers.pop(NO_VALIDATORS, None) is not None:
+                return response
+            return add_validators(response, etag, last_modified)
+
+        return wrapper
+
+    return decorator
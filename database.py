@@ -1,14 +1,19 @@
 import logging
 import os
+import threading
+from contextlib import contextmanager
 from urllib.parse import urlparse
 
 import psycopg2
 from flask import g
-from psycopg2.pool import SimpleConnectionPool
+
+from db_pool import ConnectionPool, PoolTimeoutError
+from migrations import apply_migrations
 
 logger = logging.getLogger(__name__)
 
 _POOL = None
+_POOL_LOCK = threading.Lock()
 _MAX_RETRIES = 3
 
 
@@ -64,22 +69,24 @@ def _safe_dsn_summary(url: str | None, source: str | None) -> str:
     )
 
 
-def _is_connection_alive(conn) -> bool:
-    """Check if a database connection is still usable."""
-    if conn is None:
-        return False
-    try:
-        if conn.closed:
-            return False
-        # Rollback any pending transaction before testing
-        conn.rollback()
-        cur = conn.cursor()
-        cur.execute("SELECT 1")
-        cur.fetchone()
-        cur.close()
-        return True
-    except Exception:
-        return False
+def _open_connection(url):
+    conn = psycopg2.connect(url)
+    conn.autocommit = True
+    return conn
+
+
+def _pool_settings() -> dict:
+    # Serverless functions handle one request at a time, and each instance gets
+    # its own pool; keep it small to avoid Postgres connection exhaustion
+    # across many concurrent instances.
+    return {
+        "minconn": int(os.getenv("DB_POOL_MIN", "1")),
+        "maxconn": int(os.getenv("DB_POOL_MAX", "2")),
+        "max_lifetime": float(os.getenv("DB_POOL_MAX_LIFETIME", "1800")),
+        "max_idle": float(os.getenv("DB_POOL_MAX_IDLE", "300")),
+        "health_check_interval": float(os.getenv("DB_POOL_HEALTH_INTERVAL", "60")),
+        "timeout": float(os.getenv("DB_POOL_TIMEOUT", "5")),
+    }
 
 
 def _reset_pool():
@@ -93,8 +100,18 @@ def _reset_pool():
         _POOL = None
 
 
+def get_pool_stats() -> dict | None:
+    """Checkout/wait counters for the process-wide pool, or None before first use."""
+    pool = _POOL
+    return pool.stats() if pool is not None else None
+
+
 def connect_db():
-    """Create or reuse a global connection pool and fetch a connection with retry logic."""
+    """Check a connection out of the process-wide pool, retrying on connect errors.
+
+    No liveness probe runs here: the pool recycles by age and closed state, and
+    probes idle connections in the background.
+    """
     global _POOL
     url, source = get_database_url()
     if not url:
@@ -104,35 +121,19 @@ def connect_db():
     for attempt in range(_MAX_RETRIES):
         try:
             if _POOL is None:
-                # Serverless functions handle one request at a time, and each
-                # instance gets its own pool; keep it small to avoid Postgres
-                # connection exhaustion across many concurrent instances.
-                max_conn = int(os.getenv("DB_POOL_MAX", "2"))
-                _POOL = SimpleConnectionPool(minconn=1, maxconn=max_conn, dsn=url)
-                logger.info("Initialized DB pool (%s)", _safe_dsn_summary(url, source))
-
-            conn = _POOL.getconn()
-
-            if not _is_connection_alive(conn):
-                logger.warning(
-                    "Got stale connection from pool, resetting pool (attempt %d)",
-                    attempt + 1,
-                )
-                try:
-                    _POOL.putconn(conn, close=True)
-                except Exception as e:
-                    logger.debug("Failed to close stale connection: %s", e)
-                _reset_pool()
-                continue
-
-            # Rollback any pending transaction before setting autocommit
-            try:
-                conn.rollback()
-            except Exception as e:
-                logger.debug("Failed to rollback transaction: %s", e)
-            conn.autocommit = True
-            return conn
+                with _POOL_LOCK:
+                    if _POOL is None:
+                        _POOL = ConnectionPool(
+                            lambda: _open_connection(url), **_pool_settings()
+                        )
+                        logger.info(
+                            "Initialized DB pool (%s)", _safe_dsn_summary(url, source)
+                        )
+            return _POOL.getconn()
 
+        except PoolTimeoutError as e:
+            logger.error("DB pool exhausted: %s", e)
+            return None
         except psycopg2.OperationalError as e:
             logger.warning(
                 "DB connection error (attempt %d/%d): %s", attempt + 1, _MAX_RETRIES, e
@@ -162,6 +163,22 @@ def get_db():
     return g.db
 
 
+@contextmanager
+def pooled_connection():
+    """Borrow a pool connection outside the request cycle (e.g. background
+    flushes); yields None when the database is unavailable."""
+    conn = connect_db()
+    try:
+        yield conn
+    finally:
+        if conn is not None:
+            pool = _POOL
+            if pool is not None:
+                pool.putconn(conn)
+            else:
+                conn.close()
+
+
 def close_db(e=None):
     """Closes the database connection."""
     global _POOL
@@ -171,10 +188,9 @@ def close_db(e=None):
     if db is not None:
         if from_pool and _POOL is not None:
             try:
-                if db.closed:
-                    logger.debug("Connection already closed, not returning to pool")
-                else:
-                    _POOL.putconn(db)
+                # Closed/broken connections must still go back so the pool can
+                # release their slot; putconn discards them.
+                _POOL.putconn(db)
             except Exception as exc:
                 logger.debug("Failed to return connection to pool: %s", exc)
                 try:
@@ -192,155 +208,19 @@ def close_db(e=None):
 
 
 def init_db():
-    conn = get_db()  # Use get_db instead of connect_db
+    """Apply any pending schema migrations (see migrations.py)."""
+    conn = get_db()
     if conn is None:
         logger.error("Failed to connect to the database.")
         return False
 
     try:
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS articles (
-                id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                date_published TIMESTAMP NOT NULL,
-                is_published BOOLEAN NOT NULL DEFAULT FALSE,
-                slug TEXT UNIQUE NOT NULL,
-                search_vector tsvector
-                    GENERATED ALWAYS AS (
-                        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
-                        setweight(
-                            to_tsvector(
-                                'english',
-                                coalesce(regexp_replace(content, '<[^>]+>', ' ', 'g'), '')
-                            ),
-                            'B'
-                        )
-                    ) STORED
-            )
-        """)
-        cur.execute(
-            "ALTER TABLE articles ADD COLUMN IF NOT EXISTS search_vector tsvector"
-            " GENERATED ALWAYS AS ("
-            "   setweight(to_tsvector('english', coalesce(title, '')), 'A') ||"
-            "   setweight(to_tsvector('english', coalesce(regexp_replace(content, '<[^>]+>', ' ', 'g'), '')), 'B')"
-            " ) STORED"
-        )
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS projects (
-                id SERIAL PRIMARY KEY,
-                title TEXT NOT NULL,
-                description TEXT NOT NULL,
-                image_url TEXT,
-                technologies TEXT, -- Comma-separated or JSON
-                github_link TEXT,
-                live_demo_link TEXT,
-                date_added TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                is_visible BOOLEAN NOT NULL DEFAULT TRUE,
-                is_featured BOOLEAN NOT NULL DEFAULT FALSE,
-                sort_order INTEGER NOT NULL DEFAULT 0
-            )
-        """)
-        # Migrate pre-existing projects tables to the curation columns
-        cur.execute(
-            "ALTER TABLE projects ADD COLUMN IF NOT EXISTS is_visible BOOLEAN NOT NULL DEFAULT TRUE"
-        )
-        cur.execute(
-            "ALTER TABLE projects ADD COLUMN IF NOT EXISTS is_featured BOOLEAN NOT NULL DEFAULT FALSE"
-        )
-        cur.execute(
-            "ALTER TABLE projects ADD COLUMN IF NOT EXISTS sort_order INTEGER NOT NULL DEFAULT 0"
-        )
-        # Key/value store for admin-editable site settings (homepage copy, toggles)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS site_settings (
-                key TEXT PRIMARY KEY,
-                value JSONB NOT NULL,
-                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS article_views (
-                id SERIAL PRIMARY KEY,
-                article_slug TEXT NOT NULL,
-                ip_address TEXT NOT NULL,
-                user_agent TEXT,
-                viewed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                view_date DATE NOT NULL DEFAULT CURRENT_DATE,
-                UNIQUE(article_slug, ip_address, view_date)
-            )
-        """)
-        # Migrate legacy schema (unique per slug+ip forever) to per-day dedup so
-        # daily/monthly aggregates actually reflect returning visitors.
-        cur.execute(
-            "ALTER TABLE article_views ADD COLUMN IF NOT EXISTS view_date DATE NOT NULL DEFAULT CURRENT_DATE"
-        )
-        # When the column is first added to a legacy table, every existing row
-        # gets today's date from the DEFAULT, collapsing all historical views
-        # onto the migration day. Backfill from the real viewed_at timestamp.
-        # Idempotent: matches nothing once view_date already tracks viewed_at.
-        cur.execute(
-            "UPDATE article_views SET view_date = viewed_at::date "
-            "WHERE view_date <> viewed_at::date"
-        )
-        # Referrer host for audience stats (nullable; direct visits stay NULL)
-        cur.execute(
-            "ALTER TABLE article_views ADD COLUMN IF NOT EXISTS referrer_host TEXT"
-        )
-        cur.execute(
-            "ALTER TABLE article_views "
-            "DROP CONSTRAINT IF EXISTS article_views_article_slug_ip_address_key"
-        )
-        cur.execute("""
-            DO $$
-            BEGIN
-                IF NOT EXISTS (
-                    SELECT 1 FROM pg_constraint WHERE conname = 'article_views_slug_ip_date_key'
-                ) THEN
-                    ALTER TABLE article_views
-                        ADD CONSTRAINT article_views_slug_ip_date_key
-                        UNIQUE (article_slug, ip_address, view_date);
-                END IF;
-            END$$;
-        """)
-        # Helpful index for blog listing performance
-        cur.execute(
-            "CREATE INDEX IF NOT EXISTS idx_articles_published_date ON articles (is_published, date_published DESC)"
-        )
-        # Index for daily/monthly view aggregation
-        cur.execute(
-            "CREATE INDEX IF NOT EXISTS idx_article_views_viewed_at ON article_views (viewed_at)"
-        )
-        # Index for per-article view counts
-        cur.execute(
-            "CREATE INDEX IF NOT EXISTS idx_article_views_slug ON article_views (article_slug)"
-        )
-        # GIN index for Postgres full-text search
-        cur.execute(
-            "CREATE INDEX IF NOT EXISTS idx_articles_search ON articles USING GIN (search_vector)"
-        )
-        # Uploaded images, stored as bytes so they survive Vercel's read-only FS.
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS images (
-                id TEXT PRIMARY KEY,
-                filename TEXT,
-                content_type TEXT NOT NULL,
-                data BYTEA NOT NULL,
-                byte_size INTEGER NOT NULL,
-                uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Using autocommit, but safe to call commit in case autocommit was disabled
-        try:
-            conn.commit()
-        except Exception as exc:
-            logger.debug("Commit failed (likely autocommit on): %s", exc)
-        logger.info("Database initialized or already exists.")
-        return True
+        applied = apply_migrations(conn)
     except psycopg2.Error as e:
         logger.error(f"Error initializing database: {e}")
         return False
-    finally:
-        # Connection is now managed by app context, no close here
-        pass
+    if applied:
+        logger.info("Applied migrations: %s", ", ".join(map(str, applied)))
+    else:
+        logger.info("Database schema is up to date.")
+    return True
@@ -0,0 +1,294 @@
+"""Thread-safe Postgres connection pool with age-based recycling.
+
+psycopg2's SimpleConnectionPool is not safe to share between threads, and the
+old connect_db() probed every checkout with a rollback + SELECT 1. This pool
+hands out connections without a round trip: staleness is decided from local
+bookkeeping (closed flag, lifetime, idle time) and a background thread probes
+idle connections off the request path.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection became available within the checkout timeout."""
+
+
+@dataclass
+class _Entry:
+    conn: object
+    created_at: float
+    last_used: float = field(default_factory=time.monotonic)
+
+
+def _is_alive(conn) -> bool:
+    """Round-trip probe, only ever run by the background health check."""
+    if conn is None or conn.closed:
+        return False
+    try:
+        if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        cur = conn.cursor()
+        cur.execute("SELECT 1")
+        cur.fetchone()
+        cur.close()
+        return True
+    except Exception:
+        return False
+
+
+def _close_quietly(conn):
+    try:
+        if not conn.closed:
+            conn.close()
+    except Exception as exc:
+        logger.debug("Failed to close pooled connection: %s", exc)
+
+
+class ConnectionPool:
+    """Bounded pool of connections created by `connect()`.
+
+    - minconn/maxconn bound the number of open connections.
+    - max_lifetime recycles connections older than N seconds (e.g. to pick up
+      Postgres/pgbouncer failovers); max_idle drops connections unused for N
+      seconds, since serverless Postgres closes them on its side anyway.
+    - A daemon thread probes idle connections every health_check_interval
+      seconds and tops the pool back up to minconn.
+    """
+
+    def __init__(
+        self,
+        connect,
+        minconn=1,
+        maxconn=2,
+        max_lifetime=1800.0,
+        max_idle=300.0,
+        health_check_interval=60.0,
+        timeout=5.0,
+    ):
+        if maxconn < 1 or minconn < 0 or minconn > maxconn:
+            raise ValueError("Pool needs 0 <= minconn <= maxconn and maxconn >= 1")
+        self._connect = connect
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()
+        self._in_use = {}
+        self._size = 0  # open + currently being opened
+        self._closed = False
+        self._stop = threading.Event()
+        self._health_thread = None
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._created = 0
+        self._discarded = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _expired(self, entry, now, check_idle=True) -> bool:
+        if entry.conn.closed:
+            return True
+        if self.max_lifetime and now - entry.created_at > self.max_lifetime:
+            return True
+        if not check_idle:
+            return False
+        return bool(self.max_idle and now - entry.last_used > self.max_idle)
+
+    def _record_checkout(self, entry, started):
+        # Caller holds self._cond.
+        waited = time.monotonic() - started
+        self._in_use[id(entry.conn)] = entry
+        self._checkouts += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    def _open(self):
+        conn = self._connect()
+        with self._cond:
+            self._created += 1
+        return _Entry(conn=conn, created_at=time.monotonic())
+
+    def _ensure_health_thread(self):
+        if self.health_check_interval and self._health_thread is None:
+            self._health_thread = threading.Thread(
+                target=self._health_loop, name="db-pool-health", daemon=True
+            )
+            self._health_thread.start()
+
+    def getconn(self):
+        """Check out a connection, waiting up to `timeout` seconds for one."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        stale = []
+        try:
+            with self._cond:
+                if self._closed:
+                    raise PoolTimeoutError("Connection pool is closed")
+                self._ensure_health_thread()
+                while True:
+                    now = time.monotonic()
+                    while self._idle:
+                        # LIFO: reuse the warmest connection, let cold ones age out.
+                        entry = self._idle.pop()
+                        if self._expired(entry, now):
+                            self._size -= 1
+                            self._discarded += 1
+                            stale.append(entry.conn)
+                            continue
+                        self._record_checkout(entry, started)
+                        return entry.conn
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"No connection available within {self.timeout:.1f}s"
+                        )
+                    self._cond.wait(remaining)
+        finally:
+            for conn in stale:
+                _close_quietly(conn)
+
+        # Open outside the lock so a slow connect does not block returns.
+        try:
+            entry = self._open()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._record_checkout(entry, started)
+        return entry.conn
+
+    def putconn(self, conn, close=False):
+        """Return a connection; broken or expired connections are closed."""
+        with self._cond:
+            entry = self._in_use.pop(id(conn), None)
+        if entry is None:
+            logger.debug("Returned connection is not owned by this pool; closing")
+            _close_quietly(conn)
+            return
+
+        discard = (
+            close
+            or self._closed
+            or self._expired(entry, time.monotonic(), check_idle=False)
+        )
+        if not discard:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception as exc:
+                logger.debug("Rollback on return failed, discarding: %s", exc)
+                discard = True
+
+        with self._cond:
+            if discard:
+                self._size -= 1
+                self._discarded += 1
+            else:
+                entry.last_used = time.monotonic()
+                self._idle.append(entry)
+            self._cond.notify()
+        if discard:
+            _close_quietly(conn)
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_check_interval):
+            try:
+                self.check_health()
+            except Exception as exc:
+                logger.warning("DB pool health check failed: %s", exc)
+
+    def check_health(self):
+        """Probe idle connections and top the pool up to minconn."""
+        now = time.monotonic()
+        with self._cond:
+            # Take idle entries out so they cannot be checked out mid-probe.
+            to_check = list(self._idle)
+            self._idle.clear()
+
+        alive, dead = [], []
+        for entry in to_check:
+            if not self._expired(entry, now) and _is_alive(entry.conn):
+                alive.append(entry)
+            else:
+                dead.append(entry)
+        for entry in dead:
+            _close_quietly(entry.conn)
+
+        with self._cond:
+            self._size -= len(dead)
+            self._discarded += len(dead)
+            # Keep LIFO order: probed entries are older than anything returned
+            # while the probe ran.
+            self._idle.extendleft(reversed(alive))
+            missing = 0 if self._closed else max(0, self.minconn - self._size)
+            self._size += missing
+            self._cond.notify_all()
+
+        for _ in range(missing):
+            try:
+                entry = self._open()
+            except Exception as exc:
+                logger.warning("Failed to refill DB pool: %s", exc)
+                with self._cond:
+                    self._size -= 1
+                continue
+            with self._cond:
+                self._idle.appendleft(entry)
+                self._cond.notify()
+        if dead:
+            logger.info("DB pool health check dropped %d connection(s)", len(dead))
+
+    def closeall(self):
+        """Close idle connections and stop the health thread.
+
+        Connections still checked out are closed when they are returned.
+        """
+        self._stop.set()
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            _close_quietly(entry.conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": len(self._in_use),
+                "min": self.minconn,
+                "max": self.maxconn,
+                "checkouts": checkouts,
+                "timeouts": self._timeouts,
+                "created": self._created,
+                "discarded": self._discarded,
+                "wait_ms_total": round(self._wait_total * 1000, 3),
+                "wait_ms_avg": round(self._wait_total * 1000 / checkouts, 3)
+                if checkouts
+                else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 3),
+            }
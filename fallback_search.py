@@ -0,0 +1,208 @@
+"""In-process BM25 search, used when Postgres full-text search is down or slow.
+
+The index is built lazily from one snapshot of published articles (listing
+columns plus body_text), then kept current by `refresh_article` on publish,
+edit and delete. Posting lists are parallel `array` columns (doc ids and
+term frequencies) rather than lists of tuples, so the whole index stays a
+few compact buffers per term. Doc ids only ever grow, so postings stay sorted
+and a removal is a bisect plus a delete.
+"""
+
+import logging
+import math
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has in is it its of on or that the to "
+    "was were will with".split()
+)
+# Title terms count as this many body occurrences.
+TITLE_WEIGHT = 3
+
+
+def tokenize(text) -> list[str]:
+    return [
+        t
+        for t in _TOKEN_RE.findall((text or "").lower())
+        if len(t) > 1 and t not in _STOPWORDS
+    ]
+
+
+class _Postings:
+    __slots__ = ("docs", "freqs")
+
+    def __init__(self):
+        self.docs = array("I")
+        self.freqs = array("H")
+
+    def add(self, doc, freq):
+        self.docs.append(doc)
+        self.freqs.append(min(freq, 0xFFFF))
+
+    def remove(self, doc):
+        i = bisect_left(self.docs, doc)
+        if i < len(self.docs) and self.docs[i] == doc:
+            del self.docs[i]
+            del self.freqs[i]
+
+
+class BM25Index:
+    """Inverted index with Okapi BM25 ranking."""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings = {}  # term -> _Postings
+        self._docs = {}  # doc id -> (listing, length, terms)
+        self._by_slug = {}  # slug -> doc id
+        self._next_id = 0
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, listing, body_text):
+        """Index (or re-index) one published article."""
+        counts = {}
+        for term in tokenize(body_text):
+            counts[term] = counts.get(term, 0) + 1
+        for term in tokenize(listing.title):
+            counts[term] = counts.get(term, 0) + TITLE_WEIGHT
+        length = sum(counts.values())
+        with self._lock:
+            self._remove_locked(listing.slug)
+            doc = self._next_id
+            self._next_id += 1
+            for term, freq in counts.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = _Postings()
+                postings.add(doc, freq)
+            self._docs[doc] = (listing, length, tuple(counts))
+            self._by_slug[listing.slug] = doc
+            self._total_length += length
+
+    def remove(self, slug):
+        with self._lock:
+            self._remove_locked(slug)
+
+    def _remove_locked(self, slug):
+        doc = self._by_slug.pop(slug, None)
+        if doc is None:
+            return
+        _, length, terms = self._docs.pop(doc)
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings[term]
+            postings.remove(doc)
+            if not postings.docs:
+                del self._postings[term]
+
+    def search(self, query, offset=0, limit=10):
+        """(listings for one page, total matches), best BM25 score first."""
+        terms = dict.fromkeys(tokenize(query))
+        with self._lock:
+            n = len(self._docs)
+            if not n or not terms:
+                return [], 0
+            avg_length = self._total_length / n or 1.0
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                df = len(postings.docs)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc, freq in zip(postings.docs, postings.freqs, strict=True):
+                    length = self._docs[doc][1]
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[doc] = scores.get(doc, 0.0) + idf * (
+                        freq * (self.k1 + 1) / (freq + norm)
+                    )
+            ranked = sorted(
+                scores,
+                key=lambda d: (
+                    -scores[d],
+                    -self._docs[d][0].date_published.timestamp(),
+                ),
+            )
+            page = [self._docs[d][0] for d in ranked[offset : offset + limit]]
+        return page, len(ranked)
+
+
+class FallbackSearch:
+    """Lazily built BM25Index over a snapshot of published articles.
+
+    `load_snapshot()` returns [(ArticleListing, body_text), ...] or None, and
+    `load_article(slug)` one such pair (None if the article is not published).
+    A snapshot older than `max_age` seconds is rebuilt on next use; after a
+    failed load, no new attempt is made for `retry_after` seconds.
+    """
+
+    def __init__(self, load_snapshot, load_article, max_age=900, retry_after=30):
+        self._load_snapshot = load_snapshot
+        self._load_article = load_article
+        self.max_age = max_age
+        self.retry_after = retry_after
+        self._index = None
+        self._built_at = 0.0
+        self._failed_at = None
+        self._build_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self._index is not None
+
+    def _usable(self) -> bool:
+        now = time.monotonic()
+        if self._index is not None and now - self._built_at < self.max_age:
+            return True
+        # Recently failed to load: serve what we have (possibly nothing).
+        return self._failed_at is not None and now - self._failed_at < self.retry_after
+
+    def index(self):
+        """The index, building it from a snapshot if needed; None if no
+        snapshot could be loaded and none was built before."""
+        if self._usable():
+            return self._index
+        with self._build_lock:
+            if self._usable():
+                return self._index
+            snapshot = self._load_snapshot()
+            if snapshot is None:
+                # Keep serving a stale index rather than nothing.
+                self._failed_at = time.monotonic()
+                return self._index
+            self._failed_at = None
+            index = BM25Index()
+            for listing, body_text in snapshot:
+                index.add(listing, body_text)
+            self._index = index
+            self._built_at = time.monotonic()
+            logger.info("Built fallback search index over %d articles", len(index))
+            return index
+
+    def refresh_article(self, slug):
+        """Re-index one article after publish, edit or delete (no-op until
+        the index has been built)."""
+        if self._index is None:
+            return
+        loaded = self._load_article(slug)
+        if loaded is None:
+            self._index.remove(slug)
+        else:
+            self._index.add(*loaded)
+
+    def search(self, query, offset, limit):
+        index = self.index()
+        if index is None:
+            return None
+        return index.search(query, offset, limit)
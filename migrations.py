@@ -0,0 +1,535 @@
+"""Versioned schema migrations.
+
+Each step runs once, inside its own transaction, and is recorded in the
+schema_migrations table. Apply pending steps at deploy time with
+`uv run flask --app app migrate`; requests only compare the recorded version
+against latest_version() (see app._check_schema_version).
+
+Add a step by appending a function decorated with @migration(<next number>,
+"<what it does>") at the end of this file. Never edit or renumber a step that
+has shipped. Steps must not import application modules: the rules they apply
+are copied in here as they stood when the step shipped, so a later change to
+the app cannot change what an old migration does.
+"""
+
+import html
+import logging
+import re
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import date
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary constant shared by every instance so concurrent deploys serialize.
+_ADVISORY_LOCK_ID = 7_311_001
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    apply: Callable
+
+
+MIGRATIONS: list[Migration] = []
+
+
+def migration(version, name):
+    """Register a migration step; versions must be unique and increasing."""
+
+    def register(fn):
+        if MIGRATIONS and version <= MIGRATIONS[-1].version:
+            raise ValueError(f"Migration {version} registered out of order")
+        MIGRATIONS.append(Migration(version, name, fn))
+        return fn
+
+    return register
+
+
+def latest_version() -> int:
+    return MIGRATIONS[-1].version
+
+
+def _ensure_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def get_schema_version(conn) -> int | None:
+    """Highest applied version; 0 for an unversioned DB, None on error."""
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not cur.fetchone()[0]:
+            return 0
+        cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return int(cur.fetchone()[0])
+    except psycopg2.Error as e:
+        logger.error("Error reading schema version: %s", e)
+        return None
+
+
+def apply_migrations(conn, target=None) -> list[int]:
+    """Apply pending migrations up to `target` (default: all) and return the
+    versions applied. Each step commits on its own; a failing step is rolled
+    back and re-raised, leaving earlier steps applied."""
+    applied = []
+    was_autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        cur = conn.cursor()
+        _ensure_table(cur)
+        conn.commit()
+        for step in MIGRATIONS:
+            if target is not None and step.version > target:
+                break
+            # Hold the lock for the whole step so a parallel deploy waits and
+            # then sees the version as already applied.
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (_ADVISORY_LOCK_ID,))
+            cur.execute(
+                "SELECT 1 FROM schema_migrations WHERE version = %s", (step.version,)
+            )
+            if cur.fetchone():
+                conn.commit()
+                continue
+            logger.info("Applying migration %04d: %s", step.version, step.name)
+            try:
+                step.apply(cur)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (step.version, step.name),
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error("Migration %04d failed: %s", step.version, step.name)
+                raise
+            applied.append(step.version)
+    finally:
+        conn.autocommit = was_autocommit
+    return applied
+
+
+@migration(1, "baseline schema")
+def _baseline(cur):
+    # Every statement is idempotent so databases created by the old
+    # init_db() adopt versioning without changes.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS articles (
+            id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            date_published TIMESTAMP NOT NULL,
+            is_published BOOLEAN NOT NULL DEFAULT FALSE,
+            slug TEXT UNIQUE NOT NULL,
+            search_vector tsvector
+                GENERATED ALWAYS AS (
+                    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+                    setweight(
+                        to_tsvector(
+                            'english',
+                            coalesce(regexp_replace(content, '<[^>]+>', ' ', 'g'), '')
+                        ),
+                        'B'
+                    )
+                ) STORED
+        )
+    """)
+    cur.execute(
+        "ALTER TABLE articles ADD COLUMN IF NOT EXISTS search_vector tsvector"
+        " GENERATED ALWAYS AS ("
+        "   setweight(to_tsvector('english', coalesce(title, '')), 'A') ||"
+        "   setweight(to_tsvector('english', coalesce(regexp_replace(content, '<[^>]+>', ' ', 'g'), '')), 'B')"
+        " ) STORED"
+    )
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS projects (
+            id SERIAL PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            image_url TEXT,
+            technologies TEXT, -- Comma-separated or JSON
+            github_link TEXT,
+            live_demo_link TEXT,
+            date_added TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            is_visible BOOLEAN NOT NULL DEFAULT TRUE,
+            is_featured BOOLEAN NOT NULL DEFAULT FALSE,
+            sort_order INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Migrate pre-existing projects tables to the curation columns
+    cur.execute(
+        "ALTER TABLE projects ADD COLUMN IF NOT EXISTS is_visible BOOLEAN NOT NULL DEFAULT TRUE"
+    )
+    cur.execute(
+        "ALTER TABLE projects ADD COLUMN IF NOT EXISTS is_featured BOOLEAN NOT NULL DEFAULT FALSE"
+    )
+    cur.execute(
+        "ALTER TABLE projects ADD COLUMN IF NOT EXISTS sort_order INTEGER NOT NULL DEFAULT 0"
+    )
+    # Key/value store for admin-editable site settings (homepage copy, toggles)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS site_settings (
+            key TEXT PRIMARY KEY,
+            value JSONB NOT NULL,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS article_views (
+            id SERIAL PRIMARY KEY,
+            article_slug TEXT NOT NULL,
+            ip_address TEXT NOT NULL,
+            user_agent TEXT,
+            viewed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            view_date DATE NOT NULL DEFAULT CURRENT_DATE,
+            UNIQUE(article_slug, ip_address, view_date)
+        )
+    """)
+    # Migrate legacy schema (unique per slug+ip forever) to per-day dedup so
+    # daily/monthly aggregates actually reflect returning visitors.
+    cur.execute(
+        "ALTER TABLE article_views ADD COLUMN IF NOT EXISTS view_date DATE NOT NULL DEFAULT CURRENT_DATE"
+    )
+    # Referrer host for audience stats (nullable; direct visits stay NULL)
+    cur.execute("ALTER TABLE article_views ADD COLUMN IF NOT EXISTS referrer_host TEXT")
+    cur.execute(
+        "ALTER TABLE article_views "
+        "DROP CONSTRAINT IF EXISTS article_views_article_slug_ip_address_key"
+    )
+    cur.execute("""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (
+                SELECT 1 FROM pg_constraint WHERE conname = 'article_views_slug_ip_date_key'
+            ) THEN
+                ALTER TABLE article_views
+                    ADD CONSTRAINT article_views_slug_ip_date_key
+                    UNIQUE (article_slug, ip_address, view_date);
+            END IF;
+        END$$;
+    """)
+    # Helpful index for blog listing performance
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_articles_published_date ON articles (is_published, date_published DESC)"
+    )
+    # Index for daily/monthly view aggregation
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_article_views_viewed_at ON article_views (viewed_at)"
+    )
+    # Index for per-article view counts
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_article_views_slug ON article_views (article_slug)"
+    )
+    # GIN index for Postgres full-text search
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_articles_search ON articles USING GIN (search_vector)"
+    )
+    # Uploaded images, stored as bytes so they survive Vercel's read-only FS.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS images (
+            id TEXT PRIMARY KEY,
+            filename TEXT,
+            content_type TEXT NOT NULL,
+            data BYTEA NOT NULL,
+            byte_size INTEGER NOT NULL,
+            uploaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+@migration(2, "backfill article_views.view_date from viewed_at")
+def _backfill_view_date(cur):
+    # When the column is first added to a legacy table, every existing row
+    # gets today's date from the DEFAULT, collapsing all historical views
+    # onto the migration day. Backfill from the real viewed_at timestamp.
+    # Idempotent: matches nothing once view_date already tracks viewed_at.
+    cur.execute(
+        "UPDATE article_views SET view_date = viewed_at::date "
+        "WHERE view_date <> viewed_at::date"
+    )
+
+
+# Derived fields as computed when step 3 shipped (see articles.derive_fields).
+_V3_TAG_RE = re.compile(r"<[^>]+>")
+_V3_IMG_RE = re.compile(r'<img[^>]+src=["\']([^"\']+)["\'][^>]*>', re.IGNORECASE)
+
+
+def _v3_derived_fields(content):
+    content = content or ""
+    clean_text = _V3_TAG_RE.sub("", content)
+    word_count = len(clean_text.split())
+    image = _V3_IMG_RE.search(content)
+    return (
+        word_count,
+        max(1, round(word_count / 225)),
+        clean_text[:301],
+        image.group(1) if image else None,
+        " ".join(html.unescape(_V3_TAG_RE.sub(" ", content)).split()),
+    )
+
+
+@migration(3, "store derived article fields")
+def _derived_article_fields(cur):
+    # Filled by Article.save_article/update_article from now on; existing rows
+    # are backfilled here (and can be recomputed with the current rules by
+    # `flask backfill-articles --all`).
+    cur.execute("""
+        ALTER TABLE articles
+            ADD COLUMN IF NOT EXISTS word_count INTEGER,
+            ADD COLUMN IF NOT EXISTS reading_time INTEGER,
+            ADD COLUMN IF NOT EXISTS summary TEXT,
+            ADD COLUMN IF NOT EXISTS first_image_url TEXT,
+            ADD COLUMN IF NOT EXISTS body_text TEXT
+    """)
+    last_id = 0
+    while True:
+        cur.execute(
+            "SELECT id, content FROM articles "
+            "WHERE word_count IS NULL AND id > %s ORDER BY id LIMIT 100",
+            (last_id,),
+        )
+        rows = cur.fetchall()
+        if not rows:
+            return
+        for article_id, content in rows:
+            cur.execute(
+                """
+                UPDATE articles
+                SET word_count = %s, reading_time = %s, summary = %s,
+                    first_image_url = %s, body_text = %s
+                WHERE id = %s
+                """,
+                (*_v3_derived_fields(content), article_id),
+            )
+        last_id = rows[-1][0]
+
+
+@migration(4, "materialized per-article view counters")
+def _article_view_counts(cur):
+    # Kept current by Article.record_views; `flask reconcile-view-counts`
+    # rebuilds it from article_views if the two ever drift.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS article_view_counts (
+            article_slug TEXT PRIMARY KEY,
+            total_views BIGINT NOT NULL DEFAULT 0,
+            month_start DATE NOT NULL DEFAULT DATE_TRUNC('month', CURRENT_DATE),
+            monthly_views BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_article_view_counts_total "
+        "ON article_view_counts (total_views DESC)"
+    )
+    # Counted from the raw rows as they stood at this step; later counters
+    # are reconciled from article_views_daily instead.
+    cur.execute("""
+        INSERT INTO article_view_counts
+            (article_slug, total_views, month_start, monthly_views)
+        SELECT article_slug, COUNT(*), DATE_TRUNC('month', CURRENT_DATE)::date,
+               COUNT(*) FILTER (
+                   WHERE view_date >= DATE_TRUNC('month', CURRENT_DATE)
+               )
+        FROM article_views
+        GROUP BY article_slug
+        ON CONFLICT (article_slug) DO NOTHING
+    """)
+
+
+@migration(5, "daily view rollup for admin analytics")
+def _article_views_daily(cur):
+    # Maintained by Article.record_views alongside the raw insert; the admin
+    # dashboard reads only this table. device_class indexes
+    # articles.DEVICE_CLASSES and referrer_host is '' for direct traffic.
+    # Existing history is rolled up by step 6, once raw rows carry a
+    # device_class.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS article_views_daily (
+            day DATE NOT NULL,
+            article_slug TEXT NOT NULL,
+            device_class SMALLINT NOT NULL,
+            referrer_host TEXT NOT NULL DEFAULT '',
+            views INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, article_slug, device_class, referrer_host)
+        )
+    """)
+
+
+# Device classes as step 6 stored them: a SMALLINT index into
+# ("Desktop", "Mobile", "Tablet", "Bot") (see articles.DEVICE_CLASSES).
+def _v6_device_code(user_agent):
+    ua = (user_agent or "").lower()
+    if not ua:
+        return 0
+    if any(b in ua for b in ("bot", "crawler", "spider", "slurp", "bingpreview")):
+        return 3
+    if "ipad" in ua or ("android" in ua and "mobile" not in ua) or "tablet" in ua:
+        return 2
+    if any(m in ua for m in ("mobi", "iphone", "ipod", "android", "phone")):
+        return 1
+    return 0
+
+
+@migration(6, "classify article_views devices at ingestion")
+def _article_views_device_class(cur):
+    cur.execute(
+        "ALTER TABLE article_views ADD COLUMN IF NOT EXISTS device_class SMALLINT"
+    )
+    # Classify each distinct user agent once in Python, then update in SQL.
+    cur.execute(
+        "SELECT DISTINCT user_agent FROM article_views "
+        "WHERE device_class IS NULL AND user_agent IS NOT NULL"
+    )
+    codes = [(ua, _v6_device_code(ua)) for (ua,) in cur.fetchall()]
+    if codes:
+        execute_values(
+            cur,
+            """
+            UPDATE article_views v SET device_class = m.code
+            FROM (VALUES %s) AS m(user_agent, code)
+            WHERE v.device_class IS NULL AND v.user_agent = m.user_agent
+            """,
+            codes,
+            page_size=1000,
+        )
+    cur.execute(
+        "UPDATE article_views SET device_class = %s WHERE device_class IS NULL",
+        (_v6_device_code(None),),
+    )
+    cur.execute("""
+        ALTER TABLE article_views
+            ALTER COLUMN device_class SET DEFAULT 0,
+            ALTER COLUMN device_class SET NOT NULL
+    """)
+    # Roll up the existing history from the raw rows.
+    cur.execute(
+        "DELETE FROM article_views_daily "
+        "WHERE day >= (SELECT MIN(view_date) FROM article_views)"
+    )
+    cur.execute("""
+        INSERT INTO article_views_daily
+            (day, article_slug, device_class, referrer_host, views)
+        SELECT view_date, article_slug, device_class,
+               COALESCE(referrer_host, ''), COUNT(*)
+        FROM article_views
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def _v7_add_months(month, n):
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+@migration(7, "partition article_views by month")
+def _partition_article_views(cur):
+    cur.execute(
+        "SELECT c.relkind FROM pg_class c "
+        "WHERE c.relname = 'article_views' AND c.relkind IN ('r', 'p')"
+    )
+    row = cur.fetchone()
+    if row and row[0] == "p":
+        return
+    # The UNIQUE dedupe key must include the partition column, which it
+    # already does. The separate viewed_at and article_slug indexes are not
+    # carried over: nothing reads raw views by time any more, and slug
+    # lookups use the leading column of the dedupe key.
+    cur.execute("""
+        CREATE TABLE article_views_partitioned (
+            id BIGINT GENERATED BY DEFAULT AS IDENTITY,
+            article_slug TEXT NOT NULL,
+            ip_address TEXT NOT NULL,
+            user_agent TEXT,
+            viewed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            view_date DATE NOT NULL DEFAULT CURRENT_DATE,
+            referrer_host TEXT,
+            device_class SMALLINT NOT NULL DEFAULT 0,
+            PRIMARY KEY (id, view_date),
+            UNIQUE (article_slug, ip_address, view_date)
+        ) PARTITION BY RANGE (view_date)
+    """)
+    cur.execute(
+        "CREATE TABLE article_views_default "
+        "PARTITION OF article_views_partitioned DEFAULT"
+    )
+    cur.execute("SELECT MIN(view_date) FROM article_views")
+    first = cur.fetchone()[0]
+    cur.execute("ALTER TABLE article_views RENAME TO article_views_unpartitioned")
+    cur.execute("ALTER TABLE article_views_partitioned RENAME TO article_views")
+    # One partition per month from the oldest view through three months
+    # ahead (view_partitions naming), created before the copy so no row
+    # lands in DEFAULT.
+    today = date.today()
+    month = (first or today).replace(day=1)
+    last = _v7_add_months(today.replace(day=1), 3)
+    while month <= last:
+        cur.execute(
+            f"""
+            CREATE TABLE article_views_y{month.year:04d}m{month.month:02d}
+            PARTITION OF article_views
+            FOR VALUES FROM (%s) TO (%s)
+            """,  # noqa: S608 — name built from a date, values bound
+            (month, _v7_add_months(month, 1)),
+        )
+        month = _v7_add_months(month, 1)
+    cur.execute("""
+        INSERT INTO article_views
+            (id, article_slug, ip_address, user_agent, viewed_at, view_date,
+             referrer_host, device_class)
+        SELECT id, article_slug, ip_address, user_agent, viewed_at, view_date,
+               referrer_host, device_class
+        FROM article_views_unpartitioned
+    """)
+    cur.execute("""
+        SELECT setval(
+            pg_get_serial_sequence('article_views', 'id'),
+            GREATEST((SELECT MAX(id) FROM article_views), 1)
+        )
+    """)
+    cur.execute("DROP TABLE article_views_unpartitioned")
+
+
+@migration(8, "articles.updated_at for conditional GET")
+def _article_updated_at(cur):
+    # Set by save_article/update_article; drives ETag / Last-Modified on
+    # article pages and the listing version. Existing rows start from their
+    # publication date.
+    cur.execute("ALTER TABLE articles ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP")
+    cur.execute(
+        "UPDATE articles SET updated_at = date_published WHERE updated_at IS NULL"
+    )
+    cur.execute("""
+        ALTER TABLE articles
+            ALTER COLUMN updated_at SET DEFAULT CURRENT_TIMESTAMP,
+            ALTER COLUMN updated_at SET NOT NULL
+    """)
+
+
+@migration(9, "related_articles recommendations")
+def _related_articles(cur):
+    # Filled by `flask refresh-related`; see related.py.
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS related_articles (
+            article_slug TEXT NOT NULL,
+            rank SMALLINT NOT NULL,
+            related_slug TEXT NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (article_slug, rank)
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS related_articles_state (
+            article_slug TEXT PRIMARY KEY,
+            content_updated_at TIMESTAMP
+        )
+    """)
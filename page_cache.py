@@ -0,0 +1,493 @@
+"""Tag-versioned cache for rendered pages and shared data.
+
+Flask-Caching's @cache.cached builds keys from the request (path, hashed query
+string), so invalidating by guessing those keys missed entries such as blog
+search pages. Here every entry is stored with the versions of the tags it
+depends on (e.g. `article:<slug>`, `list:blog`, `projects`, `settings`), and
+purging a tag just bumps its version: entries stamped with an older version
+are treated as misses wherever they live. A missing tag version (never set,
+or evicted by Redis) also reads as a miss, so purges fail closed.
+
+Every entry carries the global SITE_TAG; purging it empties the whole cache
+without cache.clear().
+
+In front of a shared backend (Redis), a small in-process LRU (L1) serves hot
+entries without a network round trip or unpickle; see TaggedCache.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, copy_current_request_context, request
+
+from compression import compress_variants, negotiate
+
+logger = logging.getLogger(__name__)
+
+SITE_TAG = "site"
+_TAG_PREFIX = "tag:"
+
+
+def _new_version() -> str:
+    return uuid.uuid4().hex[:12]
+
+
+def _tag_key(tag: str) -> str:
+    return _TAG_PREFIX + tag
+
+
+class LocalLRU:
+    """Bounded in-process LRU with a TTL per entry (the L1 tier)."""
+
+    def __init__(self, max_entries=256, ttl=30.0):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] <= now:
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+            }
+
+
+class TaggedCache:
+    """Tag-aware get/set/purge on top of a Flask-Caching `Cache` (L2).
+
+    With `l1` (a LocalLRU), entries and tag versions are also kept in
+    process. Tag versions are re-read from L2 at most every `tag_ttl`
+    seconds, so a purge made by another instance is honored within that
+    window while hot entries are served without a network round trip.
+
+    Recomputation locks are Redis locks when `lock_client` is given (so
+    single-flight holds across instances) and per-process locks otherwise.
+
+    Cached views store gzip (and brotli) variants of bodies of at least
+    `compress_min` bytes, built once at fill time; None disables this.
+    """
+
+    def __init__(
+        self,
+        cache,
+        key_prefix="tc:",
+        l1=None,
+        tag_ttl=2.0,
+        lock_client=None,
+        lock_wait=5.0,
+        compress_min=None,
+    ):
+        self._cache = cache
+        self.key_prefix = key_prefix
+        self.l1 = l1
+        self.tag_ttl = tag_ttl
+        self.lock_client = lock_client
+        self.lock_wait = lock_wait
+        self.compress_min = compress_min
+        self._lock = threading.Lock()
+        self._local_versions = {}  # tag -> (expires_at, version)
+        self._local_locks = weakref.WeakValueDictionary()
+        self._l2 = {
+            "hits": 0,
+            "misses": 0,
+            "errors": 0,
+            "tag_fetches": 0,
+            "waited": 0,
+            "stale_served": 0,
+        }
+
+    def _count(self, name):
+        with self._lock:
+            self._l2[name] += 1
+
+    def _tags(self, tags) -> tuple[str, ...]:
+        return tuple(dict.fromkeys((SITE_TAG, *(tags or ()))))
+
+    def _remember_versions(self, tags, versions):
+        if self.l1 is None:
+            return
+        expires = time.monotonic() + self.tag_ttl
+        with self._lock:
+            for tag, version in zip(tags, versions, strict=True):
+                if version is not None:
+                    self._local_versions[tag] = (expires, version)
+
+    def _current_versions(self, tags) -> list[str | None]:
+        """Tag versions, from memory when fresh enough, else one L2 round trip."""
+        now = time.monotonic()
+        with self._lock:
+            local = [self._local_versions.get(t) for t in tags]
+        versions = [v[1] if v and v[0] > now else None for v in local]
+        stale = [t for t, v in zip(tags, versions, strict=True) if v is None]
+        if stale:
+            self._count("tag_fetches")
+            fetched = dict(
+                zip(stale, self._cache.get_many(*map(_tag_key, stale)), strict=True)
+            )
+            self._remember_versions(stale, [fetched[t] for t in stale])
+            versions = [
+                v if v is not None else fetched[t]
+                for t, v in zip(tags, versions, strict=True)
+            ]
+        return versions
+
+    def _ensure_versions(self, tags) -> dict[str, str | None]:
+        keys = [_tag_key(t) for t in tags]
+        versions = dict(zip(tags, self._cache.get_many(*keys), strict=True))
+        missing = [tag for tag, version in versions.items() if version is None]
+        if missing:
+            for tag in missing:
+                # add() keeps a version another instance set concurrently.
+                self._cache.add(_tag_key(tag), _new_version(), timeout=0)
+            versions = dict(zip(tags, self._cache.get_many(*keys), strict=True))
+        self._remember_versions(tags, list(versions.values()))
+        return versions
+
+    @staticmethod
+    def _valid(entry, tags, versions) -> bool:
+        stamped = entry.get("tags", {})
+        return all(
+            version is not None and stamped.get(tag) == version
+            for tag, version in zip(tags, versions, strict=True)
+        )
+
+    def get_entry(self, key, tags=()):
+        """Return the stored entry dict (value plus freshness), or None if
+        missing or purged."""
+        tags = self._tags(tags)
+        full_key = self.key_prefix + key
+        try:
+            if self.l1 is not None:
+                entry = self.l1.get(full_key)
+                if entry is not None:
+                    if self._valid(entry, tags, self._current_versions(tags)):
+                        return entry
+                    self.l1.delete(full_key)
+            values = self._cache.get_many(full_key, *(_tag_key(t) for t in tags))
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return None
+        entry, current = values[0], values[1:]
+        self._remember_versions(tags, current)
+        if entry is None or not self._valid(entry, tags, current):
+            self._count("misses")
+            return None
+        self._count("hits")
+        if self.l1 is not None:
+            self.l1.set(full_key, entry, ttl=entry.get("ttl"))
+        return entry
+
+    def get(self, key, tags=()):
+        """Return the cached value, or None if missing or purged."""
+        entry = self.get_entry(key, tags)
+        return entry["value"] if entry is not None else None
+
+    def set(self, key, value, tags=(), timeout=None, grace=0):
+        """Store `value`; it counts as fresh for `timeout` seconds and may be
+        served stale (see cached()) for `grace` seconds after that."""
+        tags = self._tags(tags)
+        ttl = timeout + grace if timeout else None
+        try:
+            versions = self._ensure_versions(tags)
+            if None in versions.values():
+                return False
+            entry = {
+                "value": value,
+                "tags": versions,
+                "ttl": ttl,
+                "fresh_until": time.time() + timeout if timeout else None,
+            }
+            self._cache.set(self.key_prefix + key, entry, timeout=ttl)
+            if self.l1 is not None:
+                self.l1.set(self.key_prefix + key, entry, ttl=ttl)
+            return True
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Cache write failed for {key}: {e}")
+            return False
+
+    def tag_versions(self, tags=()):
+        """Current versions of `tags` (plus SITE_TAG), creating missing ones.
+
+        Lets process-local data follow purges: rebuild it when this changes.
+        None if the cache cannot tell (NullCache, or an error).
+        """
+        tags = self._tags(tags)
+        try:
+            versions = self._current_versions(tags)
+            if None in versions:
+                versions = list(self._ensure_versions(tags).values())
+        except Exception as e:
+            self._count("errors")
+            logger.warning(f"Tag version lookup failed for {tags}: {e}")
+            return None
+        if None in versions:
+            return None
+        return tuple(versions)
+
+    def purge(self, *tags) -> bool:
+        """Invalidate every entry stamped with any of `tags`."""
+        try:
+            for tag in tags:
+                version = _new_version()
+                self._cache.set(_tag_key(tag), version, timeout=0)
+                self._remember_versions((tag,), (version,))
+            logger.info(f"Cache purged for tags: {', '.join(tags)}")
+            return True
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"Cache purge failed for tags {tags}: {e}")
+            return False
+
+    def stats(self) -> dict:
+        with self._lock:
+            l2 = dict(self._l2)
+        return {
+            "l1": self.l1.stats() if self.l1 is not None else None,
+            "l2": {k: l2[k] for k in ("hits", "misses", "errors", "tag_fetches")},
+            "single_flight_waits": l2["waited"],
+            "stale_served": l2["stale_served"],
+        }
+
+    def _key_lock(self, key):
+        if self.lock_client is not None:
+            return _RedisKeyLock(self.lock_client, "lock:" + self.key_prefix + key)
+        with self._lock:
+            lock = self._local_locks.get(key)
+            if lock is None:
+                lock = threading.Lock()
+                self._local_locks[key] = lock
+        return _LocalKeyLock(lock)
+
+    def _compute(self, key, tags, f, args, kwargs, timeout, grace, compress_min):
+        rv = f(*args, **kwargs)
+        stored = _freeze(rv, compress_min)
+        if stored is None:
+            return rv
+        self.set(key, stored, tags, timeout=timeout, grace=grace)
+        return _restore(stored)
+
+    def _compute_once(self, key, tags, f, args, kwargs, timeout, grace, compress_min):
+        """Single-flight miss: one worker renders, the rest wait for its
+        result (up to lock_wait seconds, then render themselves)."""
+        lock = self._key_lock(key)
+        acquired = lock.acquire(self.lock_wait)
+        try:
+            if acquired:
+                entry = self.get_entry(key, tags)
+                if entry is not None and _is_fresh(entry):
+                    self._count("waited")
+                    return _restore(entry["value"])
+            return self._compute(
+                key, tags, f, args, kwargs, timeout, grace, compress_min
+            )
+        finally:
+            if acquired:
+                lock.release()
+
+    def _refresh_in_background(
+        self, key, tags, f, args, kwargs, timeout, grace, compress_min
+    ):
+        lock = self._key_lock(key)
+        if not lock.acquire(0):
+            return  # another worker is already refreshing
+        self._count("stale_served")
+
+        @copy_current_request_context
+        def refresh():
+            try:
+                self._compute(key, tags, f, args, kwargs, timeout, grace, compress_min)
+            except Exception as e:
+                logger.warning(f"Background refresh failed for {key}: {e}")
+            finally:
+                lock.release()
+
+        threading.Thread(target=refresh, name="page-cache-refresh", daemon=True).start()
+
+    def cached(
+        self,
+        timeout=360,
+        tags=(),
+        query_string=False,
+        grace=0,
+        compress_min=None,
+        unless=None,
+    ):
+        """Cache a view's successful responses under the request path.
+
+        `tags` is a tuple of tag names or a callable taking the view's keyword
+        arguments and returning them. With query_string=True the sorted query
+        arguments are part of the key.
+
+        Misses are single-flight per key. For `grace` seconds after `timeout`
+        the stale response is served while one worker re-renders it in a
+        background thread. Purged entries are never served stale.
+
+        `compress_min` overrides the cache-wide compression threshold for this
+        view. Responses carry `Vary: Accept-Encoding` whenever variants exist.
+
+        When `unless()` returns true the view runs uncached and its response
+        is neither stored nor replaced by a cached one.
+        """
+        if compress_min is None:
+            compress_min = self.compress_min
+
+        def decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                if unless is not None and unless():
+                    return f(*args, **kwargs)
+                key = self.request_key(query_string)
+                entry_tags = tags(**kwargs) if callable(tags) else tags
+                entry = self.get_entry(key, entry_tags)
+                if entry is not None:
+                    if not _is_fresh(entry):
+                        self._refresh_in_background(
+                            key,
+                            entry_tags,
+                            f,
+                            args,
+                            kwargs,
+                            timeout,
+                            grace,
+                            compress_min,
+                        )
+                    return _restore(entry["value"])
+                return self._compute_once(
+                    key, entry_tags, f, args, kwargs, timeout, grace, compress_min
+                )
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def request_key(query_string=False) -> str:
+        key = "view:" + request.path
+        if query_string and request.args:
+            args = sorted(request.args.items(multi=True))
+            digest = hashlib.md5(repr(args).encode(), usedforsecurity=False)
+            key += "?" + digest.hexdigest()
+        return key
+
+
+class _LocalKeyLock:
+    def __init__(self, lock):
+        self._lock = lock
+
+    def acquire(self, wait) -> bool:
+        return (
+            self._lock.acquire(timeout=wait) if wait > 0 else self._lock.acquire(False)
+        )
+
+    def release(self):
+        self._lock.release()
+
+
+class _RedisKeyLock:
+    # Held at most LOCK_TTL seconds, so a worker that dies mid-render (or a
+    # frozen serverless instance) cannot block recomputation for long.
+    LOCK_TTL = 30
+
+    def __init__(self, client, name):
+        # thread_local=False: background refreshes release from another thread.
+        self._lock = client.lock(name, timeout=self.LOCK_TTL, thread_local=False)
+
+    def acquire(self, wait) -> bool:
+        try:
+            return self._lock.acquire(blocking=wait > 0, blocking_timeout=wait or None)
+        except Exception as e:
+            logger.warning(f"Cache lock unavailable: {e}")
+            return False
+
+    def release(self):
+        try:
+            self._lock.release()
+        except Exception as e:
+            logger.debug(f"Cache lock release failed: {e}")
+
+
+def _is_fresh(entry) -> bool:
+    fresh_until = entry.get("fresh_until")
+    return fresh_until is None or fresh_until > time.time()
+
+
+def _freeze(rv, compress_min=None):
+    """Picklable form of a view's return value, with precompressed variants
+    of its body; None if it must not be cached."""
+    if isinstance(rv, str):
+        body, content_type, headers = rv.encode(), "text/html; charset=utf-8", []
+    elif (
+        isinstance(rv, Response)
+        and rv.status_code == 200
+        and not rv.is_streamed
+        and "Content-Encoding" not in rv.headers
+    ):
+        body, content_type = rv.get_data(), rv.content_type
+        headers = list(rv.headers.items())
+    else:
+        return None
+    variants = compress_variants(body, content_type, compress_min)
+    if isinstance(rv, str) and not variants:
+        return ("text", rv)
+    return ("response", body, content_type, headers, variants)
+
+
+def _restore(frozen):
+    if frozen[0] == "text":
+        return frozen[1]
+    _, body, content_type, headers, *rest = frozen
+    variants = rest[0] if rest else {}
+    response = Response(body, content_type=content_type)
+    for name, value in headers:
+        if name.lower() not in ("content-length", "content-type"):
+            response.headers.add(name, value)  # keeps repeated headers
+    if variants:
+        response.vary.add("Accept-Encoding")
+        encoding = negotiate(request.headers.get("Accept-Encoding"), variants)
+        if encoding is not None:
+            response.set_data(variants[encoding])
+            response.headers["Content-Encoding"] = encoding
+    return response
@@ -32,7 +32,7 @@ def main() -> int:
                 """
             )
             if cur.fetchone() is None:
-                print("articles.search_vector column is missing. Run init_db().")
+                print("search_vector column is missing. Run `flask --app app migrate`.")
                 return 1
 
             cur.execute("SELECT COUNT(*) FROM articles WHERE is_published = TRUE")
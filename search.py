@@ -1,21 +1,214 @@
+import hashlib
 import logging
-from dataclasses import dataclass
+import os
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
 
+from markupsafe import Markup, escape
+
+from articles import _LISTING_COLUMNS, Article, ArticleListing
 from database import get_db
+from fallback_search import FallbackSearch
+from spelling import Lexicon
 
 logger = logging.getLogger(__name__)
 
 
 @dataclass
 class SearchResult:
-    slugs: list[str]
-    total: int
+    articles: list[ArticleListing] = field(default_factory=list)
+    total: int = 0
     degraded: bool = False
+    # "postgres", or "memory" when served by the in-process fallback index.
+    source: str = "postgres"
+
+    @property
+    def slugs(self) -> list[str]:
+        return [article.slug for article in self.articles]
+
+
+def normalize_query(query: str) -> str:
+    """Cache identity of a query: lowercased, whitespace collapsed."""
+    return " ".join((query or "").lower().split())
+
+
+class SearchCache:
+    """Search results per (normalized query, page, per_page).
+
+    Stored in a page_cache.TaggedCache under `tags`, so purging the content
+    tag on publish, edit or delete drops every cached result at once.
+    Highlighted snippets are kept the same way per (normalized query, slug).
+    """
+
+    def __init__(self, cache, tags=(), timeout=600):
+        self._cache = cache
+        self.tags = tuple(tags)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query, page, per_page) -> str:
+        digest = hashlib.md5(normalize_query(query).encode(), usedforsecurity=False)
+        return f"search:{digest.hexdigest()}:{page}:{per_page}"
+
+    def get(self, query, page, per_page):
+        result = self._cache.get(self.key(query, page, per_page), self.tags)
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return result
+
+    def set(self, query, page, per_page, result):
+        self._cache.set(
+            self.key(query, page, per_page), result, self.tags, timeout=self.timeout
+        )
+
+    def _snippet_key(self, query, slug) -> str:
+        digest = hashlib.md5(normalize_query(query).encode(), usedforsecurity=False)
+        return f"snippet:{digest.hexdigest()}:{slug}"
+
+    def get_snippet(self, query, slug):
+        return self._cache.get(self._snippet_key(query, slug), self.tags)
+
+    def set_snippet(self, query, slug, snippet):
+        self._cache.set(
+            self._snippet_key(query, slug), snippet, self.tags, timeout=self.timeout
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / lookups, 3) if lookups else None,
+        }
+
+
+@dataclass(frozen=True)
+class Suggestion:
+    title: str
+    slug: str
+
+
+class SuggestIndex:
+    """In-memory prefix index over published titles and words, for typeahead.
+
+    Every word-boundary suffix of a normalized title is a key ("flask tips",
+    "tips"), so a prefix matches the start of the title or of any word in it.
+    `terms` are (word, ndoc) pairs, e.g. Article.get_lexicon(), used to
+    complete the last word of a query. Keys are kept sorted and a lookup is
+    one bisect plus a scan of the matching run, bounded by `max_scan` keys
+    and a time budget.
+    """
+
+    MIN_PREFIX = 2
+
+    def __init__(self, titles, terms=(), max_scan=200, budget_ms=20.0):
+        entries = []
+        for slug, title in titles:
+            words = normalize_query(title).split()
+            for i in range(len(words)):
+                entries.append((" ".join(words[i:]), i, title, slug))
+        entries.sort()
+        self._keys = [entry[0] for entry in entries]
+        self._entries = entries
+        terms = sorted(
+            (word, ndoc) for word, ndoc in terms if len(word) > self.MIN_PREFIX
+        )
+        self._words = [word for word, _ in terms]
+        self._ndocs = [ndoc for _, ndoc in terms]
+        self.max_scan = max_scan
+        self.budget_ms = budget_ms
+
+    def __len__(self):
+        return len(self._entries)
+
+    def suggest(self, prefix, limit=8) -> list[Suggestion]:
+        """Titles matching `prefix`, title-start matches first."""
+        prefix = normalize_query(prefix)
+        if len(prefix) < self.MIN_PREFIX:
+            return []
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        start = bisect_left(self._keys, prefix)
+        best = {}  # slug -> (word position, title)
+        for key, position, title, slug in self._entries[start : start + self.max_scan]:
+            if not key.startswith(prefix) or time.perf_counter() > deadline:
+                break
+            if slug not in best or position < best[slug][0]:
+                best[slug] = (position, title)
+        ranked = sorted(best.items(), key=lambda item: (item[1][0] > 0, item[1][1]))
+        return [Suggestion(title, slug) for slug, (_, title) in ranked[:limit]]
+
+    def complete(self, prefix, limit=5) -> list[str]:
+        """`prefix` with its last word completed to indexed words, those used
+        by the most articles first."""
+        words = normalize_query(prefix).split()
+        if not words or len(words[-1]) < self.MIN_PREFIX:
+            return []
+        head, last = words[:-1], words[-1]
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        start = bisect_left(self._words, last)
+        found = []
+        for i in range(start, min(start + self.max_scan, len(self._words))):
+            word = self._words[i]
+            if not word.startswith(last) or time.perf_counter() > deadline:
+                break
+            if word != last:
+                found.append((-self._ndocs[i], word))
+        found.sort()
+        return [" ".join([*head, word]) for _, word in found[:limit]]
+
+
+# ts_headline marks matches with these; they survive HTML escaping and are
+# then swapped for <mark> tags.
+_MARK_START, _MARK_STOP = "\x01", "\x02"
+_HEADLINE_OPTIONS = (
+    f"StartSel={_MARK_START}, StopSel={_MARK_STOP}, MaxWords=35, MinWords=15, "
+    'MaxFragments=2, FragmentDelimiter=" … "'
+)
+
+
+def render_snippet(headline) -> Markup:
+    """HTML-safe snippet from a ts_headline result: text escaped, matches
+    wrapped in <mark>."""
+    html = escape(headline or "")
+    if html.count(_MARK_START) != html.count(_MARK_STOP):
+        return html.replace(_MARK_START, "").replace(_MARK_STOP, "")
+    return html.replace(_MARK_START, Markup("<mark>")).replace(
+        _MARK_STOP, Markup("</mark>")
+    )
 
 
 class PostgresSearchService:
-    def __init__(self):
+    """Postgres full-text search with an optional result cache and an
+    in-process BM25 fallback for when Postgres errors or exceeds
+    `timeout_ms`. With `prefer_fallback`, a built fallback index answers
+    first. A spelling `lexicon` proposes corrections for empty results."""
+
+    def __init__(
+        self,
+        cache=None,
+        fallback=None,
+        timeout_ms=0,
+        prefer_fallback=False,
+        snippet_chars=20000,
+        lexicon=None,
+    ):
         self._column_checked = False
+        self.cache = cache
+        self.snippet_chars = snippet_chars
+        self.fallback = fallback
+        self.timeout_ms = timeout_ms
+        self.prefer_fallback = prefer_fallback
+        self.lexicon = lexicon
 
     def is_enabled(self) -> bool:
         return True
@@ -38,7 +231,7 @@ class PostgresSearchService:
             if cur.fetchone() is None:
                 logger.warning(
                     "articles.search_vector column missing. "
-                    "Run init_db() to create it before searching."
+                    "Run `flask --app app migrate` to create it before searching."
                 )
                 return False
             self._column_checked = True
@@ -47,58 +240,166 @@ class PostgresSearchService:
             logger.warning("Failed verifying search_vector column: %s", exc)
             return False
 
-    def search_published_slugs(
-        self, query: str, page: int, per_page: int
-    ) -> SearchResult:
+    def search_published(self, query: str, page: int, per_page: int) -> SearchResult:
+        """One page of ranked published listings plus the total match count.
+
+        Rows and total come back in a single round trip (COUNT(*) OVER ()).
+        Only a page past the last match needs a separate count. Results are
+        served from `self.cache` (a SearchCache) when one is set.
+        """
         clean_query = (query or "").strip()
         if not clean_query:
-            return SearchResult(slugs=[], total=0, degraded=False)
-
-        if not self.ensure_index():
-            return SearchResult(slugs=[], total=0, degraded=True)
+            return SearchResult()
 
         page = max(1, page)
         per_page = max(1, per_page)
-        from_ = (page - 1) * per_page
+        if self.cache is not None:
+            cached = self.cache.get(clean_query, page, per_page)
+            if cached is not None:
+                return cached
+
+        if self.prefer_fallback and self.fallback is not None and self.fallback.ready:
+            return self._fallback_query(clean_query, page, per_page)
+
+        if self.ensure_index():
+            result = self._query(clean_query, page, per_page)
+        else:
+            result = SearchResult(degraded=True)
+        if not result.degraded:
+            if self.cache is not None:
+                self.cache.set(clean_query, page, per_page, result)
+            return result
+        if self.fallback is not None:
+            return self._fallback_query(clean_query, page, per_page)
+        return result
+
+    def highlight(self, query: str, slugs) -> dict[str, Markup]:
+        """Matching passages for one page of results, keyed by slug.
+
+        ts_headline runs only for slugs not already cached, in one query,
+        over at most `snippet_chars` characters of the stored plain text.
+        Runs under the same statement_timeout as searches. Missing slugs (or
+        a failed or timed-out query) just get no snippet.
+        """
+        clean_query = (query or "").strip()
+        if not clean_query or not slugs:
+            return {}
+        snippets = {}
+        missing = []
+        for slug in slugs:
+            cached = self.cache.get_snippet(clean_query, slug) if self.cache else None
+            if cached is None:
+                missing.append(slug)
+            else:
+                snippets[slug] = cached
+        if not missing:
+            return snippets
 
         conn = get_db()
         if conn is None:
-            return SearchResult(slugs=[], total=0, degraded=True)
-
+            return snippets
         try:
             cur = conn.cursor()
+            self._begin(cur)
             cur.execute(
                 """
                 SELECT slug,
-                       ts_rank(search_vector, tsq) AS rank
+                       ts_headline('english', left(body_text, %s), tsq, %s)
                 FROM articles, websearch_to_tsquery('english', %s) AS tsq
-                WHERE search_vector @@ tsq
-                  AND is_published = TRUE
-                ORDER BY rank DESC, date_published DESC
-                LIMIT %s OFFSET %s
+                WHERE slug = ANY(%s) AND is_published = TRUE
                 """,
-                (clean_query, per_page, from_),
+                (self.snippet_chars, _HEADLINE_OPTIONS, clean_query, missing),
             )
-            slugs = [row[0] for row in cur.fetchall() if row[0]]
+            rows = cur.fetchall()
+            self._commit(cur)
+        except Exception as exc:
+            logger.warning("Snippet generation failed for '%s': %s", clean_query, exc)
+            self._rollback(conn)
+            return snippets
+        for slug, headline in rows:
+            snippet = render_snippet(headline)
+            snippets[slug] = snippet
+            if self.cache is not None:
+                self.cache.set_snippet(clean_query, slug, snippet)
+        return snippets
+
+    def did_you_mean(self, query: str) -> str | None:
+        """A corrected query for one that found nothing, or None."""
+        if self.lexicon is None:
+            return None
+        return self.lexicon.correct(query)
 
+    def _fallback_query(self, clean_query, page, per_page) -> SearchResult:
+        found = self.fallback.search(clean_query, (page - 1) * per_page, per_page)
+        if found is None:
+            return SearchResult(degraded=True)
+        articles, total = found
+        return SearchResult(articles=articles, total=total, source="memory")
+
+    def _query(self, clean_query, page, per_page) -> SearchResult:
+        from_ = (page - 1) * per_page
+        conn = get_db()
+        if conn is None:
+            return SearchResult(degraded=True)
+
+        try:
+            cur = conn.cursor()
+            self._begin(cur)
             cur.execute(
-                """
-                SELECT COUNT(*)
+                f"""
+                SELECT {_LISTING_COLUMNS}, COUNT(*) OVER () AS total
                 FROM articles, websearch_to_tsquery('english', %s) AS tsq
                 WHERE search_vector @@ tsq
                   AND is_published = TRUE
-                """,
-                (clean_query,),
+                ORDER BY ts_rank(search_vector, tsq) DESC, date_published DESC
+                LIMIT %s OFFSET %s
+                """,  # noqa: S608 — fixed column fragment, values bound
+                (clean_query, per_page, from_),
             )
-            total_row = cur.fetchone()
-            total = int(total_row[0]) if total_row else 0
+            rows = cur.fetchall()
+            if rows:
+                total = int(rows[0][-1])
+            elif from_:
+                cur.execute(
+                    """
+                    SELECT COUNT(*)
+                    FROM articles, websearch_to_tsquery('english', %s) AS tsq
+                    WHERE search_vector @@ tsq
+                      AND is_published = TRUE
+                    """,
+                    (clean_query,),
+                )
+                total_row = cur.fetchone()
+                total = int(total_row[0]) if total_row else 0
+            else:
+                total = 0
+            self._commit(cur)
 
-            return SearchResult(slugs=slugs, total=total, degraded=False)
+            articles = [ArticleListing._from_row(row[:-1]) for row in rows]
+            return SearchResult(articles=articles, total=total, degraded=False)
         except Exception as exc:
             logger.warning(
                 "Postgres search failed for query '%s': %s", clean_query, exc
             )
-            return SearchResult(slugs=[], total=0, degraded=True)
+            self._rollback(conn)
+            return SearchResult(degraded=True)
+
+    def _begin(self, cur):
+        # Connections are autocommit: scope the timeout to this statement.
+        if self.timeout_ms:
+            cur.execute("BEGIN")
+            cur.execute("SET LOCAL statement_timeout = %s", (int(self.timeout_ms),))
+
+    def _commit(self, cur):
+        if self.timeout_ms:
+            cur.execute("COMMIT")
+
+    def _rollback(self, conn):
+        if self.timeout_ms:
+            try:
+                conn.cursor().execute("ROLLBACK")
+            except Exception as exc:
+                logger.warning("Search rollback failed: %s", exc)
 
 
 _SEARCH_SERVICE = None
@@ -107,5 +408,13 @@ _SEARCH_SERVICE = None
 def get_search_service() -> PostgresSearchService:
     global _SEARCH_SERVICE
     if _SEARCH_SERVICE is None:
-        _SEARCH_SERVICE = PostgresSearchService()
+        _SEARCH_SERVICE = PostgresSearchService(
+            fallback=FallbackSearch(
+                Article.get_search_snapshot, Article.get_search_document
+            ),
+            timeout_ms=int(os.getenv("SEARCH_TIMEOUT_MS", "800")),
+            prefer_fallback=os.getenv("SEARCH_PREFER_MEMORY") == "1",
+            snippet_chars=int(os.getenv("SEARCH_SNIPPET_CHARS", "20000")),
+            lexicon=Lexicon(Article.get_lexicon, Article.get_article_words),
+        )
     return _SEARCH_SERVICE
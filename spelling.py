@@ -0,0 +1,188 @@
+"""Spelling ("did you mean") corrections from a lexicon of words used on the site.
+
+The lexicon holds the words of published articles (from ts_stat, see
+Article.get_lexicon) in a deletion-neighbourhood index: every word is filed
+under itself and each string one deleted character away. A typo is looked
+up under its own deletions (two deep for long words), which finds every
+single edit, including a swap of neighbouring letters, and most double edits,
+with a few dict lookups instead of a scan of the vocabulary. Candidates are
+then checked with an exact edit distance. Corrections are memoized;
+publishing or editing an article adds its words without a rebuild.
+"""
+
+import logging
+import re
+import threading
+import time
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z]+")
+MIN_WORD = 3
+MAX_WORD = 24
+# Words this long or longer may be corrected by two edits, shorter ones by one.
+TWO_EDITS_FROM = 7
+
+
+def edit_distance(a, b, limit) -> int:
+    """Edit distance counting a swap of neighbouring letters as one edit
+    (optimal string alignment), or limit + 1 once it must exceed `limit`."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            )
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+def max_edits(word) -> int:
+    return 2 if len(word) >= TWO_EDITS_FROM else 1
+
+
+def _deletions(word) -> set[str]:
+    return {word[:i] + word[i + 1 :] for i in range(len(word))}
+
+
+class SpellingIndex:
+    """Words with document frequencies, filed under their one-letter
+    deletions."""
+
+    def __init__(self):
+        self._freq = {}  # word -> ndoc
+        self._by_key = {}  # word or deletion -> [word, ...]
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._freq)
+
+    def __contains__(self, word):
+        return word in self._freq
+
+    def add(self, word, freq=1):
+        with self._lock:
+            if word in self._freq:
+                self._freq[word] = max(self._freq[word], freq)
+                return
+            self._freq[word] = freq
+            for key in _deletions(word) | {word}:
+                self._by_key.setdefault(key, []).append(word)
+
+    def lookup(self, word, limit) -> list[tuple[int, int, str]]:
+        """(distance, -freq, word) for indexed words within `limit` edits,
+        best first."""
+        keys = _deletions(word) | {word}
+        if limit >= 2:
+            for key in list(keys):
+                keys |= _deletions(key)
+        candidates = set()
+        for key in keys:
+            candidates.update(self._by_key.get(key, ()))
+        found = []
+        for candidate in candidates:
+            d = edit_distance(word, candidate, limit)
+            if d <= limit:
+                found.append((d, -self._freq[candidate], candidate))
+        found.sort()
+        return found
+
+
+class Lexicon:
+    """Lazily loaded SpellingIndex plus memoized query corrections.
+
+    `load_words()` returns [(word, ndoc), ...] or None, and
+    `load_article(slug)` the words of one article. A lexicon older than
+    `max_age` seconds is rebuilt on next use; after a failed load, no new
+    attempt is made for `retry_after` seconds.
+    """
+
+    def __init__(self, load_words, load_article, max_age=3600, retry_after=60):
+        self._load_words = load_words
+        self._load_article = load_article
+        self.max_age = max_age
+        self.retry_after = retry_after
+        self._index = None
+        self._built_at = 0.0
+        self._failed_at = None
+        self._build_lock = threading.Lock()
+        self._correct_word = lru_cache(maxsize=4096)(self._uncached_correct_word)
+
+    def _usable(self) -> bool:
+        now = time.monotonic()
+        if self._index is not None and now - self._built_at < self.max_age:
+            return True
+        return self._failed_at is not None and now - self._failed_at < self.retry_after
+
+    def index(self):
+        """The index, building it if needed; None if the words could not be
+        loaded and none were loaded before."""
+        if self._usable():
+            return self._index
+        with self._build_lock:
+            if self._usable():
+                return self._index
+            words = self._load_words()
+            if words is None:
+                self._failed_at = time.monotonic()
+                return self._index
+            self._failed_at = None
+            index = SpellingIndex()
+            for word, freq in words:
+                if MIN_WORD <= len(word) <= MAX_WORD:
+                    index.add(word, freq)
+            self._index = index
+            self._built_at = time.monotonic()
+            self._correct_word.cache_clear()
+            logger.info("Built spelling lexicon with %d words", len(index))
+            return index
+
+    def add_article(self, slug):
+        """Add one article's words after publish or edit (no-op until the
+        lexicon has been built)."""
+        if self._index is None:
+            return
+        new = [
+            word
+            for word in self._load_article(slug)
+            if MIN_WORD <= len(word) <= MAX_WORD and word not in self._index
+        ]
+        for word in new:
+            self._index.add(word)
+        if new:
+            self._correct_word.cache_clear()
+
+    def _uncached_correct_word(self, word):
+        matches = self._index.lookup(word, max_edits(word))
+        return matches[0][2] if matches else None
+
+    def correct(self, query) -> str | None:
+        """`query` with unknown words replaced by their closest known word
+        (most used on ties), or None if no word could be corrected."""
+        index = self.index()
+        if index is None:
+            return None
+        corrected = []
+        changed = False
+        for word in _WORD_RE.findall((query or "").lower()):
+            fix = None
+            if MIN_WORD <= len(word) <= MAX_WORD and word not in index:
+                fix = self._correct_word(word)
+            if fix is not None:
+                changed = True
+                corrected.append(fix)
+            else:
+                corrected.append(word)
+        return " ".join(corrected) if changed else None
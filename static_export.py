@@ -0,0 +1,162 @@
+"""Pre-render public pages into a static tree (a mirror or archive of the site).
+
+Pages are rendered through the Flask app itself (test client, anonymous, no
+view recorded), so templates, filters and routes stay the single source of
+truth. Each URL is written where a static host would look for it:
+
+    /                  -> <out>/index.html
+    /blog/<slug>       -> <out>/blog/<slug>/index.html
+    /rss.xml           -> <out>/rss.xml
+
+A manifest (<out>/manifest.json) records the build id, each article's
+updated_at and a hash of every file written. An incremental run re-renders
+article pages only when the article changed (or the deploy did), removes
+pages of articles that were unpublished or deleted, and always re-renders the
+handful of site-wide pages, which read projects, settings and the listing.
+Files are only rewritten when their bytes change.
+
+The tree is a snapshot: publishing, editing or deleting an article does not
+touch it, which is why the deployment does not serve it (anonymous pages are
+cached at the edge and purged instead, see cdn.py). Re-run the export before
+publishing the tree anywhere.
+
+The view counter on exported article pages is filled in by the page's script
+from /api/views/<slug>, which also records the view.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# WSGI environ flag set on export requests; HTTP clients cannot set it.
+EXPORT_ENVIRON_KEY = "qblog.static_export"
+MANIFEST_NAME = "manifest.json"
+DEFAULT_OUTPUT_DIR = "export"
+SITE_URL = os.getenv("SITE_URL", "https://ollayor.uz")
+
+# Same for every anonymous visitor and not tied to a single article.
+SITE_PAGES = (
+    "/",
+    "/about",
+    "/for-llms",
+    "/talks",
+    "/projects",
+    "/rss.xml",
+    "/feed.xml",
+    "/sitemap.xml",
+    "/image-sitemap.xml",
+    "/robots.txt",
+)
+
+
+def article_path(slug: str) -> str:
+    return f"/blog/{slug}"
+
+
+def output_file(out_dir: Path, url_path: str) -> Path:
+    """Where `url_path` lives in the export tree."""
+    relative = url_path.strip("/")
+    if not relative:
+        return out_dir / "index.html"
+    if "." in relative.rsplit("/", 1)[-1]:
+        return out_dir / relative
+    return out_dir / relative / "index.html"
+
+
+def load_manifest(out_dir: Path) -> dict:
+    try:
+        return json.loads((out_dir / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_if_changed(
+    path: Path, body: bytes, old_hash: str | None
+) -> tuple[str, bool]:
+    digest = hashlib.sha256(body).hexdigest()
+    if digest == old_hash and path.exists():
+        return digest, False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(body)
+    tmp.replace(path)
+    return digest, True
+
+
+def _remove(out_dir: Path, url_path: str):
+    path = output_file(out_dir, url_path)
+    path.unlink(missing_ok=True)
+    if path.name == "index.html":
+        try:
+            path.parent.rmdir()
+        except OSError:
+            pass
+
+
+def export_site(app, versions, out_dir=DEFAULT_OUTPUT_DIR, build_id="", force=False):
+    """Render the public site into `out_dir`.
+
+    `versions` maps each published slug to its updated_at. Returns a dict of
+    url paths "written", "unchanged" and "removed", plus "failed" for pages
+    that did not render with a 200 (their previous file is kept).
+    """
+    out_dir = Path(out_dir)
+    manifest = load_manifest(out_dir)
+    full = force or manifest.get("build_id") != build_id
+    old_files = manifest.get("files", {})
+    old_articles = manifest.get("articles", {})
+    new_articles = {
+        slug: updated.isoformat() if updated else ""
+        for slug, updated in versions.items()
+    }
+
+    paths = list(SITE_PAGES)
+    for slug, stamp in new_articles.items():
+        if (
+            full
+            or old_articles.get(slug) != stamp
+            or article_path(slug) not in old_files
+        ):
+            paths.append(article_path(slug))
+
+    result = {"written": [], "unchanged": [], "removed": [], "failed": []}
+    files = {
+        path: digest for path, digest in old_files.items() if path not in SITE_PAGES
+    }
+    # Articles whose page failed are left out, so the next run retries them.
+    stored_articles = dict(new_articles)
+    client = app.test_client()
+    for path in paths:
+        response = client.get(
+            path,
+            base_url=SITE_URL,
+            environ_base={EXPORT_ENVIRON_KEY: True},
+        )
+        if response.status_code != 200:
+            logger.error("Static export of %s returned %s", path, response.status_code)
+            result["failed"].append(path)
+            if path in old_files:
+                files[path] = old_files[path]
+            if path.startswith("/blog/"):
+                stored_articles.pop(path.removeprefix("/blog/"), None)
+            continue
+        digest, changed = _write_if_changed(
+            output_file(out_dir, path), response.get_data(), old_files.get(path)
+        )
+        files[path] = digest
+        result["written" if changed else "unchanged"].append(path)
+
+    live = {article_path(slug) for slug in new_articles}
+    for path in list(files):
+        if path.startswith("/blog/") and path not in live:
+            _remove(out_dir, path)
+            del files[path]
+            result["removed"].append(path)
+
+    manifest = {"build_id": build_id, "articles": stored_articles, "files": files}
+    (out_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=1, sort_keys=True))
+    return result
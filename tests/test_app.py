@@ -6,6 +6,8 @@ zero counts), so pages must still render.
 
 import xml.dom.minidom
 
+import pytest
+
 import app as app_module
 
 
@@ -339,3 +341,1831 @@ class TestSitemapGenerators:
         with app.test_request_context("/"):
             images = generate_image_sitemap(app, articles=[])
         assert len(images) >= 2
+
+
+class _FakeConn:
+    def __init__(self):
+        self.closed = 0
+        self.rollbacks = 0
+        self.status = 0  # psycopg2 TRANSACTION_STATUS_IDLE
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = 0
+
+    def close(self):
+        self.closed = 1
+
+
+class TestConnectionPool:
+    def _pool(self, **kwargs):
+        from db_pool import ConnectionPool
+
+        opened = []
+
+        def connect():
+            conn = _FakeConn()
+            opened.append(conn)
+            return conn
+
+        kwargs.setdefault("health_check_interval", 0)
+        return ConnectionPool(connect, **kwargs), opened
+
+    def test_reuses_returned_connection_without_probe(self):
+        pool, opened = self._pool(maxconn=2)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        assert pool.getconn() is conn
+        assert len(opened) == 1
+        assert conn.rollbacks == 0
+        stats = pool.stats()
+        assert stats["checkouts"] == 2
+        assert stats["in_use"] == 1
+
+    def test_times_out_when_exhausted(self):
+        import pytest
+
+        from db_pool import PoolTimeoutError
+
+        pool, _ = self._pool(maxconn=1, timeout=0.01)
+        pool.getconn()
+        with pytest.raises(PoolTimeoutError):
+            pool.getconn()
+        assert pool.stats()["timeouts"] == 1
+
+    def test_waiter_gets_connection_returned_by_another_thread(self):
+        import threading
+
+        pool, opened = self._pool(maxconn=1, timeout=2)
+        conn = pool.getconn()
+        threading.Timer(0.05, pool.putconn, args=(conn,)).start()
+        assert pool.getconn() is conn
+        assert len(opened) == 1
+        assert pool.stats()["wait_ms_max"] > 0
+
+    def test_closed_and_dirty_connections_handled_on_return(self):
+        pool, opened = self._pool(maxconn=2)
+        broken = pool.getconn()
+        broken.closed = 2
+        pool.putconn(broken)
+        assert pool.stats()["size"] == 0
+
+        dirty = pool.getconn()
+        dirty.status = 2  # INTRANS
+        pool.putconn(dirty)
+        assert dirty.rollbacks == 1
+        assert pool.getconn() is dirty
+
+    def test_recycles_by_lifetime_and_idle_time(self):
+        import time
+
+        pool, opened = self._pool(maxconn=2, max_lifetime=0.01, max_idle=0)
+        first = pool.getconn()
+        pool.putconn(first)
+        time.sleep(0.02)
+        second = pool.getconn()
+        assert second is not first
+        assert first.closed
+        assert len(opened) == 2
+
+    def test_health_check_refills_to_minconn(self):
+        pool, opened = self._pool(minconn=1, maxconn=2)
+        pool.check_health()
+        assert pool.stats()["idle"] == 1
+        assert pool.getconn() is opened[0]
+
+
+class _FakeMigrationCursor:
+    def __init__(self, applied):
+        self.applied = applied
+        self.executed = []
+        self._row = None
+        self.rowcount = 0
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+        self._row = None
+        if sql.startswith("SELECT 1 FROM schema_migrations"):
+            self._row = (1,) if params[0] in self.applied else None
+        elif sql.startswith("INSERT INTO schema_migrations"):
+            self.applied.add(params[0])
+        elif sql.startswith("SELECT MIN("):
+            self._row = (None,)
+
+    def fetchone(self):
+        return self._row
+
+    def fetchall(self):
+        return []
+
+
+class _FakeMigrationConn:
+    def __init__(self, applied):
+        self.autocommit = True
+        self.cur = _FakeMigrationCursor(applied)
+        self.commits = 0
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+class TestMigrations:
+    def test_versions_are_contiguous(self):
+        from migrations import MIGRATIONS, latest_version
+
+        versions = [m.version for m in MIGRATIONS]
+        assert versions == list(range(1, len(versions) + 1))
+        assert latest_version() == versions[-1]
+
+    def test_schema_check_retries_after_transient_failure(self, monkeypatch):
+        monkeypatch.setattr(app_module, "_schema_checked", False)
+        versions = iter([None, app_module.latest_version()])
+        monkeypatch.setattr(app_module, "get_db", lambda: None)
+        app_module._check_schema_version()
+        assert app_module._schema_checked is False
+
+        monkeypatch.setattr(app_module, "get_db", lambda: object())
+        monkeypatch.setattr(
+            app_module, "get_schema_version", lambda conn: next(versions)
+        )
+        app_module._check_schema_version()
+        assert app_module._schema_checked is False
+        app_module._check_schema_version()
+        assert app_module._schema_checked is True
+
+    def test_steps_do_not_import_app_modules(self):
+        import ast
+        from pathlib import Path
+
+        import migrations
+
+        tree = ast.parse(Path(migrations.__file__).read_text())
+        imported = {
+            alias.name.split(".")[0]
+            for node in ast.walk(tree)
+            if isinstance(node, ast.Import)
+            for alias in node.names
+        } | {
+            node.module.split(".")[0]
+            for node in ast.walk(tree)
+            if isinstance(node, ast.ImportFrom)
+        }
+        local = {path.stem for path in Path(migrations.__file__).parent.glob("*.py")}
+        assert imported & local == set()
+
+    def test_out_of_order_registration_rejected(self):
+        import pytest
+
+        from migrations import migration
+
+        with pytest.raises(ValueError):
+            migration(1, "duplicate")(lambda cur: None)
+
+    def test_apply_skips_recorded_steps(self):
+        from migrations import apply_migrations, latest_version
+
+        conn = _FakeMigrationConn(applied={1})
+        applied = apply_migrations(conn)
+        assert applied == list(range(2, latest_version() + 1))
+        assert conn.autocommit is True
+        assert not any(
+            "CREATE TABLE IF NOT EXISTS articles" in s for s in conn.cur.executed
+        )
+
+        again = _FakeMigrationConn(applied=conn.cur.applied)
+        assert apply_migrations(again) == []
+
+
+class TestKeysetPagination:
+    def test_cursor_roundtrip_and_garbage(self):
+        from articles import decode_cursor, encode_cursor
+
+        token = encode_cursor({"d": "2024-01-02T03:04:05", "i": 7})
+        assert "=" not in token
+        assert decode_cursor(token) == {"d": "2024-01-02T03:04:05", "i": 7}
+        assert decode_cursor("not a cursor!") is None
+        assert decode_cursor(None) is None
+
+    def test_keyset_cursor_from_article(self):
+        from datetime import datetime
+
+        from articles import Article, decode_cursor
+
+        a = Article("T", "", datetime(2024, 5, 1, 12, 0), True, "t", id=42)
+        assert decode_cursor(a.keyset_cursor()) == {"d": "2024-05-01T12:00:00", "i": 42}
+        assert Article("T", "", None, True, "t").keyset_cursor() is None
+
+    def test_listing_uses_keyset_and_cached_total(self, monkeypatch):
+        from articles import Article
+
+        calls = []
+
+        def fake_after(cursor=None, per_page=6):
+            calls.append(cursor)
+            return ["a"], "next-token"
+
+        monkeypatch.setattr(Article, "get_published_articles_after", fake_after)
+        monkeypatch.setattr(Article, "get_published_count", lambda: 13)
+        monkeypatch.setattr(
+            Article,
+            "get_published_articles_paginated",
+            lambda **kw: (_ for _ in ()).throw(AssertionError("OFFSET path used")),
+        )
+        with app_module.app.app_context():
+            result = app_module.get_blog_articles(1, 6, "", cursor=None)
+        assert result == (["a"], 13, False, "next-token", None)
+        assert calls == [None]
+
+    def test_search_cursor_carries_page(self, monkeypatch):
+        from articles import Article, decode_cursor, encode_cursor
+        from search import SearchResult
+
+        class FakeSearch:
+            def search_published(self, query, page, per_page):
+                self.page = page
+                return SearchResult(articles=["x"], total=20)
+
+        fake = FakeSearch()
+        monkeypatch.setattr(app_module, "get_search_service", lambda: fake)
+        monkeypatch.setattr(
+            Article,
+            "get_published_articles_by_slugs",
+            lambda slugs: (_ for _ in ()).throw(AssertionError("second lookup")),
+        )
+        articles, total, _, next_cursor, source = app_module.get_blog_articles(
+            1, 6, "flask", cursor=encode_cursor({"p": 3})
+        )
+        assert fake.page == 3
+        assert articles == ["x"]
+        assert total == 20
+        assert decode_cursor(next_cursor) == {"p": 4}
+        assert source == "postgres"
+
+    def test_search_is_one_round_trip(self, monkeypatch):
+        from datetime import datetime
+
+        import search
+
+        row = (1, "Flask tips", "flask-tips", datetime(2024, 1, 1), True)
+        row += ("Summary", 900, 4, None, 11)
+        conn = _RecordingConn([row])
+        monkeypatch.setattr(search, "get_db", lambda: conn)
+        service = search.PostgresSearchService()
+        service._column_checked = True
+
+        result = service.search_published("flask", page=1, per_page=6)
+        assert len(conn.cur.queries) == 1
+        assert "COUNT(*) OVER ()" in conn.cur.queries[0][0]
+        assert result.total == 11
+        assert result.slugs == ["flask-tips"]
+        assert result.articles[0].get_reading_time() == 4
+
+    def test_api_articles_exposes_next_cursor(self, client):
+        payload = client.get("/api/articles?cursor=bogus").get_json()
+        assert "next_cursor" in payload
+        assert payload["has_more"] is (payload["next_cursor"] is not None)
+
+
+class _RecordingCursor:
+    def __init__(self, rows):
+        self.rows = rows
+        self.queries = []
+
+    def execute(self, sql, params=None):
+        self.queries.append((sql, params))
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchone(self):
+        return self.rows[0] if self.rows else None
+
+
+class _RecordingConn:
+    def __init__(self, rows):
+        self.cur = _RecordingCursor(rows)
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        pass
+
+
+class TestArticleListing:
+    CONTENT = (
+        '<p>Hello <b>world</b>, this is a fairly long post.</p><img src="/media/img/x">'
+        + "<p>"
+        + "word " * 400
+        + "</p>"
+    )
+
+    def _listing_for(self, content):
+        import re
+        from datetime import datetime
+
+        from articles import SUMMARY_MAX_LENGTH, ArticleListing
+
+        plain = re.sub(r"<[^>]+>", "", content)
+        return ArticleListing(
+            "T",
+            "t",
+            datetime(2024, 1, 1),
+            summary=plain[: SUMMARY_MAX_LENGTH + 1],
+            word_count=len(plain.split()),
+            first_image="/media/img/x",
+            id=1,
+        )
+
+    def test_matches_full_article_helpers(self):
+        from datetime import datetime
+
+        from articles import Article
+
+        full = Article("T", self.CONTENT, datetime(2024, 1, 1), True, "t")
+        listing = self._listing_for(self.CONTENT)
+        for length in (160, 200, 300):
+            assert listing.get_summary(length) == full.get_summary(length)
+        assert listing.get_reading_time() == full.get_reading_time()
+        assert listing.get_word_count() == full.get_word_count()
+        assert listing.get_first_image("https://x") == full.get_first_image("https://x")
+
+    def test_has_no_instance_dict(self):
+        listing = self._listing_for("<p>short</p>")
+        assert not hasattr(listing, "__dict__")
+        assert listing.get_summary(200) == "short"
+
+    def test_published_listing_never_selects_content(self, monkeypatch):
+        from datetime import datetime
+
+        import articles
+
+        row = (3, "Title", "slug", datetime(2024, 1, 1), True, "Body", 1, 1, None)
+        conn = _RecordingConn([row])
+        monkeypatch.setattr(articles, "get_db", lambda: conn)
+
+        [listing] = articles.Article.get_published_articles(limit=20)
+        sql, params = conn.cur.queries[0]
+        assert "SELECT *" not in sql
+        assert params == (20,)
+        assert isinstance(listing, articles.ArticleListing)
+        assert (listing.slug, listing.get_summary(), listing.reading_time) == (
+            "slug",
+            "Body",
+            1,
+        )
+
+
+class TestDerivedArticleFields:
+    def test_derive_fields(self):
+        from articles import derive_fields
+
+        fields = derive_fields(
+            '<p>Tom &amp; Jerry</p><p>chase</p><IMG alt="a" src="/media/img/abc">'
+        )
+        assert fields["word_count"] == 3
+        assert fields["reading_time"] == 1
+        assert fields["summary"] == "Tom &amp; Jerrychase"
+        assert fields["first_image_url"] == "/media/img/abc"
+        assert fields["body_text"] == "Tom & Jerry chase"
+
+    def test_article_reads_stored_values(self):
+        from datetime import datetime
+
+        from articles import Article
+
+        row = (1, "T", "<p>body</p>", datetime(2024, 1, 1), True, "t")
+        row += (900, 4, "Stored summary", "/media/img/x", datetime(2024, 2, 1))
+        article = Article._from_row(row)
+        assert article.date_updated == datetime(2024, 2, 1)
+        assert article.get_word_count() == 900
+        assert article.get_reading_time() == 4
+        assert article.get_summary(160) == "Stored summary"
+        assert article.get_first_image("https://x") == "https://x/media/img/x"
+
+        # Editing the body invalidates the stored values.
+        article.content = "<p>one two</p>"
+        assert article.get_word_count() == 2
+        assert article.get_first_image() is None
+
+    def test_save_article_writes_derived_columns(self, monkeypatch):
+        from datetime import datetime
+
+        import articles
+
+        conn = _RecordingConn([])
+        monkeypatch.setattr(articles, "get_db", lambda: conn)
+        article = articles.Article("T", "<p>a b c</p>", datetime(2024, 1, 1), True, "t")
+        assert articles.Article.save_article(article)
+        sql, params = conn.cur.queries[0]
+        assert "body_text" in sql
+        assert params[5:] == (3, 1, "a b c", None, "a b c")
+
+
+class TestViewBuffer:
+    def _buffer(self, ok=True, **kwargs):
+        from view_buffer import ViewBuffer
+
+        batches = []
+
+        def flush(views):
+            batches.append([v.as_row() for v in views])
+            return ok
+
+        kwargs.setdefault("flush_interval", 0)
+        return ViewBuffer(flush, **kwargs), batches
+
+    def test_dedupes_per_visitor_per_day(self):
+        buf, batches = self._buffer(max_pending=10)
+        assert buf.record("a", "1.1.1.1", "UA") is True
+        assert buf.record("a", "1.1.1.1", "UA") is False
+        assert buf.record("b", "1.1.1.1", "UA") is True
+        assert buf.pending_count() == 2
+        assert buf.pending_count("a") == 1
+        assert batches == []
+
+    def test_flushes_one_batch_at_size_threshold(self):
+        buf, batches = self._buffer(max_pending=3)
+        for ip in ("1", "2", "3"):
+            buf.record("a", ip, None, "news.ycombinator.com")
+        assert len(batches) == 1
+        assert [row[1] for row in batches[0]] == ["1", "2", "3"]
+        assert batches[0][0][3] == "news.ycombinator.com"
+        stats = buf.stats()
+        assert stats["pending"] == 0
+        assert stats["flushed"] == 3
+
+    def test_failed_flush_requeues_up_to_backlog(self):
+        buf, _ = self._buffer(ok=False, max_pending=2, max_backlog=3)
+        for ip in ("1", "2", "3", "4"):
+            buf.record("a", ip)
+        stats = buf.stats()
+        assert stats["failed_flushes"] == 3
+        assert stats["pending"] == 3
+        assert stats["dropped"] == 1
+
+    def test_close_flushes_remaining(self):
+        buf, batches = self._buffer(max_pending=100)
+        buf.record("a", "1")
+        buf.close()
+        assert len(batches) == 1
+        assert buf.pending_count() == 0
+
+    def test_redis_buffer_dedupes_and_flushes_across_instances(self):
+        from view_buffer import RedisViewBuffer
+
+        store = _FakeRedis()
+        batches = []
+
+        def flush(views):
+            batches.append([v.as_row() for v in views])
+            return True
+
+        first = RedisViewBuffer(store, flush, max_pending=3, flush_interval=0)
+        second = RedisViewBuffer(store, flush, max_pending=3, flush_interval=0)
+        assert first.record("a", "1", "UA") is True
+        assert second.record("a", "1", "UA") is False
+        assert second.record("b", "2") is True
+        assert first.pending_count() == 2
+        assert second.pending_count("a") == 1
+        assert batches == []
+
+        second.record("a", "3")
+        assert [[row[:2] for row in batch] for batch in batches] == [
+            [("a", "1"), ("b", "2"), ("a", "3")]
+        ]
+        assert first.pending_count() == 0
+        assert first.pending_count("a") == 0
+
+    def test_redis_buffer_requeues_failed_batch(self):
+        from view_buffer import RedisViewBuffer
+
+        store = _FakeRedis()
+        buf = RedisViewBuffer(store, lambda views: False, max_pending=2)
+        buf.record("a", "1")
+        buf.record("a", "2")
+        assert buf.pending_count() == 2
+        stats = buf.stats()
+        assert stats["failed_flushes"] == 1
+        assert stats["max_flush_ms"] >= stats["last_flush_ms"] >= 0
+
+    def test_redis_errors_write_through(self):
+        import redis
+
+        from view_buffer import RedisViewBuffer
+
+        class Down:
+            def set(self, *args, **kwargs):
+                raise redis.ConnectionError("down")
+
+        written = []
+        buf = RedisViewBuffer(Down(), lambda views: written.extend(views) or True)
+        assert buf.record("a", "1") is True
+        assert [v.slug for v in written] == ["a"]
+
+    def test_flush_in_request_reuses_its_connection(self, app, monkeypatch):
+        from datetime import date, datetime
+
+        from articles import Article
+        from view_buffer import PendingView
+
+        calls = []
+        monkeypatch.setattr(
+            Article, "record_views", lambda rows, conn=None: calls.append(conn) or True
+        )
+        monkeypatch.setattr(app_module, "get_db", lambda: "request-conn")
+        monkeypatch.setattr(
+            app_module, "pooled_connection", lambda: pytest.fail("borrowed a 2nd conn")
+        )
+        view = PendingView("a", "1", None, None, date(2024, 1, 1), datetime(2024, 1, 1))
+        with app.test_request_context("/blog/a"):
+            assert app_module._flush_views([view]) is True
+        assert calls == ["request-conn"]
+
+    def test_health_reports_buffer(self, client):
+        body = client.get("/health").get_json()
+        assert "pending" in body["view_buffer"]
+
+
+class _FakeRedis:
+    """The handful of Redis commands RedisViewBuffer uses."""
+
+    def __init__(self):
+        self.values = {}
+        self.lists = {}
+        self.hashes = {}
+
+    def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.values:
+            return None
+        self.values[key] = str(value).encode()
+        return True
+
+    def get(self, key):
+        return self.values.get(key)
+
+    def delete(self, key):
+        return int(self.values.pop(key, None) is not None)
+
+    def rpush(self, key, *items):
+        self.lists.setdefault(key, []).extend(
+            item if isinstance(item, bytes) else item.encode() for item in items
+        )
+        return len(self.lists[key])
+
+    def lrange(self, key, start, stop):
+        items = self.lists.get(key, [])
+        return items[start : None if stop == -1 else stop + 1]
+
+    def ltrim(self, key, start, stop):
+        self.lists[key] = self.lrange(key, start, stop)
+        return True
+
+    def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    def hincrby(self, key, field, n):
+        bucket = self.hashes.setdefault(key, {})
+        bucket[field] = bucket.get(field, 0) + n
+        return bucket[field]
+
+    def hget(self, key, field):
+        value = self.hashes.get(key, {}).get(field)
+        return None if value is None else str(value).encode()
+
+    def pipeline(self, transaction=True):
+        return _FakePipeline(self)
+
+
+class _FakePipeline:
+    def __init__(self, store):
+        self._store = store
+        self._calls = []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self._calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self._store, n)(*a, **kw) for n, a, kw in self._calls]
+
+
+class TestViewCounters:
+    def test_record_views_increments_counters_in_same_statement(self, monkeypatch):
+        import articles
+
+        calls = []
+        conn = _RecordingConn([])
+        monkeypatch.setattr(articles, "get_db", lambda: conn)
+        monkeypatch.setattr(
+            articles,
+            "execute_values",
+            lambda cur, sql, rows, **kw: calls.append((sql, rows)),
+        )
+        ua = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0)"
+        assert articles.Article.record_views([("a", "1", ua, None, None, None)])
+        [(sql, rows)] = calls
+        assert "RETURNING article_slug" in sql
+        assert "INSERT INTO article_views_daily" in sql
+        assert "INSERT INTO article_view_counts" in sql
+        assert articles.DEVICE_CLASSES[rows[0][-1]] == "Mobile"
+
+    def test_dashboard_breakdowns_read_daily_rollup(self, monkeypatch):
+        import articles
+
+        conn = _RecordingConn([(1, 5), (3, 2)])
+        monkeypatch.setattr(articles, "get_db", lambda: conn)
+        breakdown = articles.Article.get_device_breakdown(30)
+        assert {"label": "Mobile", "count": 5} in breakdown
+        assert {"label": "Bot", "count": 2} in breakdown
+        conn.cur.rows = []
+        articles.Article.get_top_referrers(30)
+        articles.Article.get_views_by_day(30)
+        for sql, _ in conn.cur.queries:
+            assert "FROM article_views_daily" in sql
+
+    def test_rebuild_views_daily_groups_stored_device_class(self):
+        from datetime import date
+
+        import articles
+
+        cur = _RecordingCursor([])
+        cur.rowcount = 4
+        assert articles.rebuild_views_daily(cur, since=date(2024, 1, 1)) == 4
+        (delete_sql, delete_params), (insert_sql, insert_params) = cur.queries
+        assert "WHERE day >= %s" in delete_sql
+        assert "GROUP BY 1, 2, 3, 4" in insert_sql
+        assert "user_agent" not in insert_sql
+        assert delete_params == insert_params == [date(2024, 1, 1)]
+
+    def test_device_classification_is_memoized(self):
+        from articles import _classify_device
+
+        _classify_device.cache_clear()
+        for _ in range(3):
+            _classify_device("Mozilla/5.0 (iPad; CPU OS 17_0)")
+        info = _classify_device.cache_info()
+        assert (info.hits, info.misses) == (2, 1)
+
+    def test_reads_use_counters_not_raw_views(self, monkeypatch):
+        import articles
+
+        conn = _RecordingConn([(42,)])
+        monkeypatch.setattr(articles, "get_db", lambda: conn)
+        assert articles.Article.get_view_count("a") == 42
+        conn.cur.rows = []
+        articles.Article.get_articles_admin()
+        articles.Article.get_top_articles_by_views()
+        assert len(conn.cur.queries) == 3
+        for sql, _ in conn.cur.queries:
+            assert "article_view_counts" in sql
+            assert "article_views " not in sql
+
+
+class TestViewPartitions:
+    def test_month_arithmetic_and_names(self):
+        from datetime import date
+
+        from view_partitions import add_months, partition_name
+
+        assert add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+        assert add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+        assert partition_name(date(2024, 3, 1)) == "article_views_y2024m03"
+
+    def test_expired_partitions_respect_retention(self):
+        from datetime import date
+
+        from view_partitions import expired_partitions
+
+        cur = _RecordingCursor(
+            [
+                ("article_views_y2024m01",),
+                ("article_views_y2024m02",),
+                ("article_views_y2024m03",),
+                ("article_views_default",),
+            ]
+        )
+        today = date(2024, 3, 15)
+        assert expired_partitions(cur, 2, today) == [
+            (date(2024, 1, 1), "article_views_y2024m01")
+        ]
+        assert expired_partitions(cur, 0, today) == []
+
+    def test_maintain_creates_ahead_and_compacts_expired(self):
+        from datetime import date
+
+        from view_partitions import maintain_partitions
+
+        conn = _PartitionConn(["article_views_y2024m01", "article_views_y2024m03"])
+        created, dropped = maintain_partitions(
+            conn, months_ahead=1, keep_months=2, today=date(2024, 3, 10)
+        )
+        assert created == ["article_views_y2024m04"]
+        assert dropped == ["article_views_y2024m01"]
+        executed = conn.cur.queries
+        assert any("DETACH PARTITION article_views_y2024m01" in q for q in executed)
+        assert not any("DETACH PARTITION article_views_default" in q for q in executed)
+        assert not any("DELETE FROM article_views " in q for q in executed)
+        assert conn.autocommit is True
+
+    def test_new_month_moves_rows_out_of_default(self):
+        from datetime import date
+
+        from view_partitions import maintain_partitions
+
+        conn = _PartitionConn(
+            ["article_views_y2024m02"], default_days=[date(2024, 3, 2)]
+        )
+        created, _ = maintain_partitions(
+            conn, months_ahead=0, keep_months=0, today=date(2024, 3, 10)
+        )
+        assert created == ["article_views_y2024m03"]
+        executed = conn.cur.queries
+        detach = executed.index(
+            "ALTER TABLE article_views DETACH PARTITION article_views_default"
+        )
+        create = next(i for i, q in enumerate(executed) if "CREATE TABLE" in q)
+        move = next(i for i, q in enumerate(executed) if "WITH moved AS" in q)
+        attach = executed.index(
+            "ALTER TABLE article_views ATTACH PARTITION article_views_default DEFAULT"
+        )
+        assert detach < create < move < attach
+
+    def test_retention_compacts_default_rows(self):
+        from datetime import date
+
+        from view_partitions import maintain_partitions
+
+        conn = _PartitionConn(
+            ["article_views_y2024m03"],
+            default_days=[date(2023, 11, 5), date(2024, 3, 1)],
+        )
+        _, dropped = maintain_partitions(
+            conn, months_ahead=0, keep_months=2, today=date(2024, 3, 10)
+        )
+        assert dropped == ["article_views_default (2023-11)"]
+        assert any(
+            q.startswith("DELETE FROM article_views_default") for q in conn.cur.queries
+        )
+
+    def test_cron_endpoint_requires_secret(self, client, monkeypatch):
+        calls = []
+        monkeypatch.setattr(
+            app_module,
+            "maintain_partitions",
+            lambda conn: calls.append(conn) or (["p"], []),
+        )
+        monkeypatch.setattr(app_module, "get_db", lambda: object())
+        monkeypatch.setattr(app_module, "_schema_checked", True)
+        monkeypatch.delenv("CRON_SECRET", raising=False)
+        assert client.get("/cron/maintain-partitions").status_code == 403
+
+        monkeypatch.setenv("CRON_SECRET", "s3cret")
+        wrong = {"Authorization": "Bearer nope"}
+        assert client.get("/cron/maintain-partitions", headers=wrong).status_code == 403
+        ok = client.get(
+            "/cron/maintain-partitions", headers={"Authorization": "Bearer s3cret"}
+        )
+        assert ok.get_json() == {"created": ["p"], "dropped": []}
+        assert len(calls) == 1
+
+
+class _PartitionCursor:
+    """Answers the catalog and DEFAULT-partition queries of view_partitions."""
+
+    def __init__(self, partitions, default_days):
+        self.partitions = partitions
+        self.default_days = default_days
+        self.queries = []
+        self.rowcount = 0
+        self._result = []
+
+    def execute(self, sql, params=None):
+        sql = " ".join(sql.split())
+        self.queries.append(sql)
+        if "FROM pg_inherits" in sql:
+            self._result = [(name,) for name in self.partitions]
+        elif sql.startswith("SELECT to_regclass"):
+            self._result = [("article_views_default",)]
+        elif "SELECT 1 FROM article_views_default" in sql:
+            since, until = params
+            self._result = (
+                [(1,)] if any(since <= day < until for day in self.default_days) else []
+            )
+        elif "date_trunc('month', view_date)" in sql:
+            (cutoff,) = params
+            self._result = sorted(
+                {(day.replace(day=1),) for day in self.default_days if day < cutoff}
+            )
+        else:
+            self._result = []
+
+    def fetchall(self):
+        return self._result
+
+    def fetchone(self):
+        return self._result[0] if self._result else None
+
+
+class _PartitionConn:
+    def __init__(self, partitions, default_days=()):
+        self.cur = _PartitionCursor(partitions, list(default_days))
+        self.autocommit = True
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class TestPageCache:
+    def _cache(self):
+        from cachelib import SimpleCache
+
+        from page_cache import TaggedCache
+
+        return TaggedCache(SimpleCache())
+
+    def test_purge_by_tag(self):
+        from page_cache import SITE_TAG
+
+        tc = self._cache()
+        tc.set("a", "article a", ("article:a", "list:blog"))
+        tc.set("b", "article b", ("article:b",))
+        assert tc.get("a", ("article:a", "list:blog")) == "article a"
+
+        tc.purge("list:blog")
+        assert tc.get("a", ("article:a", "list:blog")) is None
+        assert tc.get("b", ("article:b",)) == "article b"
+
+        tc.purge(SITE_TAG)
+        assert tc.get("b", ("article:b",)) is None
+
+    def test_evicted_tag_version_reads_as_miss(self):
+        tc = self._cache()
+        tc.set("a", "value", ("projects",))
+        tc._cache.delete("tag:projects")
+        assert tc.get("a", ("projects",)) is None
+
+    def test_query_string_pages_share_the_list_tag(self, app):
+        tc = self._cache()
+        calls = []
+
+        @tc.cached(timeout=60, tags=("list:blog",), query_string=True)
+        def view():
+            calls.append(1)
+            return f"page {len(calls)}"
+
+        for qs in ("q=flask", "q=flask", "q=redis"):
+            with app.test_request_context(f"/blog?{qs}"):
+                view()
+        assert len(calls) == 2
+
+        tc.purge("list:blog")
+        with app.test_request_context("/blog?q=flask"):
+            assert view() == "page 3"
+
+    def test_signed_in_pages_bypass_the_cache(self, client, auth_client, monkeypatch):
+        from cachelib import SimpleCache
+
+        monkeypatch.setattr(app_module.page_cache, "_cache", SimpleCache())
+        admin_link = 'href="/admin"'
+
+        assert admin_link in auth_client.get("/for-llms").get_data(as_text=True)
+        assert admin_link not in client.get("/for-llms").get_data(as_text=True)
+        # The anonymous page is now cached; the admin still gets their own.
+        assert admin_link in auth_client.get("/for-llms").get_data(as_text=True)
+
+    def test_replay_keeps_repeated_headers(self, app):
+        from flask import Response
+
+        tc = self._cache()
+
+        @tc.cached(timeout=60)
+        def view():
+            response = Response("page")
+            response.headers.add("Link", "</a.css>; rel=preload")
+            response.headers.add("Link", "</b.js>; rel=preload")
+            return response
+
+        for _ in range(2):
+            with app.test_request_context("/links"):
+                assert view().headers.getlist("Link") == [
+                    "</a.css>; rel=preload",
+                    "</b.js>; rel=preload",
+                ]
+
+    def test_clear_cache_purges_site_tag(self, auth_client, monkeypatch):
+        purged = []
+        monkeypatch.setattr(
+            app_module.page_cache, "purge", lambda *tags: purged.append(tags) or True
+        )
+        assert auth_client.get("/admin/clear-cache").status_code == 302
+        assert purged == [("site",)]
+
+    def test_l1_serves_hot_entries_and_honors_remote_purge(self, monkeypatch):
+        from cachelib import SimpleCache
+
+        from page_cache import LocalLRU, TaggedCache
+
+        shared = SimpleCache()
+        now = [100.0]
+        monkeypatch.setattr("page_cache.time.monotonic", lambda: now[0])
+        local = TaggedCache(shared, l1=LocalLRU(max_entries=2, ttl=30), tag_ttl=2)
+        remote = TaggedCache(shared)
+
+        local.set("a", "v1", ("article:a",))
+        assert local.get("a", ("article:a",)) == "v1"
+        assert local.get("a", ("article:a",)) == "v1"
+        stats = local.stats()
+        assert stats["l1"]["hits"] == 2
+        assert stats["l2"]["hits"] == 0
+
+        remote.purge("article:a")
+        # Within tag_ttl the local copy may still be served...
+        assert local.get("a", ("article:a",)) == "v1"
+        # ...after it, the new version is fetched and the entry is dropped.
+        now[0] += 3
+        assert local.get("a", ("article:a",)) is None
+        assert local.stats()["l2"]["misses"] == 1
+
+    def test_l1_evicts_least_recently_used(self):
+        from page_cache import LocalLRU
+
+        lru = LocalLRU(max_entries=2, ttl=30)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        assert lru.get("b") is None
+        assert lru.get("a") == 1
+        assert lru.stats()["evictions"] == 1
+
+    def test_stale_entry_served_while_refreshing(self, app, monkeypatch):
+        import threading
+
+        from cachelib import SimpleCache
+
+        from page_cache import TaggedCache
+
+        tc = TaggedCache(SimpleCache())
+        clock = [1000.0]
+        monkeypatch.setattr("page_cache.time.time", lambda: clock[0])
+        renders = []
+        refreshed = threading.Event()
+
+        @tc.cached(timeout=60, grace=300)
+        def view():
+            renders.append(1)
+            if len(renders) > 1:
+                refreshed.set()
+            return f"render {len(renders)}"
+
+        with app.test_request_context("/"):
+            assert view() == "render 1"
+        clock[0] += 120  # past timeout, inside grace
+        with app.test_request_context("/"):
+            assert view() == "render 1"
+        assert refreshed.wait(2)
+        with app.test_request_context("/"):
+            assert tc.get("view:/") == ("text", "render 2")
+        assert tc.stats()["stale_served"] == 1
+
+    def test_concurrent_misses_render_once(self, app):
+        import threading
+
+        from cachelib import SimpleCache
+
+        from page_cache import TaggedCache
+
+        tc = TaggedCache(SimpleCache())
+        renders = []
+        release = threading.Event()
+
+        @tc.cached(timeout=60)
+        def view():
+            renders.append(1)
+            release.wait(2)
+            return "page"
+
+        results = []
+
+        def hit():
+            with app.test_request_context("/slow"):
+                results.append(view())
+
+        threads = [threading.Thread(target=hit) for _ in range(4)]
+        for t in threads:
+            t.start()
+        release.set()
+        for t in threads:
+            t.join(5)
+        assert results == ["page"] * 4
+        assert len(renders) == 1
+
+
+class TestUnknownArticleSlugs:
+    def _boom(self, *args, **kwargs):
+        raise AssertionError("database touched")
+
+    def test_unknown_slug_404s_without_db_or_view(self, client, monkeypatch):
+        from articles import Article
+
+        monkeypatch.setattr(Article, "get_published_slugs", lambda: ["real-post"])
+        monkeypatch.setattr(Article, "get_by_slug", self._boom)
+        monkeypatch.setattr(Article, "get_view_count", self._boom)
+        recorded = []
+        monkeypatch.setattr(
+            app_module.view_buffer, "record", lambda *a, **kw: recorded.append(a)
+        )
+        assert client.get("/blog/wp-login-php").status_code == 404
+        assert recorded == []
+
+    def test_drafts_are_not_counted_as_views(self, auth_client, monkeypatch):
+        from datetime import datetime
+
+        from articles import Article
+
+        draft = Article("Draft", "<p>wip</p>", datetime(2024, 1, 1), False, "draft")
+        monkeypatch.setattr(Article, "get_published_slugs", list)
+        monkeypatch.setattr(Article, "get_by_slug", lambda slug: draft)
+        monkeypatch.setattr(Article, "get_view_count", lambda slug: 0)
+        recorded = []
+        monkeypatch.setattr(
+            app_module.view_buffer, "record", lambda *a, **kw: recorded.append(a)
+        )
+        assert auth_client.get("/blog/draft").status_code == 200
+        assert recorded == []
+
+    def test_falls_back_to_db_when_slug_set_unavailable(self, client, monkeypatch):
+        from articles import Article
+
+        lookups = []
+        monkeypatch.setattr(Article, "get_published_slugs", lambda: None)
+        monkeypatch.setattr(
+            Article, "get_by_slug", lambda slug: lookups.append(slug) or None
+        )
+        assert client.get("/blog/anything").status_code == 404
+        assert lookups == ["anything"]
+
+
+class TestConditionalGet:
+    def test_build_id_fallback_follows_source(self, tmp_path):
+        from conditional import source_fingerprint
+
+        (tmp_path / "templates").mkdir()
+        (tmp_path / "app.py").write_text("x = 1")
+        (tmp_path / "templates" / "base.html").write_text("<p>a</p>")
+        first = source_fingerprint(tmp_path)
+        assert source_fingerprint(tmp_path) == first
+        (tmp_path / "templates" / "base.html").write_text("<p>b</p>")
+        assert source_fingerprint(tmp_path) != first
+
+    def test_image_revalidation_skips_the_store(self, client, monkeypatch):
+        from images import ImageStore
+
+        monkeypatch.setattr(ImageStore, "get", lambda image_id: (b"png", "image/png"))
+        resp = client.get("/media/img/abc123")
+        assert resp.status_code == 200
+        etag = resp.headers["ETag"]
+
+        monkeypatch.setattr(ImageStore, "get", TestUnknownArticleSlugs()._boom)
+        resp = client.get("/media/img/abc123", headers={"If-None-Match": etag})
+        assert resp.status_code == 304
+        assert resp.headers["ETag"] == etag
+        assert resp.get_data() == b""
+
+    def test_feed_304_until_listing_changes(self, client, monkeypatch):
+        from datetime import datetime
+
+        from articles import Article
+
+        version = [(datetime(2024, 1, 1, 12, 0), 3)]
+        monkeypatch.setattr(Article, "get_listing_version", lambda: version[0])
+        resp = client.get("/rss.xml")
+        assert resp.status_code == 200
+        etag = resp.headers["ETag"]
+        assert resp.headers["Last-Modified"] == "Mon, 01 Jan 2024 12:00:00 GMT"
+
+        assert (
+            client.get("/rss.xml", headers={"If-None-Match": etag}).status_code == 304
+        )
+        # If-None-Match takes precedence over If-Modified-Since.
+        resp = client.get(
+            "/rss.xml",
+            headers={
+                "If-None-Match": '"other"',
+                "If-Modified-Since": "Mon, 01 Jan 2024 12:00:00 GMT",
+            },
+        )
+        assert resp.status_code == 200
+
+        version[0] = (datetime(2024, 1, 2), 4)
+        assert (
+            client.get("/rss.xml", headers={"If-None-Match": etag}).status_code == 200
+        )
+
+    def test_fallback_search_results_get_no_validators(self, client, monkeypatch):
+        from datetime import datetime
+
+        from articles import Article, ArticleListing
+        from search import SearchResult
+
+        listing = ArticleListing("Post", "post", datetime(2024, 1, 1), word_count=9)
+        source = ["memory"]
+
+        class Service:
+            def search_published(self, query, page, per_page):
+                return SearchResult([listing], 1, source=source[0])
+
+            def highlight(self, query, slugs):
+                return {}
+
+        monkeypatch.setattr(app_module, "get_search_service", Service)
+        monkeypatch.setattr(
+            Article, "get_listing_version", lambda: (datetime(2024, 1, 1), 1)
+        )
+        for path in ("/api/articles?q=post", "/blog?q=post"):
+            resp = client.get(path)
+            assert resp.status_code == 200
+            assert "ETag" not in resp.headers
+            assert "X-No-Validators" not in resp.headers
+
+        source[0] = "postgres"
+        resp = client.get("/api/articles?q=post")
+        assert "ETag" in resp.headers
+
+    def test_article_304_before_render(self, client, monkeypatch):
+        from datetime import datetime
+
+        from articles import Article
+
+        post = Article("Post", "<p>hi</p>", datetime(2024, 1, 1), True, "post")
+        post.date_updated = datetime(2024, 1, 5)
+        monkeypatch.setattr(Article, "get_published_slugs", lambda: ["post"])
+        monkeypatch.setattr(Article, "get_by_slug", lambda slug: post)
+        monkeypatch.setattr(Article, "get_view_count", lambda slug: 7)
+        monkeypatch.setattr(app_module.view_buffer, "record", lambda *a, **kw: None)
+        resp = client.get("/blog/post")
+        assert resp.status_code == 200
+        etag = resp.headers["ETag"]
+
+        monkeypatch.setattr(
+            app_module, "render_template", TestUnknownArticleSlugs()._boom
+        )
+        assert (
+            client.get("/blog/post", headers={"If-None-Match": etag}).status_code == 304
+        )
+        resp = client.get(
+            "/blog/post", headers={"If-Modified-Since": "Fri, 05 Jan 2024 00:00:00 GMT"}
+        )
+        assert resp.status_code == 304
+
+
+class TestStaticExport:
+    def _article(self, slug):
+        from datetime import datetime
+
+        from articles import Article
+
+        return Article(slug.title(), "<p>body</p>", datetime(2024, 1, 1), True, slug)
+
+    def test_incremental_export(self, monkeypatch, tmp_path):
+        from datetime import datetime
+
+        import static_export
+        from articles import Article
+
+        rendered = []
+        monkeypatch.setattr(Article, "get_published_slugs", lambda: ["a", "b"])
+        monkeypatch.setattr(
+            Article,
+            "get_by_slug",
+            lambda slug: rendered.append(slug) or self._article(slug),
+        )
+        monkeypatch.setattr(Article, "get_view_count", TestUnknownArticleSlugs()._boom)
+        monkeypatch.setattr(
+            app_module.view_buffer, "record", TestUnknownArticleSlugs()._boom
+        )
+
+        versions = {"a": datetime(2024, 1, 1), "b": datetime(2024, 1, 1)}
+        first = static_export.export_site(app_module.app, versions, tmp_path, "b1")
+        assert first["failed"] == []
+        assert sorted(rendered) == ["a", "b"]
+        page = (tmp_path / "blog" / "a" / "index.html").read_text()
+        assert 'data-view-count="a"' in page
+        assert (tmp_path / "index.html").exists()
+        assert (tmp_path / "rss.xml").exists()
+
+        # Only the edited article is re-rendered; the removed one is deleted.
+        rendered.clear()
+        versions = {"a": datetime(2024, 2, 1)}
+        second = static_export.export_site(app_module.app, versions, tmp_path, "b1")
+        assert rendered == ["a"]
+        assert second["removed"] == ["/blog/b"]
+        assert not (tmp_path / "blog" / "b").exists()
+
+        # A new deploy re-renders everything.
+        rendered.clear()
+        static_export.export_site(app_module.app, versions, tmp_path, "b2")
+        assert rendered == ["a"]
+
+    def test_view_beacon_endpoint(self, client, monkeypatch):
+        from articles import Article
+        from view_buffer import RateLimiter
+
+        recorded = []
+        monkeypatch.setattr(Article, "get_published_slugs", lambda: ["a"])
+        monkeypatch.setattr(Article, "get_view_count", lambda slug: 5)
+        monkeypatch.setattr(
+            app_module.view_buffer, "record", lambda *a, **kw: recorded.append(a[0])
+        )
+        monkeypatch.setattr(app_module, "view_beacon_limiter", RateLimiter(3))
+        assert client.get("/api/views/a").status_code == 405
+        assert client.post("/api/views/a").get_json()["views"] == 5
+        assert recorded == ["a"]
+        assert client.post("/api/views/nope").status_code == 404
+        cross = client.post("/api/views/a", headers={"Sec-Fetch-Site": "cross-site"})
+        assert cross.status_code == 403
+        assert client.post("/api/views/a").status_code == 200
+        assert client.post("/api/views/a").status_code == 429
+        assert recorded == ["a", "a"]
+
+    def test_rate_limiter_window(self, monkeypatch):
+        import view_buffer
+
+        now = [120.0]
+        monkeypatch.setattr(view_buffer.time, "time", lambda: now[0])
+        limiter = view_buffer.RateLimiter(2, window=60)
+        assert [limiter.allow("ip") for _ in range(3)] == [True, True, False]
+        assert limiter.allow("other") is True
+        now[0] = 180.0
+        assert limiter.allow("ip") is True
+
+
+class TestCompression:
+    def test_negotiate(self):
+        from compression import negotiate
+
+        assert negotiate("gzip, deflate", {"gzip": b""}) == "gzip"
+        assert negotiate("gzip;q=0, identity", {"gzip": b""}) is None
+        assert negotiate("*", {"gzip": b""}) == "gzip"
+        assert negotiate("", {"gzip": b""}) is None
+        assert negotiate("br", {"gzip": b""}) is None
+
+    def test_cached_view_serves_precompressed_variant(self, app):
+        import gzip
+
+        from cachelib import SimpleCache
+
+        from page_cache import TaggedCache
+
+        tc = TaggedCache(SimpleCache(), compress_min=100)
+        calls = []
+
+        @tc.cached(timeout=60)
+        def view():
+            calls.append(1)
+            return "<p>hello</p>" * 50
+
+        with app.test_request_context("/page"):
+            plain = view()
+        assert plain.headers["Vary"] == "Accept-Encoding"
+        assert "Content-Encoding" not in plain.headers
+
+        with app.test_request_context("/page", headers={"Accept-Encoding": "gzip"}):
+            encoded = view()
+        assert encoded.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(encoded.get_data()) == plain.get_data()
+        assert len(calls) == 1
+
+        # Small bodies stay plain strings.
+        @tc.cached(timeout=60, compress_min=10_000)
+        def small():
+            return "tiny"
+
+        with app.test_request_context("/small", headers={"Accept-Encoding": "gzip"}):
+            assert small() == "tiny"
+
+    def test_encoded_variants_get_their_own_etag(self, app):
+        from flask import Response
+
+        from conditional import add_validators, not_modified
+
+        with app.test_request_context("/"):
+            response = Response(b"x", headers={"Content-Encoding": "gzip"})
+            add_validators(response, "abc")
+            assert response.headers["ETag"] == '"abc-gzip"'
+
+        with app.test_request_context("/", headers={"If-None-Match": '"abc-gzip"'}):
+            early = not_modified("abc")
+            assert early.status_code == 304
+            assert early.headers["ETag"] == '"abc-gzip"'
+
+
+class TestEdgeCaching:
+    def test_anonymous_pages_are_edge_cacheable(self, client):
+        resp = client.get("/about")
+        assert "s-maxage=600" in resp.headers["Cache-Control"]
+        assert "stale-while-revalidate=3600" in resp.headers["Cache-Control"]
+        assert resp.headers["Surrogate-Key"] == "site"
+        assert "Cookie" not in resp.headers.get("Vary", "")
+
+        resp = client.get("/projects")
+        assert resp.headers["Surrogate-Key"] == "site projects"
+
+    def test_signed_in_pages_are_private(self, auth_client):
+        resp = auth_client.get("/about")
+        assert resp.headers["Cache-Control"] == "private, no-store"
+        assert "Cookie" in resp.headers["Vary"]
+        assert "Surrogate-Key" not in resp.headers
+
+    def test_article_keys_and_deferred_view_count(self, client, monkeypatch):
+        from datetime import datetime
+
+        from articles import Article
+
+        post = Article("Post", "<p>hi</p>", datetime(2024, 1, 1), True, "post")
+        recorded = []
+        monkeypatch.setattr(Article, "get_published_slugs", lambda: ["post"])
+        monkeypatch.setattr(Article, "get_by_slug", lambda slug: post)
+        monkeypatch.setattr(Article, "get_view_count", TestUnknownArticleSlugs()._boom)
+        monkeypatch.setattr(
+            app_module.view_buffer, "record", lambda *a, **kw: recorded.append(a[0])
+        )
+        resp = client.get("/blog/post")
+        assert resp.status_code == 200
+        assert recorded == ["post"]  # origin hits still count server-side
+        assert resp.headers["Surrogate-Key"] == "site article:post"
+        assert 'data-view-count="post"' in resp.get_data(as_text=True)
+
+    def test_local_purger_is_bounded(self):
+        from cdn import LocalPurger
+
+        purger = LocalPurger(max_entries=2)
+        for n in range(5):
+            purger.purge([f"article:{n}"])
+        assert list(purger.purged) == [("article:3",), ("article:4",)]
+
+    def test_delete_purges_cdn_keys(self, auth_client, monkeypatch):
+        from articles import Article
+        from cdn import LocalPurger
+
+        purger = LocalPurger()
+        monkeypatch.setattr(app_module, "cdn_purger", purger)
+        monkeypatch.setattr(Article, "delete_article_by_slug", lambda slug: True)
+        assert auth_client.post("/blog/gone/delete").status_code == 302
+        assert list(purger.purged) == [("article:gone", "list:blog")]
+
+
+class TestSearchCache:
+    def test_results_cached_by_normalized_query_until_purge(self, monkeypatch):
+        from cachelib import SimpleCache
+
+        import search
+        from page_cache import TaggedCache
+
+        tagged = TaggedCache(SimpleCache())
+        service = search.PostgresSearchService(
+            cache=search.SearchCache(tagged, tags=("list:blog",))
+        )
+        queries = []
+
+        def fake_query(query, page, per_page):
+            queries.append(query)
+            return search.SearchResult(total=len(queries))
+
+        monkeypatch.setattr(service, "_query", fake_query)
+        monkeypatch.setattr(service, "ensure_index", lambda: True)
+
+        assert service.search_published("Flask  Tips", 1, 6).total == 1
+        assert service.search_published(" flask tips", 1, 6).total == 1
+        assert service.search_published("flask tips", 2, 6).total == 2
+        assert service.cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 0.333}
+
+        tagged.purge("list:blog")
+        assert service.search_published("flask tips", 1, 6).total == 3
+
+    def test_degraded_results_are_not_cached(self, monkeypatch):
+        from cachelib import SimpleCache
+
+        import search
+        from page_cache import TaggedCache
+
+        service = search.PostgresSearchService(
+            cache=search.SearchCache(TaggedCache(SimpleCache()))
+        )
+        monkeypatch.setattr(service, "ensure_index", lambda: False)
+        assert service.search_published("flask", 1, 6).degraded
+        monkeypatch.setattr(service, "ensure_index", lambda: True)
+        monkeypatch.setattr(service, "_query", lambda *a: search.SearchResult(total=5))
+        assert service.search_published("flask", 1, 6).total == 5
+
+
+class TestSearchSuggest:
+    TITLES = [
+        ("flask-tips", "Flask Tips"),
+        ("scaling-flask", "Scaling Flask on Vercel"),
+        ("postgres", "Postgres full-text search"),
+    ]
+
+    def test_prefix_matches_title_and_word_starts(self):
+        from search import SuggestIndex
+
+        index = SuggestIndex(self.TITLES)
+        assert [s.slug for s in index.suggest("fla")] == ["flask-tips", "scaling-flask"]
+        assert [s.slug for s in index.suggest("  FLASK on")] == ["scaling-flask"]
+        assert [s.slug for s in index.suggest("full-t")] == ["postgres"]
+        assert index.suggest("f") == []
+        assert len(index.suggest("fla", limit=1)) == 1
+
+    def test_completes_the_last_word_from_the_lexicon(self):
+        from search import SuggestIndex
+
+        terms = [("flask", 3), ("flaky", 1), ("flat", 2), ("fl", 9), ("deploy", 2)]
+        index = SuggestIndex(self.TITLES, terms)
+        assert index.complete("fla") == ["flask", "flat", "flaky"]
+        assert index.complete("Deploy  FLAS") == ["deploy flask"]
+        assert index.complete("flask") == []
+        assert index.complete("deploy f") == []
+        assert index.complete("fla", limit=1) == ["flask"]
+
+    def test_index_is_process_local_and_follows_purges(self, monkeypatch):
+        from cachelib import SimpleCache
+
+        from articles import Article
+        from page_cache import _TAG_PREFIX, TaggedCache
+
+        loads = []
+        shared = TaggedCache(SimpleCache())
+        monkeypatch.setattr(app_module, "page_cache", shared)
+        monkeypatch.setattr(app_module, "_suggest_index", None)
+        monkeypatch.setattr(
+            Article, "get_published_titles", lambda: loads.append(1) or self.TITLES
+        )
+        monkeypatch.setattr(Article, "get_lexicon", list)
+        first = app_module.get_suggest_index()
+        assert app_module.get_suggest_index() is first
+        assert loads == [1]
+        # Only tag versions are shared, never the index itself.
+        assert all(key.startswith(_TAG_PREFIX) for key in shared._cache._cache)
+
+        shared.purge(app_module.BLOG_LIST_TAG)
+        assert app_module.get_suggest_index() is not first
+        assert loads == [1, 1]
+
+    def test_unreadable_tag_versions_fall_back_to_the_ttl(self, monkeypatch):
+        from articles import Article
+
+        loads = []
+        now = [100.0]
+        monkeypatch.setattr("app.time.monotonic", lambda: now[0])
+        monkeypatch.setattr(app_module.page_cache, "tag_versions", lambda tags: None)
+        monkeypatch.setattr(app_module, "_suggest_index", None)
+        monkeypatch.setattr(
+            Article, "get_published_titles", lambda: loads.append(1) or self.TITLES
+        )
+        monkeypatch.setattr(Article, "get_lexicon", list)
+        first = app_module.get_suggest_index()
+        assert app_module.get_suggest_index() is first
+        assert loads == [1]
+
+        now[0] += app_module.SUGGEST_INDEX_TTL
+        assert app_module.get_suggest_index() is not first
+        assert loads == [1, 1]
+
+    def test_endpoint_uses_index_not_full_text(self, client, monkeypatch):
+        from articles import Article
+
+        monkeypatch.setattr(Article, "get_published_titles", lambda: self.TITLES)
+        monkeypatch.setattr(Article, "get_lexicon", lambda: [("scaling", 1)])
+        monkeypatch.setattr(
+            app_module,
+            "get_search_service",
+            lambda: (_ for _ in ()).throw(AssertionError("full-text search")),
+        )
+        resp = client.get("/api/search/suggest?q=sca")
+        assert resp.status_code == 200
+        assert resp.get_json()["suggestions"] == [
+            {
+                "title": "Scaling Flask on Vercel",
+                "slug": "scaling-flask",
+                "url": "/blog/scaling-flask",
+            }
+        ]
+        assert resp.get_json()["completions"] == [
+            {"query": "scaling", "url": "/blog?q=scaling"}
+        ]
+        assert "s-maxage" in resp.headers["Cache-Control"]
+
+
+class TestFallbackSearch:
+    def _listing(self, slug, title, day=1):
+        from datetime import datetime
+
+        from articles import ArticleListing
+
+        return ArticleListing(title, slug, datetime(2024, 1, day), word_count=100)
+
+    def _docs(self):
+        return [
+            (self._listing("flask", "Flask tips"), "routing blueprints flask flask"),
+            (self._listing("pg", "Postgres search"), "tsvector ranking with flask"),
+            (self._listing("css", "CSS grid", 2), "layout columns"),
+        ]
+
+    def test_bm25_ranks_and_updates_incrementally(self):
+        from fallback_search import BM25Index
+
+        index = BM25Index()
+        for listing, body in self._docs():
+            index.add(listing, body)
+        page, total = index.search("flask")
+        assert total == 2
+        assert [a.slug for a in page] == ["flask", "pg"]
+        assert index.search("the", 0, 10) == ([], 0)
+
+        index.add(self._listing("css", "CSS grid and flask"), "flask flask flask")
+        assert index.search("flask")[1] == 3
+        index.remove("flask")
+        page, total = index.search("flask")
+        assert total == 2
+        assert "flask" not in [a.slug for a in page]
+        assert index.search("blueprints") == ([], 0)
+
+    def test_service_falls_back_when_postgres_fails(self, monkeypatch):
+        import search
+        from fallback_search import FallbackSearch
+
+        snapshots = []
+        fallback = FallbackSearch(
+            lambda: snapshots.append(1) or self._docs(), lambda slug: None
+        )
+        service = search.PostgresSearchService(fallback=fallback)
+        monkeypatch.setattr(service, "ensure_index", lambda: True)
+        monkeypatch.setattr(
+            service, "_query", lambda *a: search.SearchResult(degraded=True)
+        )
+
+        result = service.search_published("flask", 1, 1)
+        assert not result.degraded
+        assert result.source == "memory"
+        assert result.total == 2
+        assert result.slugs == ["flask"]
+        service.search_published("css", 1, 6)
+        assert snapshots == [1]  # built once
+
+        fallback.refresh_article("flask")  # unpublished -> removed
+        assert service.search_published("flask", 1, 6).slugs == ["pg"]
+
+    def test_failed_snapshot_is_retried_after_backoff(self):
+        from fallback_search import FallbackSearch
+
+        calls = []
+        fallback = FallbackSearch(lambda: calls.append(1), lambda slug: None)
+        assert fallback.search("x", 0, 5) is None
+        assert fallback.search("x", 0, 5) is None
+        assert calls == [1]
+
+
+class TestRelatedArticles:
+    DOCS = [
+        ("Flask caching", "redis cache flask views cache"),
+        ("Flask blueprints", "flask routing blueprints views"),
+        ("Knitting", "yarn needles wool"),
+    ]
+
+    def test_tfidf_neighbours(self):
+        from related import similarity_rows, tfidf_vectors, top_neighbours
+
+        vectors = tfidf_vectors(self.DOCS)
+        (scores,) = similarity_rows(vectors, [0])
+        assert scores[0] == pytest.approx(1.0)
+        assert top_neighbours(scores, 0, k=5) == [(1, scores[1])]
+
+    def test_vectors_keep_heaviest_terms(self):
+        import math
+
+        from related import similarity_rows, tfidf_vectors
+
+        vectors = tfidf_vectors(self.DOCS, max_terms=2)
+        assert all(len(vec) <= 2 for vec in vectors)
+        assert math.fsum(w * w for w in vectors[0].values()) == pytest.approx(1.0)
+        expected = [
+            sum(w * other.get(t, 0.0) for t, w in vectors[0].items())
+            for other in vectors
+        ]
+        assert similarity_rows(vectors, [0])[0] == pytest.approx(expected)
+
+    def test_numpy_and_pure_python_rank_alike(self, monkeypatch):
+        import related
+
+        np = pytest.importorskip("numpy")
+        docs = [
+            *self.DOCS,
+            ("Redis queues", "redis queue workers retry"),
+            ("Caching views", "cache views etag flask"),
+            ("Wool socks", "wool knitting socks yarn"),
+        ]
+        vectors = related.tfidf_vectors(docs)
+        rows = range(len(docs))
+        monkeypatch.setattr(related, "np", np)
+        fast = related.similarity_rows(vectors, rows)
+        monkeypatch.setattr(related, "np", None)
+        slow = related.similarity_rows(vectors, rows)
+
+        for i in rows:
+            assert fast[i] == pytest.approx(slow[i], abs=1e-6)
+            fast_ranked = related.top_neighbours(fast[i], i, k=3)
+            slow_ranked = related.top_neighbours(slow[i], i, k=3)
+            assert [j for j, _ in fast_ranked] == [j for j, _ in slow_ranked]
+
+    def test_plan_refresh_only_touches_affected_lists(self):
+        from related import plan_refresh
+
+        slugs = ["a", "b", "c", "d"]
+        current = {
+            "a": [("b", 0.5)],
+            "b": [("a", 0.5)],
+            "c": [("gone", 0.9)],
+            "d": [("a", 0.4), ("c", 0.3)],
+        }
+        # "b" changed and is now unrelated to everyone else.
+        affected = plan_refresh(
+            slugs, ["b"], ["gone"], current, {"b": [0.0, 1.0, 0.0, 0.0]}, k=2
+        )
+        assert affected == {"a", "c"}
+
+        # A changed article that now beats d's weakest entry joins d's list.
+        affected = plan_refresh(
+            slugs, ["b"], [], current, {"b": [0.0, 1.0, 0.0, 0.35]}, k=2
+        )
+        assert affected == {"a", "d"}
+
+    def test_article_page_renders_read_next(self, auth_client, monkeypatch):
+        from datetime import datetime
+
+        from articles import Article, ArticleListing
+
+        post = Article("Post", "<p>hi</p>", datetime(2024, 1, 1), True, "post")
+        other = ArticleListing(
+            "Other post", "other", datetime(2024, 1, 2), summary="About it"
+        )
+        monkeypatch.setattr(Article, "get_published_slugs", lambda: ["post"])
+        monkeypatch.setattr(Article, "get_by_slug", lambda slug: post)
+        monkeypatch.setattr(Article, "get_view_count", lambda slug: 0)
+        monkeypatch.setattr(Article, "get_related", lambda slug: [other])
+        monkeypatch.setattr(app_module.view_buffer, "record", lambda *a, **kw: None)
+        body = auth_client.get("/blog/post").get_data(as_text=True)
+        assert "Read next" in body
+        assert 'href="/blog/other"' in body
+
+
+class TestSearchSnippets:
+    def test_render_snippet_escapes_and_marks(self):
+        from search import render_snippet
+
+        html = render_snippet("use <b>\x01flask\x02</b> & friends")
+        assert html == "use &lt;b&gt;<mark>flask</mark>&lt;/b&gt; &amp; friends"
+        assert render_snippet("stray \x01marker") == "stray marker"
+
+    def test_only_uncached_slugs_hit_ts_headline(self, monkeypatch):
+        from cachelib import SimpleCache
+
+        import search
+        from page_cache import TaggedCache
+        from search import render_snippet
+
+        conn = _RecordingConn([("b", "about \x01flask\x02")])
+        monkeypatch.setattr(search, "get_db", lambda: conn)
+        service = search.PostgresSearchService(
+            cache=search.SearchCache(TaggedCache(SimpleCache())), snippet_chars=500
+        )
+        service.cache.set_snippet("Flask", "a", render_snippet("cached \x01flask\x02"))
+
+        snippets = service.highlight(" flask", ["a", "b"])
+        assert snippets == {
+            "a": "cached <mark>flask</mark>",
+            "b": "about <mark>flask</mark>",
+        }
+        ((sql, params),) = conn.cur.queries
+        assert "ts_headline('english', left(body_text, %s)" in sql
+        assert params[0] == 500 and params[3] == ["b"]
+
+        conn.cur.queries.clear()
+        assert service.highlight("FLASK", ["b"]) == {"b": "about <mark>flask</mark>"}
+        assert conn.cur.queries == []
+
+    def test_highlight_runs_under_statement_timeout(self, monkeypatch):
+        import search
+
+        conn = _RecordingConn([("b", "about \x01flask\x02")])
+        monkeypatch.setattr(search, "get_db", lambda: conn)
+        service = search.PostgresSearchService(timeout_ms=250)
+        assert service.highlight("flask", ["b"]) == {"b": "about <mark>flask</mark>"}
+        executed = [sql.strip() for sql, _ in conn.cur.queries]
+        assert executed[:2] == ["BEGIN", "SET LOCAL statement_timeout = %s"]
+        assert conn.cur.queries[1][1] == (250,)
+        assert executed[-1] == "COMMIT"
+
+    def test_fallback_results_are_not_highlighted(self, client, monkeypatch):
+        from datetime import datetime
+
+        from articles import ArticleListing
+        from search import SearchResult
+
+        listing = ArticleListing("Flask", "flask", datetime(2024, 1, 1))
+
+        class FakeSearch:
+            def search_published(self, query, page, per_page):
+                return SearchResult(articles=[listing], total=1, source="memory")
+
+            def highlight(self, query, slugs):
+                raise AssertionError("ts_headline after a fallback")
+
+        monkeypatch.setattr(app_module, "get_search_service", lambda: FakeSearch())
+        payload = client.get("/api/articles?q=flask").get_json()
+        assert payload["articles"][0]["snippet"] is None
+
+    def test_api_articles_returns_snippets(self, client, monkeypatch):
+        from datetime import datetime
+
+        from articles import ArticleListing
+        from search import SearchResult
+
+        listing = ArticleListing("Flask", "flask", datetime(2024, 1, 1))
+
+        class FakeSearch:
+            def search_published(self, query, page, per_page):
+                return SearchResult(articles=[listing], total=1)
+
+            def highlight(self, query, slugs):
+                return {"flask": "<mark>flask</mark> tips"}
+
+        monkeypatch.setattr(app_module, "get_search_service", lambda: FakeSearch())
+        payload = client.get("/api/articles?q=flask").get_json()
+        assert payload["articles"][0]["snippet"] == "<mark>flask</mark> tips"
+
+
+class TestSpellingSuggestions:
+    def test_lookup_finds_single_edits_and_prefers_common_words(self):
+        from spelling import SpellingIndex
+
+        index = SpellingIndex()
+        for word, freq in [("flask", 9), ("flasks", 1), ("python", 4), ("form", 2)]:
+            index.add(word, freq)
+        assert index.lookup("flsak", 1)[0][2] == "flask"  # swapped letters
+        assert index.lookup("pyton", 1)[0][2] == "python"
+        assert index.lookup("flaskk", 1)[0] == (1, -9, "flask")
+        assert index.lookup("pythno", 2)[0][2] == "python"
+        assert index.lookup("zzzz", 1) == []
+
+    def test_lexicon_corrects_unknown_words_and_learns_new_articles(self):
+        from spelling import Lexicon
+
+        loads = []
+        lexicon = Lexicon(
+            lambda: loads.append(1) or [("postgres", 3), ("search", 5)],
+            lambda slug: ["indexing", "search"],
+        )
+        assert lexicon.correct("postgers search") == "postgres search"
+        assert lexicon.correct("search") is None
+        assert lexicon.correct("indexng") is None
+
+        lexicon.add_article("new-post")
+        assert lexicon.correct("indexng") == "indexing"
+        assert loads == [1]
+
+    def test_failed_load_gives_no_suggestion(self):
+        from spelling import Lexicon
+
+        lexicon = Lexicon(lambda: None, lambda slug: [])
+        assert lexicon.correct("pyton") is None
+
+    def test_zero_results_render_did_you_mean(self, client, monkeypatch):
+        from search import SearchResult
+
+        class FakeSearch:
+            def search_published(self, query, page, per_page):
+                return SearchResult()
+
+            def did_you_mean(self, query):
+                return "python"
+
+        monkeypatch.setattr(app_module, "get_search_service", lambda: FakeSearch())
+        html = client.get("/blog?q=pyton").get_data(as_text=True)
+        assert "Did you mean" in html and "/blog?q=python" in html
+        payload = client.get("/api/articles?q=pyton").get_json()
+        assert payload["did_you_mean"] == "python"
@@ -0,0 +1,411 @@
+"""Write-behind buffers for article view tracking.
+
+Article pages used to INSERT into article_views (and commit) on every request.
+Views are now deduplicated per (slug, ip, day) and written as one multi-row
+INSERT when the batch reaches `max_pending` views or the oldest queued view is
+`flush_interval` seconds old (0 disables the time threshold).
+
+RedisViewBuffer keeps the queue in Redis, so it survives serverless instances
+being frozen or killed, and any instance's next request flushes it.
+ViewBuffer keeps it in process memory, with a daemon thread for the time
+threshold and an atexit hook on shutdown; views queued in an instance that is
+killed without running atexit are lost, so without Redis the app writes every
+view through (max_pending=1) unless VIEW_BUFFER_MAX_PENDING says otherwise.
+"""
+
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from datetime import UTC, date, datetime
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# The dedupe set only saves round trips (the table's UNIQUE constraint is the
+# real guard), so it is simply reset once it grows past this many keys.
+_MAX_SEEN = 100_000
+
+
+@dataclass(frozen=True, slots=True)
+class PendingView:
+    slug: str
+    ip_address: str
+    user_agent: str | None
+    referrer_host: str | None
+    view_date: object  # datetime.date
+    viewed_at: datetime  # naive UTC, matching the TIMESTAMP column
+
+    def as_row(self):
+        return (
+            self.slug,
+            self.ip_address,
+            self.user_agent,
+            self.referrer_host,
+            self.view_date,
+            self.viewed_at,
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(
+            [
+                self.slug,
+                self.ip_address,
+                self.user_agent,
+                self.referrer_host,
+                self.view_date.isoformat(),
+                self.viewed_at.isoformat(),
+            ]
+        )
+
+    @classmethod
+    def from_json(cls, data):
+        slug, ip, user_agent, referrer_host, view_date, viewed_at = json.loads(data)
+        return cls(
+            slug,
+            ip,
+            user_agent,
+            referrer_host,
+            date.fromisoformat(view_date),
+            datetime.fromisoformat(viewed_at),
+        )
+
+
+class ViewBuffer:
+    """Thread-safe queue of views, flushed in batches through `flush_fn`.
+
+    `flush_fn(views)` receives a list of PendingView and must return True once
+    they are durably written; on False or an exception the batch is re-queued
+    (up to `max_backlog` views, after which the oldest are dropped).
+    """
+
+    def __init__(self, flush_fn, max_pending=20, flush_interval=5.0, max_backlog=5000):
+        self._flush_fn = flush_fn
+        self.max_pending = max(1, max_pending)
+        self.flush_interval = flush_interval
+        self.max_backlog = max(self.max_pending, max_backlog)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._oldest = None
+        self._seen = set()
+        self._seen_day = None
+        self._stop = threading.Event()
+        self._timer = None
+
+        self._recorded = 0
+        self._duplicates = 0
+        self._flushed = 0
+        self._failed_flushes = 0
+        self._dropped = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    def record(self, slug, ip_address, user_agent=None, referrer_host=None):
+        """Queue a view; returns False if it was already seen today."""
+        now = datetime.now(UTC).replace(tzinfo=None)
+        day = now.date()
+        key = (slug, ip_address, day)
+        with self._lock:
+            if day != self._seen_day or len(self._seen) >= _MAX_SEEN:
+                self._seen = set()
+                self._seen_day = day
+            if key in self._seen:
+                self._duplicates += 1
+                return False
+            self._seen.add(key)
+            self._pending.append(
+                PendingView(slug, ip_address, user_agent, referrer_host, day, now)
+            )
+            self._recorded += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            due = len(self._pending) >= self.max_pending or self._overdue()
+        self._ensure_timer()
+        if due:
+            self.flush()
+        return True
+
+    def _overdue(self):
+        # Caller holds self._lock.
+        return bool(
+            self.flush_interval
+            and self._oldest is not None
+            and time.monotonic() - self._oldest >= self.flush_interval
+        )
+
+    def _ensure_timer(self):
+        if self._timer is None and self.flush_interval and not self._stop.is_set():
+            with self._lock:
+                if self._timer is not None:
+                    return
+                self._timer = threading.Thread(
+                    target=self._timer_loop, name="view-buffer-flush", daemon=True
+                )
+            self._timer.start()
+
+    def _timer_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            with self._lock:
+                due = self._overdue()
+            if due:
+                self.flush()
+
+    def flush(self) -> int:
+        """Write everything queued so far; returns the number of views written."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                self._pending = []
+                self._oldest = None
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            try:
+                ok = self._flush_fn(batch)
+            except Exception as exc:
+                logger.warning("View buffer flush raised: %s", exc)
+                ok = False
+            elapsed_ms = (time.monotonic() - started) * 1000
+
+            with self._lock:
+                self._last_flush_ms = elapsed_ms
+                self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+                if ok:
+                    self._flushed += len(batch)
+                    return len(batch)
+                self._failed_flushes += 1
+                requeued = batch + self._pending
+                overflow = len(requeued) - self.max_backlog
+                if overflow > 0:
+                    self._dropped += overflow
+                    requeued = requeued[overflow:]
+                    logger.warning("View buffer full; dropped %d view(s)", overflow)
+                self._pending = requeued
+                self._oldest = time.monotonic()
+            return 0
+
+    def pending_count(self, slug=None) -> int:
+        with self._lock:
+            if slug is None:
+                return len(self._pending)
+            return sum(1 for view in self._pending if view.slug == slug)
+
+    def close(self):
+        """Stop the timer thread and flush what is left (used at exit)."""
+        self._stop.set()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "pending": len(self._pending),
+                "recorded": self._recorded,
+                "duplicates_skipped": self._duplicates,
+                "flushed": self._flushed,
+                "failed_flushes": self._failed_flushes,
+                "dropped": self._dropped,
+                "last_flush_ms": round(self._last_flush_ms, 3),
+                "max_flush_ms": round(self._max_flush_ms, 3),
+                "max_pending": self.max_pending,
+                "flush_interval_s": self.flush_interval,
+            }
+
+
+class RedisViewBuffer:
+    """ViewBuffer with the queue, the dedupe keys and the per-slug pending
+    counts in Redis, shared by every instance.
+
+    Batches are taken off the queue atomically (LRANGE + LTRIM in one
+    transaction), so concurrent flushers never write the same view twice; a
+    failed batch is pushed back. If Redis itself errors, the view is written
+    through with `flush_fn` instead of being lost.
+    """
+
+    QUEUE_KEY = "views:pending"
+    COUNTS_KEY = "views:pending_by_slug"
+    OLDEST_KEY = "views:oldest"
+    _SEEN_TTL = 2 * 86400
+    _BATCH = 500
+
+    def __init__(self, client, flush_fn, max_pending=20, flush_interval=5.0):
+        self._client = client
+        self._flush_fn = flush_fn
+        self.max_pending = max(1, max_pending)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._recorded = 0
+        self._duplicates = 0
+        self._flushed = 0
+        self._failed_flushes = 0
+        self._redis_errors = 0
+        self._last_flush_ms = 0.0
+        self._max_flush_ms = 0.0
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def record(self, slug, ip_address, user_agent=None, referrer_host=None):
+        """Queue a view; returns False if it was already seen today."""
+        now = datetime.now(UTC).replace(tzinfo=None)
+        view = PendingView(slug, ip_address, user_agent, referrer_host, now.date(), now)
+        try:
+            seen_key = f"views:seen:{view.view_date.isoformat()}:{slug}:{ip_address}"
+            if not self._client.set(seen_key, 1, nx=True, ex=self._SEEN_TTL):
+                self._count("_duplicates")
+                return False
+            pipe = self._client.pipeline()
+            pipe.rpush(self.QUEUE_KEY, view.to_json())
+            pipe.hincrby(self.COUNTS_KEY, slug, 1)
+            pipe.set(self.OLDEST_KEY, time.time(), nx=True)
+            pipe.get(self.OLDEST_KEY)
+            length, _, _, oldest = pipe.execute()
+        except redis.RedisError as exc:
+            logger.warning("View queue unavailable, writing through: %s", exc)
+            self._count("_redis_errors")
+            self._count("_recorded")
+            self._write([view])
+            return True
+        self._count("_recorded")
+        overdue = bool(
+            self.flush_interval
+            and oldest is not None
+            and time.time() - float(oldest) >= self.flush_interval
+        )
+        if length >= self.max_pending or overdue:
+            self.flush()
+        return True
+
+    def _write(self, views) -> bool:
+        started = time.monotonic()
+        try:
+            ok = self._flush_fn(views)
+        except Exception as exc:
+            logger.warning("View buffer flush raised: %s", exc)
+            ok = False
+        elapsed_ms = (time.monotonic() - started) * 1000
+        with self._lock:
+            self._last_flush_ms = elapsed_ms
+            self._max_flush_ms = max(self._max_flush_ms, elapsed_ms)
+            if ok:
+                self._flushed += len(views)
+            else:
+                self._failed_flushes += 1
+        return ok
+
+    def _take(self):
+        pipe = self._client.pipeline(transaction=True)
+        pipe.lrange(self.QUEUE_KEY, 0, self._BATCH - 1)
+        pipe.ltrim(self.QUEUE_KEY, self._BATCH, -1)
+        pipe.delete(self.OLDEST_KEY)
+        raw, _, _ = pipe.execute()
+        return raw
+
+    def flush(self) -> int:
+        """Write everything queued so far; returns the number of views written."""
+        written = 0
+        while True:
+            try:
+                raw = self._take()
+            except redis.RedisError as exc:
+                logger.warning("View queue flush failed: %s", exc)
+                self._count("_redis_errors")
+                return written
+            if not raw:
+                return written
+            views = [PendingView.from_json(item) for item in raw]
+            try:
+                if not self._write(views):
+                    pipe = self._client.pipeline()
+                    pipe.rpush(self.QUEUE_KEY, *raw)
+                    pipe.set(self.OLDEST_KEY, time.time(), nx=True)
+                    pipe.execute()
+                    return written
+                pipe = self._client.pipeline()
+                by_slug = {}
+                for view in views:
+                    by_slug[view.slug] = by_slug.get(view.slug, 0) + 1
+                for slug, n in by_slug.items():
+                    pipe.hincrby(self.COUNTS_KEY, slug, -n)
+                pipe.execute()
+            except redis.RedisError as exc:
+                logger.warning("View queue bookkeeping failed: %s", exc)
+                self._count("_redis_errors")
+                return written
+            written += len(views)
+            if len(raw) < self._BATCH:
+                return written
+
+    def pending_count(self, slug=None) -> int:
+        try:
+            if slug is None:
+                return int(self._client.llen(self.QUEUE_KEY))
+            return max(0, int(self._client.hget(self.COUNTS_KEY, slug) or 0))
+        except redis.RedisError:
+            return 0
+
+    def close(self):
+        """Flush what is queued (nothing is lost if this never runs)."""
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "backend": "redis",
+                "recorded": self._recorded,
+                "duplicates_skipped": self._duplicates,
+                "flushed": self._flushed,
+                "failed_flushes": self._failed_flushes,
+                "redis_errors": self._redis_errors,
+                "last_flush_ms": round(self._last_flush_ms, 3),
+                "max_flush_ms": round(self._max_flush_ms, 3),
+                "max_pending": self.max_pending,
+                "flush_interval_s": self.flush_interval,
+            }
+        stats["pending"] = self.pending_count()
+        return stats
+
+
+class RateLimiter:
+    """Fixed-window request limit per key (e.g. client IP).
+
+    Counts live in Redis when a client is given, so the limit holds across
+    instances, and in process memory otherwise. A Redis error allows the
+    request rather than failing it.
+    """
+
+    def __init__(self, limit, window=60, client=None, prefix="ratelimit"):
+        self.limit = limit
+        self.window = window
+        self._client = client
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._window_start = None
+
+    def allow(self, key) -> bool:
+        bucket = int(time.time() // self.window)
+        if self._client is not None:
+            name = f"{self._prefix}:{bucket}:{key}"
+            try:
+                pipe = self._client.pipeline()
+                pipe.incr(name)
+                pipe.expire(name, self.window)
+                count, _ = pipe.execute()
+            except redis.RedisError as exc:
+                logger.warning("Rate limiter unavailable: %s", exc)
+                return True
+            return count <= self.limit
+        with self._lock:
+            if bucket != self._window_start:
+                self._counts = {}
+                self._window_start = bucket
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+        return count <= self.limit
@@ -0,0 +1,260 @@
+"""Monthly partitions of article_views, and raw-view retention.
+
+article_views is partitioned by RANGE (view_date), one partition per month
+named article_views_yYYYYmMM, plus a DEFAULT partition so a view is never
+rejected when maintenance falls behind. `flask maintain-partitions` (or the
+daily /cron/maintain-partitions job) creates upcoming months and applies the
+retention policy: months older than VIEW_RETENTION_MONTHS are folded into
+article_views_daily (which, together with article_view_counts, is all the
+site reads) and dropped whole, instead of DELETEing rows.
+
+A month created after views for it already landed in DEFAULT is created with
+DEFAULT detached, and those rows are moved into it before DEFAULT is
+re-attached. Rows left in DEFAULT past retention are compacted and deleted.
+"""
+
+import logging
+import os
+import re
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+PARENT = "article_views"
+DEFAULT_PARTITION = "article_views_default"
+_NAME_RE = re.compile(r"^article_views_y(\d{4})m(\d{2})$")
+
+
+def retention_months() -> int:
+    """Whole months of raw views to keep, counting the current one (0 = keep
+    everything)."""
+    return int(os.getenv("VIEW_RETENTION_MONTHS", "13"))
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{PARENT}_y{month.year:04d}m{month.month:02d}"
+
+
+def existing_partitions(cur) -> dict[date, str]:
+    """Monthly partitions attached to article_views, keyed by first day."""
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = %s
+        """,
+        (PARENT,),
+    )
+    months = {}
+    for (name,) in cur.fetchall():
+        match = _NAME_RE.match(name)
+        if match:
+            months[date(int(match[1]), int(match[2]), 1)] = name
+    return months
+
+
+def _default_rows_in(cur, since: date, until: date) -> bool:
+    """Whether the DEFAULT partition holds views in [since, until)."""
+    cur.execute("SELECT to_regclass(%s)", (DEFAULT_PARTITION,))
+    row = cur.fetchone()
+    if row is None or row[0] is None:
+        return False
+    cur.execute(
+        f"""
+        SELECT 1 FROM {DEFAULT_PARTITION}
+        WHERE view_date >= %s AND view_date < %s
+        LIMIT 1
+        """,  # noqa: S608 — fixed table name, values bound
+        (since, until),
+    )
+    return cur.fetchone() is not None
+
+
+def create_partition(cur, month: date) -> str:
+    """Create one monthly partition, moving any views for that month out of
+    DEFAULT (Postgres refuses the new partition while DEFAULT holds them).
+    Must run inside a transaction."""
+    name = partition_name(month)
+    until = add_months(month, 1)
+    moving = _default_rows_in(cur, month, until)
+    if moving:
+        cur.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {DEFAULT_PARTITION}")
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {name}
+        PARTITION OF {PARENT}
+        FOR VALUES FROM (%s) TO (%s)
+        """,  # noqa: S608 — name built from a date, values bound
+        (month, until),
+    )
+    if moving:
+        cur.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE view_date >= %s AND view_date < %s
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,  # noqa: S608 — names built from fixed strings and a date, values bound
+            (month, until),
+        )
+        logger.info(
+            "Moved %d view(s) from %s into %s", cur.rowcount, DEFAULT_PARTITION, name
+        )
+        cur.execute(
+            f"ALTER TABLE {PARENT} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"
+        )
+    return name
+
+
+def ensure_partitions(cur, first: date, months_ahead=3, today=None) -> list[str]:
+    """Create monthly partitions from `first` through `months_ahead` months
+    after the current one; returns the names created."""
+    current = month_start(today or date.today())
+    have = existing_partitions(cur)
+    created = []
+    month = month_start(first)
+    while month <= add_months(current, months_ahead):
+        if month not in have:
+            created.append(create_partition(cur, month))
+        month = add_months(month, 1)
+    return created
+
+
+def expired_partitions(cur, keep_months, today=None) -> list[tuple[date, str]]:
+    """Monthly partitions that end before the retention window, oldest first."""
+    if keep_months <= 0:
+        return []
+    cutoff = add_months(month_start(today or date.today()), -(keep_months - 1))
+    return sorted(
+        (month, name)
+        for month, name in existing_partitions(cur).items()
+        if month < cutoff
+    )
+
+
+def compact_partition(cur, month: date, name: str) -> int:
+    """Fold one month of raw views into article_views_daily, then drop it.
+
+    Returns the number of rollup rows written for that month.
+    """
+    from articles import rebuild_views_daily
+
+    rows = rebuild_views_daily(cur, since=month, until=add_months(month, 1))
+    cur.execute(f"ALTER TABLE {PARENT} DETACH PARTITION {name}")
+    cur.execute(f"DROP TABLE {name}")
+    logger.info("Compacted and dropped %s (%d rollup rows)", name, rows)
+    return rows
+
+
+def expired_default_months(cur, keep_months, today=None) -> list[date]:
+    """Months before the retention window that still have rows in DEFAULT."""
+    if keep_months <= 0:
+        return []
+    cur.execute("SELECT to_regclass(%s)", (DEFAULT_PARTITION,))
+    row = cur.fetchone()
+    if row is None or row[0] is None:
+        return []
+    cutoff = add_months(month_start(today or date.today()), -(keep_months - 1))
+    cur.execute(
+        f"""
+        SELECT DISTINCT date_trunc('month', view_date)::date
+        FROM {DEFAULT_PARTITION}
+        WHERE view_date < %s
+        ORDER BY 1
+        """,  # noqa: S608 — fixed table name, values bound
+        (cutoff,),
+    )
+    return [row[0] for row in cur.fetchall()]
+
+
+def compact_default_month(cur, month: date) -> int:
+    """Fold one month of views stranded in DEFAULT into article_views_daily,
+    then delete them. Returns the number of rollup rows written."""
+    from articles import rebuild_views_daily
+
+    until = add_months(month, 1)
+    rows = rebuild_views_daily(cur, since=month, until=until)
+    cur.execute(
+        f"DELETE FROM {DEFAULT_PARTITION} WHERE view_date >= %s AND view_date < %s",  # noqa: S608 — fixed table name, values bound
+        (month, until),
+    )
+    logger.info(
+        "Compacted %s rows of %s (%d rollup rows)",
+        DEFAULT_PARTITION,
+        f"{month:%Y-%m}",
+        rows,
+    )
+    return rows
+
+
+def _default_label(month: date) -> str:
+    return f"{DEFAULT_PARTITION} ({month:%Y-%m})"
+
+
+def maintain_partitions(
+    conn, months_ahead=3, keep_months=None, dry_run=False, today=None
+):
+    """Create upcoming partitions and compact expired ones.
+
+    Each compaction commits on its own, so an interrupted run keeps the
+    months it already finished. Returns (created, dropped) partition names;
+    months compacted out of DEFAULT are listed as "article_views_default
+    (YYYY-MM)".
+    """
+    today = today or date.today()
+    keep = retention_months() if keep_months is None else keep_months
+    was_autocommit = conn.autocommit
+    conn.autocommit = False
+    try:
+        cur = conn.cursor()
+        if dry_run:
+            have = existing_partitions(cur)
+            wanted = [
+                add_months(month_start(today), n) for n in range(months_ahead + 1)
+            ]
+            created = [partition_name(m) for m in wanted if m not in have]
+            dropped = [name for _, name in expired_partitions(cur, keep, today)]
+            dropped += [
+                _default_label(month)
+                for month in expired_default_months(cur, keep, today)
+            ]
+            conn.rollback()
+            return created, dropped
+
+        created = ensure_partitions(cur, today, months_ahead, today=today)
+        conn.commit()
+        dropped = []
+        for month, name in expired_partitions(cur, keep, today):
+            try:
+                compact_partition(cur, month, name)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error("Failed to compact partition %s", name)
+                raise
+            dropped.append(name)
+        for month in expired_default_months(cur, keep, today):
+            try:
+                compact_default_month(cur, month)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error("Failed to compact %s", _default_label(month))
+                raise
+            dropped.append(_default_label(month))
+        return created, dropped
+    finally:
+        conn.autocommit = was_autocommit